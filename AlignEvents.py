@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to join slow control readings to event times                        #
+# Reads event times (text, first column, or .npy) in chunks and writes one     #
+# line per event: 'time' followed by the HV and actuator columns at that time, #
+# interpolated or last known. Readings come from binary stores (see            #
+# GEMSlowControlStorage, ImportText for text logs) or packed ones (see         #
+# GEMSlowControlRecorder).                                                     #
+#                                                                              #
+#   ./AlignEvents.py events.txt --hv hv.gsc --motor motor.gsc -k cal.txt       #
+################################################################################
+
+
+from GEMSlowControlAlign import Aligner, ReadEvents
+from GEMSlowControlRecorder import OpenStore
+import argparse
+import numpy
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Join slow control readings to event times.');
+	parser.add_argument('events', help='event times, text with the time in the first column or .npy');
+	parser.add_argument('--hv', default='', help='binary or packed store of HV readings');
+	parser.add_argument('--motor', default='', help='binary or packed store of actuator positions');
+	parser.add_argument('-m', '--mode', choices=['interp', 'last'], default='interp', help='interpolate or take the last reading');
+	parser.add_argument('-g', '--max-gap', type=float, default=None, help='NaN where readings are further apart than this, in s');
+	parser.add_argument('-t', '--offset', type=float, default=0.0, help='added to event times to match the slow control clock, in s');
+	parser.add_argument('-k', '--calibration', default='', help='step/mm calibration file for the position');
+	parser.add_argument('-d', '--degree', type=int, default=0, help='polynomial degree of the calibration, 0 for piecewise linear');
+	parser.add_argument('-n', '--chunk', type=int, default=1000000, help='events per chunk');
+	parser.add_argument('-o', '--output', default='', help='output file, stdout if not given');
+	args = parser.parse_args();
+
+	aligners = [];
+	if args.hv != '':
+		aligners.append(Aligner(OpenStore(args.hv), None, args.mode, args.max_gap, args.offset));
+	if args.motor != '':
+		calibration = None;
+		if args.calibration != '':
+			from GEMSlowControlCalibration import LoadCalibration
+			calibration = LoadCalibration(args.calibration, args.degree);
+		aligners.append(Aligner(OpenStore(args.motor), None, args.mode, args.max_gap, args.offset, calibration));
+	if len(aligners) == 0:
+		print(' Nothing to join, give --hv and/or --motor.');
+		sys.exit(1);
+
+	output = open(args.output, 'w') if args.output != '' else sys.stdout;
+	fields = [field for aligner in aligners for field in aligner.GetFields()];
+	output.write('# time %s\n' % ' '.join(fields));
+	formats = ['%.6f'] + ['%.6g'] * len(fields);
+	for events in ReadEvents(args.events, args.chunk):
+		columns = [column for aligner in aligners for column in aligner.Align(events)];
+		numpy.savetxt(output, numpy.column_stack([events] + columns), fmt=formats);
+	if output is not sys.stdout:
+		output.close();
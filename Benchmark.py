@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Benchmark of GEM slow control classes on simulated devices                 #
+# Reports per-command latency, status refresh time, polling throughput and     #
+# move completion time, so changes of the drivers can be compared in numbers.  #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl, MotorControl
+from GEMSlowControlManager import HVManager
+from GEMSlowControlSimulation import SimulatedHeinzinger, SimulatedJrk
+from GEMSlowControlStats import CommandStats
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+################################################################################
+#   Time a call n times                                                        #
+################################################################################
+#   Returns the durations in s. prepare() is called before each call,
+# outside the timing, e.g. to empty a cache.
+def Measure(func, n, prepare = None):
+	durations = [];
+	for i in range(n):
+		if prepare is not None:
+			prepare();
+		start = time.perf_counter();
+		func();
+		durations.append(time.perf_counter() - start);
+	return durations;
+
+
+################################################################################
+#   Print summary of durations                                                 #
+################################################################################
+def Report(name, durations):
+	durations = sorted(durations);
+	n = len(durations);
+	print(' %-28s n=%5d  mean %8.2f ms  p50 %8.2f ms  p95 %8.2f ms  max %8.2f ms'
+	      % (name, n, 1e3 * sum(durations) / n, 1e3 * durations[n // 2],
+	         1e3 * durations[min(n - 1, int(0.95 * n))], 1e3 * durations[-1]));
+
+
+################################################################################
+#   Count calls in a given time                                                #
+################################################################################
+def Throughput(name, func, duration):
+	count = 0;
+	start = time.perf_counter();
+	while time.perf_counter() - start < duration:
+		func();
+		count += 1;
+	print(' %-28s %8.2f /s' % (name, count / (time.perf_counter() - start)));
+
+
+################################################################################
+#   Time a command line from start to exit                                     #
+################################################################################
+def Startup(name, command, n):
+	durations = [];
+	for i in range(n):
+		start = time.perf_counter();
+		done = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL);
+		durations.append(time.perf_counter() - start);
+		if done.returncode != 0:
+			print(' %-28s failed with %d' % (name, done.returncode));
+			return;
+	Report(name, durations);
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Benchmark drivers on simulated devices.');
+	parser.add_argument('-n', '--repeat', type=int, default=50, help='calls per latency test');
+	parser.add_argument('-d', '--delay', type=float, default=0.005, help='response delay of the devices in s');
+	parser.add_argument('-r', '--rate', type=int, default=9600, help='simulated baud rate, 0 for none');
+	parser.add_argument('-s', '--supplies', type=int, default=4, help='supplies polled at once');
+	parser.add_argument('-t', '--time', type=float, default=3.0, help='seconds per throughput test');
+	parser.add_argument('--stats', action='store_true', help='run with instrumentation and print its dump');
+	parser.add_argument('--startup', type=int, default=5, help='runs per one-shot script startup test, 0 for none');
+	args = parser.parse_args();
+
+	supplies = [];
+	for i in range(max(1, args.supplies)):
+		device = SimulatedHeinzinger();
+		device.responseDelay = args.delay;
+		device.rate = args.rate;
+		device.Start();
+		supplies.append(device);
+	jrk = SimulatedJrk();
+	jrk.responseDelay = args.delay;
+	jrk.rate = args.rate;
+	jrk.Start();
+
+	stats = CommandStats() if args.stats else None;
+	HV = HVControl(supplies[0].port);
+	HV.stats = stats;
+	HV.Connect();
+	HV.SetVoltage('1000');
+	HV.SetCurrent('1000');
+	HV.TurnOn().Wait();
+	Motor = MotorControl(jrk.port);
+	Motor.stats = stats;
+	Motor.Connect();
+
+	print(' ==============================================');
+	print('  Latency per command');
+	print(' ----------------------------------------------');
+	# Uncached calls go to the supply every time, cached ones show the
+	# cost of a cache hit
+	Report('HVControl.GetVoltage', Measure(HV.GetVoltage, args.repeat, HV.InvalidateCache));
+	Report('HVControl.MeasureVoltage', Measure(lambda: HV.MeasureVoltage(0), args.repeat, HV.InvalidateCache));
+	Report('HVControl.MeasureCurrent', Measure(lambda: HV.MeasureCurrent(0), args.repeat, HV.InvalidateCache));
+	Report('HVControl.GetSN', Measure(HV.GetSN, args.repeat));
+	Report('HVControl.SetVoltage', Measure(lambda: HV.SetVoltage('1000'), args.repeat));
+	Report('MotorControl.GetPosition', Measure(lambda: Motor.GetPosition(0), args.repeat));
+	Report('MotorControl.Status', Measure(Motor.Status, args.repeat));
+	Report('GetVoltage, cached', Measure(HV.GetVoltage, args.repeat));
+	Report('MeasureVoltage, 1 s cache', Measure(lambda: HV.MeasureVoltage(1.0), args.repeat));
+
+	print(' ==============================================');
+	print('  Status refresh');
+	print(' ----------------------------------------------');
+	Report('HVControl.GetStatus', Measure(lambda: HV.GetStatus(0), args.repeat, HV.InvalidateCache));
+	Report('4 queries one by one', Measure(lambda: (HV.GetVoltage(), HV.GetCurrent(), HV.MeasureVoltage(0), HV.MeasureCurrent(0)),
+	                                       args.repeat, HV.InvalidateCache));
+	Report('GetStatus, settings cached', Measure(lambda: HV.GetStatus(0), args.repeat));
+
+	print(' ==============================================');
+	print('  Polling throughput');
+	print(' ----------------------------------------------');
+	Throughput('HVControl.GetMeasurement', HV.GetMeasurement, args.time);
+	Throughput('MotorControl.GetPosition', Motor.GetPosition, args.time);
+	manager = HVManager([('hv%d' % i, device.port) for i, device in enumerate(supplies)]);
+	manager.Connect();
+	Throughput('HVManager.Poll (%d supplies)' % len(supplies), manager.Poll, args.time);
+	manager.Close();
+
+	print(' ==============================================');
+	print('  Move completion');
+	print(' ----------------------------------------------');
+	for target in (1140, 140):
+		distance = abs(target - jrk.GetPosition());
+		start = time.perf_counter();
+		ans = Motor.MoveTo(target);
+		duration = time.perf_counter() - start;
+		print(' %-28s %8.3f s  (travel %.3f s, overhead %.1f ms) %s'
+		      % ('MoveTo %d' % target, duration, distance / float(jrk.speed), 1e3 * (duration - distance / float(jrk.speed)), ans));
+	print(' ==============================================');
+	if args.startup > 0:
+		from GEMSlowControlServer import SlowControlServer
+		device = SimulatedHeinzinger();
+		device.responseDelay = args.delay;
+		device.rate = args.rate;
+		device.Start();
+		address = '/tmp/gemslowcontrol-benchmark-%d.sock' % os.getpid();
+		server = SlowControlServer();
+		server.AddHV('hv', device.port);
+		server.Connect();
+		server.StartPolling(0.5);
+		server.Listen(address);
+		script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'QuickRead.py');
+		print('  Startup to answer of one-shot reads');
+		print(' ----------------------------------------------');
+		Startup('python -c pass', [sys.executable, '-c', 'pass'], args.startup);
+		Startup('QuickRead.py hv port', [sys.executable, script, 'hv', '-p', device.port], args.startup);
+		Startup('QuickRead.py hv server', [sys.executable, script, 'hv', '-s', address], args.startup);
+		server.Shutdown();
+		device.Stop();
+		print(' ==============================================');
+	if stats is not None:
+		print('  Instrumentation');
+		print(' ----------------------------------------------');
+		print(stats.Dump());
+		print(' ==============================================');
+
+	for device in supplies + [jrk]:
+		device.Stop();
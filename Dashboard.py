@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Live dashboard of HV and motor                                             #
+# Shows every supply and the actuator on one screen, updated continuously in   #
+# the background, and takes commands at the same time. Type 'q' and enter to   #
+# quit; supplies and actuator are left as they are.                            #
+#                                                                              #
+#   ./Dashboard.py -p /dev/ttyUSB0 -m /dev/ttyACM1                             #
+#   ./Dashboard.py -c hv.conf -m /dev/ttyACM1                                  #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl, MotorControl
+from GEMSlowControlDashboard import DashboardPoller, Dashboard
+import argparse
+import curses
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Live dashboard of HV and motor.');
+	parser.add_argument('-p', '--port', default='', help='serial port of a single HV supply');
+	parser.add_argument('-c', '--config', default='', help='configuration of several supplies, instead of --port');
+	parser.add_argument('-m', '--motor', default='', help='serial port of the motor');
+	parser.add_argument('-r', '--rate', type=float, default=2.0, help='readings per second of each device');
+	args = parser.parse_args();
+
+	HV = None;
+	devices = [];
+	if args.config != '':
+		from GEMSlowControlManager import HVManager
+		HV = HVManager(args.config);
+		devices = [HV.GetDevice(name) for name in HV.GetNames()];
+	elif args.port != '':
+		HV = HVControl(args.port);
+		devices = [HV];
+	Motor = MotorControl(args.motor) if args.motor != '' else None;
+	if HV is None and Motor is None:
+		print(' Nothing to show, give --port, --config or --motor.');
+		sys.exit(1);
+
+	# A connection lost later is retried in the background
+	for device in devices:
+		device.autoReconnect = True;
+		device.Connect();
+	if Motor is not None:
+		Motor.autoReconnect = True;
+		Motor.Connect();
+
+	poller = DashboardPoller(HV, Motor, 1.0 / args.rate);
+	poller.Start();
+	try:
+		curses.wrapper(Dashboard(poller).Run);
+	except KeyboardInterrupt:
+		pass;
+	poller.Stop();
+	for device in devices + ([Motor] if Motor is not None else []):
+		device.StopReconnect();
+	if args.config != '':
+		HV.Close();
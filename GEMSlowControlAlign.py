@@ -0,0 +1,148 @@
+################################################################################
+#   Alignment of slow control readings to event times.                         #
+# For every detector event the HV and actuator readings at its time are found  #
+# by binary search on the sorted time column, either interpolated between the #
+# readings around it or as the last reading before it. Events go through in    #
+# chunks and stores are read through their memory map, so neither needs to    #
+# fit into memory.                                                             #
+#                                                                              #
+#   aligner = Aligner(HVStore('hv.gsc'));                                      #
+#   for events in ReadEvents('events.txt'):                                    #
+#       voltage, current = aligner.Align(events);                              #
+################################################################################
+
+
+import itertools
+import numpy
+
+
+################################################################################
+#   Align columns to event times                                               #
+################################################################################
+#   times must be sorted, values is one column or a list of them, events
+# any array of times. mode 'interp' interpolates linearly between the
+# readings around each event, 'last' takes the last reading at or before
+# it. Events outside the readings, or further than maxGap s from them
+# (between the two readings for 'interp', after the last one for
+# 'last'), get NaN. Returns one array per column, in the shape of events.
+def Align(times, values, events, mode = 'interp', maxGap = None):
+	if mode not in ('interp', 'last'):
+		raise ValueError('Mode must be interp or last, not %s' % mode);
+	single = numpy.ndim(values[0]) == 0 if len(values) > 0 else False;
+	columns = [numpy.asarray(values, dtype=float)] if single else [numpy.asarray(column, dtype=float) for column in values];
+	times = numpy.asarray(times, dtype=float);
+	events = numpy.asarray(events, dtype=float);
+	if len(times) == 0:
+		result = [numpy.full(events.shape, numpy.nan) for column in columns];
+		return result[0] if single else result;
+	# Index of the last reading at or before each event
+	before = numpy.searchsorted(times, events, side='right') - 1;
+	valid = before >= 0;
+	low = numpy.clip(before, 0, len(times) - 1);
+	if mode == 'last':
+		if maxGap is not None:
+			valid &= events - times[low] <= maxGap;
+		result = [numpy.where(valid, column[low], numpy.nan) for column in columns];
+		return result[0] if single else result;
+	high = numpy.clip(before + 1, 0, len(times) - 1);
+	exact = times[low] == events;
+	valid &= (before + 1 < len(times)) | exact;
+	gap = times[high] - times[low];
+	if maxGap is not None:
+		valid &= (gap <= maxGap) | exact;
+	weight = numpy.where(gap > 0, (events - times[low]) / numpy.where(gap > 0, gap, 1.0), 0.0);
+	weight = numpy.where(exact, 0.0, weight);
+	result = [numpy.where(valid, column[low] + weight * (column[high] - column[low]), numpy.nan) for column in columns];
+	return result[0] if single else result;
+
+
+################################################################################
+#   Class definition of Aligner                                                #
+################################################################################
+#   Aligns chunks of events to the readings of a SlowControlStore. Only the
+# records spanning each chunk are read, plus one on either side.
+class Aligner:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   fields are the columns wanted, all of the store if None. offset
+	# in s is added to event times to bring them to the clock of the
+	# store. calibration, a PositionCalibration, turns an aligned 'step'
+	# column into the 'position' column instead of the stored one.
+	def __init__(self, store, fields = None, mode = 'interp', maxGap = None, offset = 0.0, calibration = None):
+		if mode not in ('interp', 'last'):
+			raise ValueError('Mode must be interp or last, not %s' % mode);
+		self.__store = store;
+		self.__fields = tuple(fields) if fields is not None else store.GetFields();
+		for field in self.__fields:
+			if field not in store.GetFields():
+				raise ValueError('Store has columns %s, not %s' % (store.GetFields(), field));
+		if calibration is not None and ('step' not in store.GetFields() or 'position' not in self.__fields):
+			raise ValueError('A calibration needs a step column and position among the fields');
+		self.mode = mode;
+		self.maxGap = maxGap;
+		self.offset = float(offset);
+		self.__calibration = calibration;
+
+	#------------------------------------------------#
+	#   Get columns                                  #
+	#------------------------------------------------#
+	def GetFields(self):
+		return self.__fields;
+
+	#------------------------------------------------#
+	#   Align one chunk of events                    #
+	#------------------------------------------------#
+	#   Returns one array per field. Events need not be sorted, sorted
+	# chunks skip a sort.
+	def Align(self, events):
+		events = numpy.asarray(events, dtype=float) + self.offset;
+		order = None;
+		if len(events) > 1 and numpy.any(events[1:] < events[:-1]):
+			order = numpy.argsort(events, kind='stable');
+			events = events[order];
+		records = self.__store.Read();
+		if len(events) > 0 and len(records) > 0:
+			first = max(0, int(numpy.searchsorted(records['time'], events[0], side='right')) - 1);
+			last = min(len(records), int(numpy.searchsorted(records['time'], events[-1], side='left')) + 1);
+			records = records[first:last];
+		fields = list(self.__fields);
+		calibrated = self.__calibration is not None;
+		if calibrated:
+			# Position follows from the step, interpolated in steps
+			fields = [('step' if field == 'position' else field) for field in fields];
+		columns = Align(records['time'], [records[field] for field in fields], events, self.mode, self.maxGap);
+		if calibrated:
+			columns = [(self.__calibration.StepToMm(column) if field == 'position' else column)
+			           for field, column in zip(self.__fields, columns)];
+		if order is not None:
+			unsorted = [];
+			for column in columns:
+				back = numpy.empty_like(column);
+				back[order] = column;
+				unsorted.append(back);
+			columns = unsorted;
+		return columns;
+
+
+################################################################################
+#   Read event times in chunks                                                 #
+################################################################################
+#   path is a .npy file, read through a memory map, or a text file with the
+# time in the first column and '#' comments. Yields float64 arrays of up
+# to chunk events.
+def ReadEvents(path, chunk = 1000000):
+	if path.endswith('.npy'):
+		events = numpy.load(path, mmap_mode='r');
+		if events.ndim > 1:
+			events = events[:,0];
+		for first in range(0, len(events), chunk):
+			yield numpy.array(events[first:first+chunk], dtype=float);
+		return;
+	with open(path) as f:
+		while True:
+			lines = list(itertools.islice(f, chunk));
+			if len(lines) == 0:
+				break;
+			words = [line.split('#')[0].split() for line in lines];
+			yield numpy.array([float(word[0]) for word in words if len(word) > 0], dtype=float);
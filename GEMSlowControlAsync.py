@@ -0,0 +1,165 @@
+################################################################################
+#   asyncio front ends of GEM slow control classes.                            #
+# pyserial has no asynchronous interface, so each device gets one worker       #
+# thread which runs the blocking calls of the plain class in order. Calls to   #
+# different devices run at the same time and the event loop never blocks, so  #
+# one loop can drive many HV channels and actuators.                           #
+#                                                                              #
+#   import asyncio                                                             #
+#   async def main():                                                          #
+#       HVs = [AsyncHVControl(port) for port in ports];                        #
+#       await asyncio.gather(*[HV.Connect() for HV in HVs]);                   #
+#       print(await asyncio.gather(*[HV.GetMeasurement() for HV in HVs]));     #
+#   asyncio.run(main());                                                       #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl, MotorControl
+import asyncio
+import concurrent.futures
+import functools
+
+
+################################################################################
+#   Base of asynchronous devices                                               #
+################################################################################
+class AsyncDevice:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, device):
+		self.device = device;
+		self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1);
+
+	#------------------------------------------------#
+	#   Run a blocking call in the device thread     #
+	#------------------------------------------------#
+	async def Call(self, func, *args):
+		loop = asyncio.get_running_loop();
+		return await loop.run_in_executor(self.__executor, functools.partial(func, *args));
+
+	#------------------------------------------------#
+	#   Get whether it is ready or not               #
+	#------------------------------------------------#
+	def IsReady(self):
+		return self.device.IsReady();
+
+	#------------------------------------------------#
+	#   Stop the device thread                       #
+	#------------------------------------------------#
+	def Close(self):
+		self.__executor.shutdown(wait=False);
+
+
+################################################################################
+#   Class definition of AsyncHVControl                                         #
+################################################################################
+class AsyncHVControl(AsyncDevice):
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   hv is either a port or an HVControl.
+	def __init__(self, hv):
+		AsyncDevice.__init__(self, hv if isinstance(hv, HVControl) else HVControl(hv));
+
+	async def Connect(self):
+		return await self.Call(self.device.Connect);
+
+	async def SetVoltage(self, vol):
+		return await self.Call(self.device.SetVoltage, vol);
+
+	async def SetCurrent(self, cur):
+		return await self.Call(self.device.SetCurrent, cur);
+
+	async def GetVoltage(self):
+		return await self.Call(self.device.GetVoltage);
+
+	async def GetCurrent(self):
+		return await self.Call(self.device.GetCurrent);
+
+	async def MeasureVoltage(self):
+		return await self.Call(self.device.MeasureVoltage);
+
+	async def MeasureCurrent(self):
+		return await self.Call(self.device.MeasureCurrent);
+
+	async def GetMeasurement(self):
+		return await self.Call(self.device.GetMeasurement);
+
+	async def GetStatus(self):
+		return await self.Call(self.device.GetStatus);
+
+	async def Query(self, cmds):
+		return await self.Call(self.device.Query, cmds);
+
+	#------------------------------------------------#
+	#   Ramp and wait for the target                 #
+	#------------------------------------------------#
+	#   Same answer as HVRamp.Wait(). Cancelling the task stops the
+	# ramp where it is.
+	async def RampVoltage(self, vol, subscriber = None):
+		ramp = await self.Call(self.device.RampVoltage, vol, subscriber);
+		try:
+			return await asyncio.wrap_future(ramp.future);
+		except asyncio.CancelledError:
+			ramp.Cancel();
+			raise;
+
+	async def TurnOn(self):
+		return await self.Call(self.device.TurnOn);
+
+	async def TurnOff(self):
+		return await self.Call(self.device.TurnOff);
+
+	async def GetVer(self):
+		return await self.Call(self.device.GetVer);
+
+	async def GetSN(self):
+		return await self.Call(self.device.GetSN);
+
+	async def Reset(self):
+		return await self.Call(self.device.Reset);
+
+
+################################################################################
+#   Class definition of AsyncMotorControl                                      #
+################################################################################
+class AsyncMotorControl(AsyncDevice):
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   motor is either a port or a MotorControl.
+	def __init__(self, motor):
+		AsyncDevice.__init__(self, motor if isinstance(motor, MotorControl) else MotorControl(motor));
+
+	async def Connect(self):
+		return await self.Call(self.device.Connect);
+
+	async def GetPosition(self):
+		return await self.Call(self.device.GetPosition);
+
+	async def Status(self):
+		return await self.Call(self.device.Status);
+
+	async def MotorStop(self):
+		return await self.Call(self.device.MotorStop);
+
+	async def SetTarget(self, pos):
+		return await self.Call(self.device.SetTarget, pos);
+
+	async def GoHome(self):
+		return await self.MoveTo(self.device.GetRange()[0]);
+
+	#------------------------------------------------#
+	#   Move and wait for arrival                    #
+	#------------------------------------------------#
+	#   Same answer as MotorControl.MoveTo. With timeout > 0 the motor
+	# is stopped and (False, 'E5') is returned if it has not arrived
+	# in time. Cancelling the task stops the motor as well.
+	async def MoveTo(self, pos, timeout = 0, subscriber = None):
+		move = await self.Call(self.device.StartMove, pos, timeout, subscriber);
+		try:
+			return await asyncio.wrap_future(move.future);
+		except asyncio.CancelledError:
+			move.Cancel();
+			raise;
@@ -0,0 +1,141 @@
+################################################################################
+#   Calibration of the linear actuator position.                               #
+# Maps Jrk feedback steps to positions in mm and back, from any number of      #
+# measured points, either piecewise linear through the points or by a          #
+# least-squares polynomial. Both directions take numbers or numpy arrays and   #
+# return numbers of the same shape, so whole traces convert in one call.       #
+#                                                                              #
+#   A calibration file has one 'step mm' pair per line, e.g.                   #
+#     # step   mm                                                              #
+#      140    1308.5                                                           #
+#     3610    1439.5                                                           #
+################################################################################
+
+
+import numpy
+
+
+# Measured by hand, see MotorControl.LinearCal
+#   @  140 -> 349 mm + 191.5 mm + 493 mm + 275 mm = 1308.5 mm
+#   @ 3610 -> 480 mm + 191.5 mm + 493 mm + 275 mm = 1439.5 mm
+DefaultSteps = (140.0, 3610.0);
+DefaultMms   = (1308.5, 1439.5);
+
+
+################################################################################
+#   Linear interpolation with linear extrapolation                             #
+################################################################################
+#   numpy.interp holds the end values outside xp. Here the first and last
+# segments are extended instead. xp must be increasing.
+def Interpolate(x, xp, fp):
+	y = numpy.interp(x, xp, fp);
+	below = (fp[0] - (xp[0] - x) * (fp[1] - fp[0]) / (xp[1] - xp[0]));
+	above = (fp[-1] + (x - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2]));
+	return numpy.where(x < xp[0], below, numpy.where(x > xp[-1], above, y));
+
+
+################################################################################
+#   Read calibration file                                                      #
+################################################################################
+#   Returns a PositionCalibration of the given degree.
+def LoadCalibration(path, degree = 0):
+	steps = [];
+	mms = [];
+	with open(path) as f:
+		for line in f:
+			words = line.split('#')[0].split();
+			if len(words) == 0:
+				continue;
+			if len(words) != 2:
+				raise ValueError('Expected "step mm" in %s but got "%s"' % (path, line.strip()));
+			steps.append(float(words[0]));
+			mms.append(float(words[1]));
+	return PositionCalibration(steps, mms, degree);
+
+
+################################################################################
+#   Class definition of PositionCalibration                                    #
+################################################################################
+class PositionCalibration:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	gridSize       =  4096; # points of the inverse of a polynomial
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   steps and mms are the measured points. degree 0 is piecewise
+	# linear through them, degree n a polynomial fit of order n. The
+	# mapping must be monotonic over the points.
+	def __init__(self, steps = DefaultSteps, mms = DefaultMms, degree = 0):
+		steps = numpy.asarray(steps, dtype=float);
+		mms = numpy.asarray(mms, dtype=float);
+		if steps.ndim != 1 or steps.shape != mms.shape or len(steps) < 2:
+			raise ValueError('Need at least two pairs of step and mm, got %d and %d' % (steps.size, mms.size));
+		order = numpy.argsort(steps);
+		steps = steps[order];
+		mms = mms[order];
+		if numpy.any(numpy.diff(steps) == 0):
+			raise ValueError('Steps of a calibration must all differ');
+		if degree < 0 or (degree > 0 and len(steps) <= degree):
+			raise ValueError('Cannot fit degree %d to %d points' % (degree, len(steps)));
+		self.degree = int(degree);
+		self.__points = (steps, mms);
+		if self.degree == 0:
+			self.__coefficients = None;
+			table = (steps, mms);
+		else:
+			self.__coefficients = numpy.polyfit(steps, mms, self.degree);
+			grid = numpy.linspace(steps[0], steps[-1], self.gridSize);
+			table = (grid, numpy.polyval(self.__coefficients, grid));
+		slopes = numpy.diff(table[1]);
+		if numpy.all(slopes > 0):
+			self.__inverse = (table[1], table[0]);
+		elif numpy.all(slopes < 0):
+			self.__inverse = (table[1][::-1], table[0][::-1]);
+		else:
+			raise ValueError('Calibration is not monotonic between %g and %g steps' % (steps[0], steps[-1]));
+
+	#------------------------------------------------#
+	#   Position in mm of steps                      #
+	#------------------------------------------------#
+	def StepToMm(self, step):
+		step = numpy.asarray(step, dtype=float);
+		if self.__coefficients is None:
+			mm = Interpolate(step, self.__points[0], self.__points[1]);
+		else:
+			mm = numpy.polyval(self.__coefficients, step);
+		return float(mm) if mm.ndim == 0 else mm;
+
+	#------------------------------------------------#
+	#   Steps of positions in mm                     #
+	#------------------------------------------------#
+	#   Not rounded. Outside the measured points a polynomial is
+	# continued by its end slopes.
+	def MmToStep(self, mm):
+		mm = numpy.asarray(mm, dtype=float);
+		step = Interpolate(mm, self.__inverse[0], self.__inverse[1]);
+		return float(step) if step.ndim == 0 else step;
+
+	#------------------------------------------------#
+	#   Nearest steps of positions in mm             #
+	#------------------------------------------------#
+	#   int or an int array.
+	def MmToNearestStep(self, mm):
+		step = numpy.rint(self.MmToStep(mm)).astype(int);
+		return int(step) if step.ndim == 0 else step;
+
+	#------------------------------------------------#
+	#   Get measured points                          #
+	#------------------------------------------------#
+	#   (steps, mms) sorted by step.
+	def GetPoints(self):
+		return (self.__points[0].copy(), self.__points[1].copy());
+
+	#------------------------------------------------#
+	#   Get residuals at the measured points         #
+	#------------------------------------------------#
+	#   Measured minus calibrated, in mm. All 0 for piecewise linear.
+	def GetResiduals(self):
+		return self.__points[1] - self.StepToMm(self.__points[0]);
@@ -0,0 +1,402 @@
+################################################################################
+#   Capture and replay of serial traffic of GEM slow control.                  #
+# Capture wraps the port of a driver and writes every write, read, flush and   #
+# open to a compact binary log with nanosecond timestamps. Replay stands in    #
+# for the port and feeds the recorded answers back to the driver, at the       #
+# original timing, faster by a factor, or as fast as possible, so a session    #
+# from beam time can be profiled and debugged without hardware.                #
+#                                                                              #
+#   log = CaptureLog('beam.cap');                                              #
+#   HV = HVControl('/dev/ttyUSB0');                                            #
+#   HV.transport = Capture(log);                                               #
+#   ...                                                                        #
+#   HV = HVControl('/dev/ttyUSB0');                                            #
+#   HV.transport = Replay('beam.cap', speed=0);                                #
+################################################################################
+
+
+import struct
+import threading
+import time
+
+
+# File layout: magic, wall clock of the start as float64, then records of
+# kind, channel, ns since the start and length followed by the data.
+Magic = b'GEMSCCAP1\n';
+Start = struct.Struct('<d');
+Record = struct.Struct('<BBQI');
+
+# Kinds of records
+Open  = ord('O'); # data is the port name
+Write = ord('W');
+Read  = ord('R'); # empty for a read that timed out
+Flush = ord('F'); # input buffer dropped
+Close = ord('C');
+
+
+################################################################################
+#   Class definition of CaptureLog                                             #
+################################################################################
+#   One log can take the ports of several drivers, each open is a
+# channel of its own.
+class CaptureLog:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, path):
+		self.__file = open(path, 'wb');
+		self.__lock = threading.Lock();
+		self.__channels = 0;
+		self.__start = time.perf_counter_ns();
+		self.__file.write(Magic + Start.pack(time.time()));
+
+	#------------------------------------------------#
+	#   Start a channel                              #
+	#------------------------------------------------#
+	def Open(self, port):
+		with self.__lock:
+			if self.__channels > 255:
+				raise ValueError('Too many channels in one capture');
+			channel = self.__channels;
+			self.__channels += 1;
+		self.Append(Open, channel, port.encode('utf-8'));
+		return channel;
+
+	#------------------------------------------------#
+	#   Append a record                              #
+	#------------------------------------------------#
+	def Append(self, kind, channel, data = b''):
+		elapsed = time.perf_counter_ns() - self.__start;
+		with self.__lock:
+			self.__file.write(Record.pack(kind, channel, elapsed, len(data)));
+			self.__file.write(data);
+
+	#------------------------------------------------#
+	#   Flush                                        #
+	#------------------------------------------------#
+	def Flush(self):
+		with self.__lock:
+			self.__file.flush();
+
+	#------------------------------------------------#
+	#   Close                                        #
+	#------------------------------------------------#
+	def Close(self):
+		with self.__lock:
+			self.__file.close();
+
+
+################################################################################
+#   Read a capture                                                             #
+################################################################################
+#   Returns (wall clock of the start, [(kind, channel, s since the start,
+# data)]).
+def ReadCapture(path):
+	with open(path, 'rb') as f:
+		content = f.read();
+	if not content.startswith(Magic):
+		raise ValueError('%s is not a serial capture' % path);
+	offset = len(Magic);
+	start = Start.unpack_from(content, offset)[0];
+	offset += Start.size;
+	records = [];
+	while offset + Record.size <= len(content):
+		kind, channel, elapsed, length = Record.unpack_from(content, offset);
+		offset += Record.size;
+		records.append((kind, channel, elapsed * 1e-9, content[offset:offset+length]));
+		offset += length;
+	return (start, records);
+
+
+################################################################################
+#   Class definition of CapturingPort                                          #
+################################################################################
+#   Passes everything on to the port and records it.
+class CapturingPort:
+	def __init__(self, port, log, channel):
+		self.__port = port;
+		self.__log = log;
+		self.__channel = channel;
+
+	@property
+	def in_waiting(self):
+		return self.__port.in_waiting;
+
+	def write(self, data):
+		self.__log.Append(Write, self.__channel, bytes(data));
+		return self.__port.write(data);
+
+	def read(self, size = 1):
+		data = self.__port.read(size);
+		self.__log.Append(Read, self.__channel, bytes(data));
+		return data;
+
+	def reset_input_buffer(self):
+		self.__log.Append(Flush, self.__channel);
+		self.__port.reset_input_buffer();
+
+	def close(self):
+		self.__log.Append(Close, self.__channel);
+		self.__port.close();
+
+
+################################################################################
+#   Class definition of Capture                                                #
+################################################################################
+#   Transport of a driver that opens the port with opener, serial.Serial
+# if None, and records its traffic to log.
+class Capture:
+	def __init__(self, log, opener = None):
+		self.__log = log;
+		self.__opener = opener;
+
+	def __call__(self, port, **settings):
+		opener = self.__opener;
+		if opener is None:
+			import serial
+			opener = serial.Serial;
+		opened = opener(port, **settings);
+		return CapturingPort(opened, self.__log, self.__log.Open(port));
+
+
+################################################################################
+#   Class definition of ReplayPort                                             #
+################################################################################
+#   Plays back one channel. Each read returns the next recorded read once
+# it is due; a write is checked against the next recorded write and a
+# difference counted as a mismatch, the driver then took another path
+# than in the capture. Past the end reads time out. played() is called
+# once the last record has gone.
+#   Clock() is the time of the capture the replay has got to. As fast as
+# possible it moves with the records played and by the timeout of a
+# read that finds nothing recorded, so a driver waiting for a timeout
+# in this time does not wait in real time.
+class ReplayPort:
+	def __init__(self, records, speed, timeout, played = None):
+		self.__records = records;
+		self.__played = played;
+		self.__next = 0;
+		self.__speed = float(speed);
+		self.__timeout = timeout;
+		self.__begin = time.monotonic();
+		self.__origin = records[0][2] if len(records) > 0 else 0.0;
+		self.__now = self.__origin;
+		self.__lock = threading.RLock();
+		self.mismatches = 0;
+		self.closed = False;
+
+	#------------------------------------------------#
+	#   Wait until a record is due                   #
+	#------------------------------------------------#
+	def __due(self, elapsed):
+		if self.__speed <= 0:
+			return 0.0;
+		return self.__begin + (elapsed - self.__origin) / self.__speed - time.monotonic();
+
+	def __skip(self, kinds):
+		while self.__next < len(self.__records) and self.__records[self.__next][0] in kinds:
+			self.__now = max(self.__now, self.__records[self.__next][2]);
+			self.__next += 1;
+
+	#------------------------------------------------#
+	#   Get time of the capture in s since its start #
+	#------------------------------------------------#
+	def Clock(self):
+		if self.__speed > 0:
+			return self.__origin + (time.monotonic() - self.__begin) * self.__speed;
+		with self.__lock:
+			return self.__now;
+
+	@property
+	def in_waiting(self):
+		with self.__lock:
+			self.__skip((Open, Flush, Close));
+			if self.__next < len(self.__records):
+				kind, channel, elapsed, data = self.__records[self.__next];
+				if kind == Read and self.__due(elapsed) <= 0:
+					return len(data);
+			return 0;
+
+	def write(self, data):
+		with self.__lock:
+			self.__skip((Open, Flush, Close));
+			if self.__next < len(self.__records) and self.__records[self.__next][0] == Write:
+				recorded = self.__records[self.__next][3];
+				self.__now = max(self.__now, self.__records[self.__next][2]);
+				self.__next += 1;
+				if recorded != bytes(data):
+					self.mismatches += 1;
+				self.__check();
+			else:
+				self.mismatches += 1;
+		return len(data);
+
+	def read(self, size = 1):
+		with self.__lock:
+			self.__skip((Open, Flush, Close));
+			if self.__next >= len(self.__records) or self.__records[self.__next][0] != Read:
+				# Nothing recorded here, time out as the port would
+				if self.__timeout is not None:
+					if self.__speed > 0:
+						time.sleep(self.__timeout / self.__speed);
+					else:
+						self.__now += self.__timeout;
+				return b'';
+			kind, channel, elapsed, data = self.__records[self.__next];
+			wait = self.__due(elapsed);
+			if wait > 0:
+				time.sleep(wait);
+			if len(data) > size:
+				# The rest stays for the next read
+				self.__records[self.__next] = (kind, channel, elapsed, data[size:]);
+				return data[:size];
+			self.__now = max(self.__now, elapsed);
+			self.__next += 1;
+			self.__check();
+			return data;
+
+	def __check(self):
+		if self.__played is not None and self.Done():
+			played = self.__played;
+			self.__played = None;
+			played();
+
+	#------------------------------------------------#
+	#   Drop input up to the recorded flush          #
+	#------------------------------------------------#
+	def reset_input_buffer(self):
+		with self.__lock:
+			for i in range(self.__next, len(self.__records)):
+				if self.__records[i][0] == Write:
+					return;
+				if self.__records[i][0] == Flush:
+					self.__now = max(self.__now, self.__records[i][2]);
+					self.__next = i + 1;
+					return;
+
+	def close(self):
+		self.closed = True;
+
+	#------------------------------------------------#
+	#   Get whether all records were played          #
+	#------------------------------------------------#
+	def Done(self):
+		with self.__lock:
+			self.__skip((Open, Flush, Close));
+			return self.__next >= len(self.__records);
+
+
+################################################################################
+#   Class definition of Replay                                                 #
+################################################################################
+#   Transport of a driver that plays back a capture. speed 1 keeps the
+# original timing, 10 plays ten times faster and 0 as fast as the
+# driver goes. Each open of a port takes the next recorded open of the
+# same port name; ports maps names of the replay to names in the
+# capture if they differ. A capture of a single port plays back on
+# any name.
+class Replay:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	finished       =  None; # called once everything is played back
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, path, speed = 1.0, ports = None):
+		self.start, records = ReadCapture(path);
+		self.speed = float(speed);
+		self.__ports = ports if ports is not None else {};
+		self.__sessions = {};
+		names = {};
+		for record in records:
+			if record[0] == Open:
+				names[record[1]] = record[3].decode('utf-8');
+				self.__sessions.setdefault(names[record[1]], []).append([]);
+			if record[1] in names:
+				self.__sessions[names[record[1]]][-1].append(record);
+		self.__lock = threading.RLock();
+		self.__opened = [];
+
+	#------------------------------------------------#
+	#   Open a port                                  #
+	#------------------------------------------------#
+	def __call__(self, port, **settings):
+		name = self.__ports.get(port, port);
+		if name not in self.__sessions and len(self.__sessions) == 1:
+			name = list(self.__sessions)[0];
+		with self.__lock:
+			sessions = self.__sessions.get(name, []);
+			if len(sessions) == 0:
+				raise IOError('No more recorded opens of %s' % name);
+			opened = ReplayPort(sessions.pop(0), self.speed, settings.get('timeout'), self.__played);
+			self.__opened.append(opened);
+		return opened;
+
+	#------------------------------------------------#
+	#   Get wall clock of the capture                #
+	#------------------------------------------------#
+	#   The time the records played so far were taken at, to stamp
+	# readings of the replay with instead of time.time.
+	def Time(self):
+		with self.__lock:
+			opened = list(self.__opened);
+		return self.start + max([port.Clock() for port in opened] + [0.0]);
+
+	#------------------------------------------------#
+	#   Get ports recorded in the capture            #
+	#------------------------------------------------#
+	def GetPorts(self):
+		return list(self.__sessions);
+
+	#------------------------------------------------#
+	#   Get writes that differed from the capture    #
+	#------------------------------------------------#
+	def GetMismatches(self):
+		return sum([opened.mismatches for opened in self.__opened]);
+
+	#------------------------------------------------#
+	#   Get whether everything was played back       #
+	#------------------------------------------------#
+	#   Recorded opens not opened again count as not played.
+	def Done(self):
+		with self.__lock:
+			if any([len(sessions) > 0 for sessions in self.__sessions.values()]):
+				return False;
+			return all([opened.Done() for opened in self.__opened]);
+
+	def __played(self):
+		if self.finished is not None and self.Done():
+			self.finished();
+
+
+################################################################################
+#   Summarize a capture                                                        #
+################################################################################
+#   Per port: (opens, writes, bytes written, reads, bytes read, empty
+# reads, [times from a write to the first byte of its answer in s]).
+def Summarize(path):
+	start, records = ReadCapture(path);
+	names = {};
+	summary = {};
+	pending = {};
+	for kind, channel, elapsed, data in records:
+		if kind == Open:
+			names[channel] = data.decode('utf-8');
+			summary.setdefault(names[channel], [0, 0, 0, 0, 0, 0, []])[0] += 1;
+			continue;
+		entry = summary[names[channel]];
+		if kind == Write:
+			entry[1] += 1;
+			entry[2] += len(data);
+			pending[channel] = elapsed;
+		elif kind == Read:
+			entry[3] += 1;
+			entry[4] += len(data);
+			if len(data) == 0:
+				entry[5] += 1;
+			elif pending.get(channel) is not None:
+				entry[6].append(elapsed - pending[channel]);
+				pending[channel] = None;
+	return dict([(name, tuple(entry)) for name, entry in summary.items()]);
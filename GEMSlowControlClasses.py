@@ -10,6 +10,129 @@ import serial
 import sys
 import time
 import datetime
+import threading
+import concurrent.futures
+
+
+################################################################################
+#   Class definition of FrameWriter                                            #
+################################################################################
+#   Writes each command as one complete frame in one call. Frames from
+# several threads that arrive while a write is going on are joined and
+# go out together with the next write, in the order they came. When
+# such a joined write fails, every thread whose frame was in it gets
+# the error.
+class FrameWriter:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, port):
+		self.__port = port;
+		self.__pending = [];
+		self.__pendingLock = threading.Lock();
+		self.__writeLock = threading.Lock();
+
+	#------------------------------------------------#
+	#   Write a frame                                #
+	#------------------------------------------------#
+	#   Returns once the frame has been handed to the port. Raises what
+	# the port raises, also when another thread wrote the frame.
+	def Write(self, frame):
+		# [frame, written, error]
+		entry = [frame, False, None];
+		with self.__pendingLock:
+			self.__pending.append(entry);
+		with self.__writeLock:
+			if not entry[1]:
+				with self.__pendingLock:
+					entries = self.__pending;
+					self.__pending = [];
+				try:
+					if len(entries) == 1:
+						self.__port.write(entries[0][0]);
+					else:
+						self.__port.write(b''.join([pending[0] for pending in entries]));
+				except Exception as error:
+					for pending in entries:
+						pending[2] = error;
+				for pending in entries:
+					pending[1] = True;
+		if entry[2] is not None:
+			raise entry[2];
+
+
+################################################################################
+#   Class definition of Reconnector                                            #
+################################################################################
+#   Calls connect() in a background thread until it returns True, waiting
+# minDelay after the first failed attempt and twice as long after each
+# further one, up to maxDelay. Keeps the times from failure to recovery
+# and hands each to recovered(duration) if given.
+class Reconnector:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	minDelay       =   0.2; # in s
+	maxDelay       =   5.0; # in s
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, connect, recovered = None):
+		self.__connect = connect;
+		self.__recovered = recovered;
+		self.__lock = threading.Lock();
+		self.__stop = threading.Event();
+		self.__thread = None;
+		self.__recoveries = [];
+		self.attempts = 0;
+
+	#------------------------------------------------#
+	#   Start reconnecting after a failure           #
+	#------------------------------------------------#
+	#   Does nothing if it is already at it.
+	def Start(self):
+		with self.__lock:
+			if self.IsRunning():
+				return;
+			self.__stop.clear();
+			self.__thread = threading.Thread(target=self.__run, args=(time.monotonic(),));
+			self.__thread.daemon = True;
+			self.__thread.start();
+
+	def __run(self, failure):
+		delay = self.minDelay;
+		while not self.__stop.is_set():
+			self.attempts += 1;
+			if self.__connect():
+				self.__recoveries.append(time.monotonic() - failure);
+				if self.__recovered is not None:
+					self.__recovered(self.__recoveries[-1]);
+				return;
+			if self.__stop.wait(delay):
+				return;
+			delay = min(self.maxDelay, 2 * delay);
+
+	#------------------------------------------------#
+	#   Get whether it is reconnecting               #
+	#------------------------------------------------#
+	def IsRunning(self):
+		return self.__thread is not None and self.__thread.is_alive();
+
+	#------------------------------------------------#
+	#   Give up reconnecting                         #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__stop.set();
+		if self.__thread is not None and self.__thread is not threading.current_thread():
+			self.__thread.join();
+
+	#------------------------------------------------#
+	#   Get times to recover                         #
+	#------------------------------------------------#
+	#   In s from the failure to the connection, oldest first.
+	def GetRecoveries(self):
+		return list(self.__recoveries);
 
 
 ################################################################################
@@ -38,8 +161,47 @@ class HVControl:
 	__maxI         = 10000; # in uA
 	__rampUp       =    50; # in V/s
 	__rampDown     =    50; # in V/s
+	rampStep       =   0.1; # in s, time between setpoints of a ramp
+	tripCurrent    =     0; # in uA, ramp abort, 0 for tripFraction
+	tripFraction   =  0.95; # of the current setting, ramp abort
+	# Encoded commands without argument
+	__frames       = dict([(cmd, (cmd + '\n').encode('ascii')) for cmd in
+	                 (__cmd_GetV, __cmd_GetI, __cmd_On, __cmd_Off, __cmd_MeasureV,
+	                  __cmd_MeasureI, __cmd_GetVer, __cmd_GetSN, __cmd_Reset)]);
+	# Answers
+	__terminator   = b'\n';
+	__readSlice    =  0.02; # in s, longest single blocking read
+	drainQuiet     =  0.05; # in s, quiet line after a failed answer
+	drainTimeout   =   1.0; # in s, longest wait for late answers
+	answerTimeout  =   0.5; # in s, default deadline of an answer
+	answerTimeouts = { __cmd_MeasureV : 1.0,
+	                   __cmd_MeasureI : 1.0 };
+	pipelineDepth  =     4; # queries written at once in a batch
+	# Cache
+	measureTTL     =   0.0; # in s, how long a measurement is reused
+	__settings     = (__cmd_GetV, __cmd_GetI);
+	__measurements = (__cmd_MeasureV, __cmd_MeasureI);
+	# Instrumentation
+	stats          =  None; # CommandStats, None for none
+	# Reconnect after a read or write failure
+	autoReconnect  = False;
+	# Opens the port, serial.Serial if None. Set on the instance, e.g. to
+	# a Capture or Replay of GEMSlowControlCapture. A port with a Clock()
+	# gives the time read timeouts are measured in.
+	transport      =  None;
+	# Error dictionary
+	__errorDict    = { 'E0' : 'Not ready',
+	                   'E1' : 'Serial read failure',
+	                   'E2' : 'No answer before deadline',
+	                   'E3' : 'Incomplete answer before deadline',
+	                   'E4' : 'Ramp cancelled',
+	                   'E5' : 'Over-current during ramp',
+	                   'E6' : 'Measurement failed during ramp',
+	                   'E7' : 'Voltage out of range',
+	                   'E8' : 'Current out of range'};
 	# Etc
 	__Is_Ready     = False;
+	__Is_Stale     = False;
 	__serial       =     0;
 	rate           =  9600;
 	__port         =    '';
@@ -49,6 +211,17 @@ class HVControl:
 	#------------------------------------------------#
 	def __init__(self, port):
 		self.__port = port;
+		self.__rxBuffer = b'';
+		self.__owed = 0;
+		self.__owedUntil = 0.0;
+		self.__clock = time.monotonic;
+		# Error of the last query, per calling thread
+		self.__lastError = threading.local();
+		self.__ramp = None;
+		self.__cache = {};
+		# A query and its answer must not be split by another thread
+		self.__lock = threading.RLock();
+		self.__reconnector = Reconnector(self.__reconnect, self.__recovered);
 
 	#------------------------------------------------#
 	#   Get whether it is ready or not               #
@@ -62,11 +235,12 @@ class HVControl:
 	def Connect(self):
 		if not self.__Is_Ready:
 			try:
-				self.__serial = serial.Serial(self.__port, baudrate=self.rate, timeout=0.5, interCharTimeout=0.005);
-#				self.__serial = serial.Serial(self.__port, baudrate=self.rate);
-				self.__Is_Ready = True;
+				self.__open();
+				self.__cache = {};
+				if self.stats is not None:
+					self.stats.Event(self.__port, 'connect');
 			except:
-				self.__Is_Ready = False;
+				self.__close();
 				print(' Failed to connect with port', self.__port, '(', sys.exc_info()[0], ')');
 				print(' 1. You may need sudo?');
 				print(' 2. Or please check USB connection.');
@@ -75,16 +249,129 @@ class HVControl:
 			print(' Connection is already on.');
 		return True;
 
+	def __open(self):
+		with self.__lock:
+			self.__serial = (self.transport or serial.Serial)(self.__port, baudrate=self.rate, timeout=self.__readSlice);
+#			self.__serial = serial.Serial(self.__port, baudrate=self.rate);
+			self.__writer = FrameWriter(self.__serial);
+			# A replayed port keeps the recorded time
+			self.__clock = getattr(self.__serial, 'Clock', time.monotonic);
+			self.__rxBuffer = b'';
+			self.__owed = 0;
+			self.__Is_Stale = False;
+			self.__Is_Ready = True;
+
+	#------------------------------------------------#
+	#   Handle a lost connection                     #
+	#------------------------------------------------#
+	#   Requests fail at once with E0 until the connection is back.
+	def __fail(self):
+		self.__close();
+		if self.stats is not None:
+			self.stats.Event(self.__port, 'disconnect');
+		if self.autoReconnect:
+			self.__reconnector.Start();
+
+	#   Closes the port quietly, also one that was just opened.
+	def __close(self):
+		self.__Is_Ready = False;
+		try:
+			self.__serial.close();
+		except:
+			pass;
+
+	#------------------------------------------------#
+	#   Reconnect and restore settings               #
+	#------------------------------------------------#
+	#   Cached settings are sent again in case the supply lost them.
+	# Measurements from before the failure are dropped. The output is
+	# left as the supply has it.
+	#   A port opened in a failed attempt is closed again before the
+	# next one.
+	def __reconnect(self):
+		try:
+			self.__open();
+		except:
+			self.__close();
+			return False;
+		for cmd in self.__measurements:
+			self.__cache.pop(cmd, None);
+		for getter, setter in ((self.__cmd_GetV, self.__cmd_SetV), (self.__cmd_GetI, self.__cmd_SetI)):
+			entry = self.__cache.get(getter);
+			if entry is not None and not self.__sendCommand(setter, entry[0]):
+				self.__close();
+				return False;
+		print(' Reconnected with', self.__port);
+		return True;
+
+	def __recovered(self, duration):
+		if self.stats is not None:
+			self.stats.Event(self.__port, 'reconnect');
+			self.stats.Command(self.__port, 'Reconnect', duration);
+
+	#------------------------------------------------#
+	#   Get whether it is reconnecting               #
+	#------------------------------------------------#
+	def IsReconnecting(self):
+		return self.__reconnector.IsRunning();
+
+	#------------------------------------------------#
+	#   Wait until the connection is back            #
+	#------------------------------------------------#
+	#   Returns IsReady() at the end.
+	def WaitReady(self, timeout = None):
+		deadline = None if timeout is None else time.monotonic() + timeout;
+		while not self.__Is_Ready and self.__reconnector.IsRunning():
+			if deadline is not None and time.monotonic() >= deadline:
+				break;
+			time.sleep(0.05);
+		return self.__Is_Ready;
+
+	#------------------------------------------------#
+	#   Stop reconnecting                            #
+	#------------------------------------------------#
+	def StopReconnect(self):
+		self.__reconnector.Stop();
+
+	#------------------------------------------------#
+	#   Get reconnection record                      #
+	#------------------------------------------------#
+	#   (attempts, [times to recover in s]).
+	def GetRecoveries(self):
+		return (self.__reconnector.attempts, self.__reconnector.GetRecoveries());
+
+	#------------------------------------------------#
+	#   Build frame of a command                     #
+	#------------------------------------------------#
+	def __frame(self, cmd, argument = ''):
+		if argument == '':
+			frame = self.__frames.get(cmd);
+			if frame is not None:
+				return frame;
+			return (cmd + '\n').encode('ascii');
+		return (cmd + ' ' + argument + '\n').encode('ascii');
+
 	#------------------------------------------------#
 	#   Send command                                 #
 	#------------------------------------------------#
+	#   Commands without answer need not wait for a query of another
+	# thread, so only the frame writer is locked here.
 	def __sendCommand(self, cmd, argument = ''):
 		if self.__Is_Ready:
-			self.__serial.write(cmd.encode('ascii'));
-			if argument != '':
-				self.__serial.write(' '.encode('ascii'));
-				self.__serial.write(argument.encode('ascii'));
-			self.__serial.write('\n'.encode('ascii'));
+			stats = self.stats;
+			if stats is not None:
+				start = time.perf_counter();
+			frame = self.__frame(cmd, argument);
+			try:
+				self.__writer.Write(frame);
+			except:
+				print(' Error while writing to', self.__port, '(', sys.exc_info()[0], ')');
+				self.__fail();
+				if stats is not None:
+					stats.Command(self.__port, cmd, time.perf_counter() - start, 'E1');
+				return False;
+			if stats is not None:
+				stats.Command(self.__port, cmd, time.perf_counter() - start, '', len(frame));
 		else:
 			print(' Not ready. Cannot send command', cmd, 'to', self.__port, '(', sys.exc_info()[0], ')');
 			return False;
@@ -93,76 +380,305 @@ class HVControl:
 	#------------------------------------------------#
 	#   Read answer                                  #
 	#------------------------------------------------#
-	def __readAns(self):
-		if self.__Is_Ready:
+	#   Returns as soon as the terminator arrives. Bytes after the
+	# terminator are kept for the next answer.
+	def __readAns(self, timeout):
+		if not self.__Is_Ready:
+			return (False, 'E0');
+		deadline = self.__clock() + timeout;
+		try:
+			while True:
+				end = self.__rxBuffer.find(self.__terminator);
+				if end >= 0:
+					ans = self.__rxBuffer[:end];
+					self.__rxBuffer = self.__rxBuffer[end+1:];
+					return (True, ans.decode('ascii', 'replace').rstrip('\r'));
+				if self.__clock() >= deadline:
+					break;
+				waiting = self.__serial.in_waiting;
+				self.__rxBuffer += self.__serial.read(waiting if waiting > 0 else 1);
+		except:
+			print(' Error while reading from', self.__port, '(', sys.exc_info()[0], ')');
+			self.__fail();
+			return (False, 'E1');
+		# A late answer would be taken for the next one. Drop it then.
+		self.__Is_Stale = True;
+		partial = self.__rxBuffer.decode('ascii', 'replace');
+		self.__rxBuffer = b'';
+		if partial != '':
+			return (False, 'E3', partial);
+		return (False, 'E2');
+
+	#------------------------------------------------#
+	#   Drop what is left from a failed answer       #
+	#------------------------------------------------#
+	#   The answers still owed to failed queries are read and dropped,
+	# waiting for them up to drainTimeout after the failure, so that a
+	# late answer is not taken for the next query. Then the line is read
+	# on until it has been quiet for drainQuiet.
+	def __flush(self):
+		try:
+			while self.__owed > 0 and self.__clock() < self.__owedUntil:
+				end = self.__rxBuffer.find(self.__terminator);
+				if end >= 0:
+					self.__rxBuffer = self.__rxBuffer[end+1:];
+					self.__owed -= 1;
+					continue;
+				waiting = self.__serial.in_waiting;
+				self.__rxBuffer += self.__serial.read(waiting if waiting > 0 else 1);
+			quiet = self.__clock() + self.drainQuiet;
+			while self.__clock() < quiet:
+				waiting = self.__serial.in_waiting;
+				if len(self.__serial.read(waiting if waiting > 0 else 1)) > 0:
+					quiet = self.__clock() + self.drainQuiet;
+		except:
+			pass;
+		self.__owed = 0;
+		self.__rxBuffer = b'';
+		self.__Is_Stale = False;
+
+	#------------------------------------------------#
+	#   Send query and read its answer               #
+	#------------------------------------------------#
+	def __query(self, cmd, maxAge = None):
+		return self.Query([cmd], maxAge)[0];
+
+	#------------------------------------------------#
+	#   Send several queries and read their answers  #
+	#------------------------------------------------#
+	#   Up to pipelineDepth queries go out in a single write and
+	# the answers are matched to them in order. Once an answer fails
+	# the rest of that write cannot be matched any more and fails too.
+	#   Settings and measurements younger than maxAge (measureTTL if
+	# None) are answered from the cache without a query.
+	def Query(self, cmds, maxAge = None):
+		return self.QueryWithError(cmds, maxAge)[0];
+
+	#   Returns (answers, error) with error (True, '') if everything was
+	# answered, otherwise the first failure as (False, code) or (False,
+	# code, partial answer).
+	def QueryWithError(self, cmds, maxAge = None):
+		answers = [];
+		error = (True, '');
+		for first in range(0, len(cmds), max(1, self.pipelineDepth)):
+			batch, failure = self.__queryBatch(cmds[first:first+max(1, self.pipelineDepth)], maxAge);
+			answers += batch;
+			if error[0]:
+				error = failure;
+		self.__lastError.error = error;
+		return (answers, error);
+
+	def __queryBatch(self, cmds, maxAge):
+		# Cached answers need not wait for a query of another thread
+		cached = [self.__cached(cmd, maxAge) for cmd in cmds];
+		if None not in cached:
+			return (cached, (True, ''));
+		# Whoever waited for the lock may find the answer cached by now
+		with self.__lock:
+			cached = [self.__cached(cmd, maxAge) for cmd in cmds];
+			missing = [cmd for cmd, value in zip(cmds, cached) if value is None];
+			if len(missing) == 0:
+				return (cached, (True, ''));
+			if not self.__Is_Ready:
+				print(' Not ready. Cannot send commands', missing, 'to', self.__port);
+				return ([value if value is not None else '' for value in cached], (False, 'E0'));
+			if self.__Is_Stale:
+				self.__flush();
+			stats = self.stats;
+			if stats is not None:
+				start = time.perf_counter();
+			frames = [self.__frame(cmd) for cmd in missing];
 			try:
-				return self.__serial.read_all().decode()[:-1];
+				self.__writer.Write(b''.join(frames));
 			except:
-				print(' Error while reading from', self.__port, '(', sys.exc_info()[0], ')');
-				self.__Is_Ready = False;
-				return '';
+				print(' Error while writing to', self.__port, '(', sys.exc_info()[0], ')');
+				self.__fail();
+				if stats is not None:
+					stats.Command(self.__port, missing[0], time.perf_counter() - start, 'E1');
+				return ([value if value is not None else '' for value in cached], (False, 'E1'));
+			answers = {};
+			error = (True, '');
+			for i, (cmd, frame) in enumerate(zip(missing, frames)):
+				if not error[0]:
+					answers[cmd] = '';
+					continue;
+				ans = self.__readAns(self.answerTimeouts.get(cmd, self.answerTimeout));
+				if not ans[0]:
+					error = ans;
+					# This answer and the ones after it may still come
+					self.__owed = len(missing) - i;
+					self.__owedUntil = self.__clock() + self.drainTimeout;
+					self.__printError(cmd, ans);
+					answers[cmd] = '';
+				else:
+					answers[cmd] = ans[1];
+					self.__store(cmd, ans[1]);
+				# Latency of a pipelined answer counts from the common write
+				if stats is not None:
+					if ans[0]:
+						stats.Command(self.__port, cmd, time.perf_counter() - start, '', len(frame), len(ans[1]) + 1);
+					else:
+						stats.Command(self.__port, cmd, time.perf_counter() - start, ans[1], len(frame), len(ans[2]) if len(ans) > 2 else 0);
+			if not error[0]:
+				self.__Is_Stale = True;
+			return ([value if value is not None else answers[cmd] for cmd, value in zip(cmds, cached)], error);
+
+	#------------------------------------------------#
+	#   Cache of settings and measurements           #
+	#------------------------------------------------#
+	#   Settings are written through by SetVoltage/SetCurrent and kept
+	# until Reset. Measurements are kept with the time they were read.
+	def __cached(self, cmd, maxAge):
+		entry = self.__cache.get(cmd);
+		if entry is None:
+			return None;
+		if cmd in self.__settings:
+			return entry[0];
+		if maxAge is None:
+			maxAge = self.measureTTL;
+		if maxAge > 0 and time.monotonic() - entry[1] <= maxAge:
+			return entry[0];
+		return None;
+
+	def __store(self, cmd, value):
+		if cmd in self.__settings or cmd in self.__measurements:
+			self.__cache[cmd] = (value, time.monotonic());
+
+	#------------------------------------------------#
+	#   Forget cached settings and measurements      #
+	#------------------------------------------------#
+	def InvalidateCache(self):
+		self.__cache = {};
+
+	#------------------------------------------------#
+	#   Get cached value without any query           #
+	#------------------------------------------------#
+	#   (value, age in s) of the last answer to cmd, e.g. 'MEAS:VOLT?',
+	# or None if there is none.
+	def GetCached(self, cmd):
+		entry = self.__cache.get(cmd);
+		if entry is None:
+			return None;
+		return (entry[0], time.monotonic() - entry[1]);
+
+	#------------------------------------------------#
+	#   Print error of an answer                     #
+	#------------------------------------------------#
+	def __printError(self, cmd, ans):
+		if len(ans) > 2:
+			print(' ' + self.__errorDict[ans[1]] + '.', 'Got', repr(ans[2]), 'for', cmd, 'from', self.__port);
+		else:
+			print(' ' + self.__errorDict[ans[1]] + '.', 'Got nothing for', cmd, 'from', self.__port);
+
+	#------------------------------------------------#
+	#   Get error of the last query                  #
+	#------------------------------------------------#
+	#   Of the last query of the calling thread, so other threads do not
+	# overwrite it. (True, '') if it was answered, also from the cache.
+	# Otherwise (False, code) or (False, code, partial answer). Use
+	# QueryWithError to get it with the answers.
+	def GetLastError(self):
+		return getattr(self.__lastError, 'error', (True, ''));
 
 	#------------------------------------------------#
 	#   Set voltage                                  #
 	#------------------------------------------------#
+	#   Returns (True, '') or (False, code), E7 if out of range.
 	def SetVoltage(self, vol):
-		if self.__Is_Ready and int(vol) >= self.__minV and int(vol) <= self.__maxV:
-			self.__sendCommand(self.__cmd_SetV, vol);
+		if not self.__Is_Ready:
+			return (False, 'E0');
+		if int(vol) < self.__minV or int(vol) > self.__maxV:
+			return (False, 'E7');
+		if not self.__sendCommand(self.__cmd_SetV, vol):
+			return (False, 'E1');
+		self.__store(self.__cmd_GetV, vol);
+		return (True, '');
 
 	#------------------------------------------------#
 	#   Set current                                  #
 	#------------------------------------------------#
+	#   Returns (True, '') or (False, code), E8 if out of range.
 	def SetCurrent(self, cur):
-		if self.__Is_Ready and int(cur) >= self.__minI and int(cur) <= self.__maxI:
-			self.__sendCommand(self.__cmd_SetI, cur);
+		if not self.__Is_Ready:
+			return (False, 'E0');
+		if int(cur) < self.__minI or int(cur) > self.__maxI:
+			return (False, 'E8');
+		if not self.__sendCommand(self.__cmd_SetI, cur):
+			return (False, 'E1');
+		self.__store(self.__cmd_GetI, cur);
+		return (True, '');
 
 	#------------------------------------------------#
 	#   Get voltage                                  #
 	#------------------------------------------------#
 	def GetVoltage(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_GetV);
-			time.sleep(0.1);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_GetV, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+		return self.__query(self.__cmd_GetV);
 
 	#------------------------------------------------#
 	#   Get current                                  #
 	#------------------------------------------------#
 	def GetCurrent(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_GetI);
-			time.sleep(0.1);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_GetI, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+		return self.__query(self.__cmd_GetI);
 
 	#------------------------------------------------#
 	#   Measure voltage                              #
 	#------------------------------------------------#
-	def MeasureVoltage(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_MeasureV);
-			time.sleep(0.3);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_MeasureV, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+	def MeasureVoltage(self, maxAge = None):
+		return self.__query(self.__cmd_MeasureV, maxAge);
 
 	#------------------------------------------------#
 	#   Measure current                              #
 	#------------------------------------------------#
-	def MeasureCurrent(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_MeasureI);
-			time.sleep(0.3);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_MeasureI, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+	def MeasureCurrent(self, maxAge = None):
+		return self.__query(self.__cmd_MeasureI, maxAge);
+
+	#------------------------------------------------#
+	#   Measure voltage and current at once          #
+	#------------------------------------------------#
+	def GetMeasurement(self, maxAge = None):
+		return tuple(self.Query([self.__cmd_MeasureV, self.__cmd_MeasureI], maxAge));
+
+	#------------------------------------------------#
+	#   Get setting and measurement at once          #
+	#------------------------------------------------#
+	#   (set voltage, set current, measured voltage, measured current)
+	def GetStatus(self, maxAge = None):
+		return tuple(self.Query([self.__cmd_GetV, self.__cmd_GetI, self.__cmd_MeasureV, self.__cmd_MeasureI], maxAge));
+
+	#------------------------------------------------#
+	#   Ramp voltage in the background               #
+	#------------------------------------------------#
+	#   Moves the setting to vol at the ramp-up/down rate and returns
+	# an HVRamp. A ramp still running on this supply is cancelled. A
+	# target out of range gives a ramp finished with E7 at once and
+	# leaves a running ramp alone.
+	def RampVoltage(self, vol, subscriber = None):
+		if not self.__minV <= float(vol) <= self.__maxV:
+			print(' Voltage', vol, 'V out of range', self.__minV, 'to', self.__maxV, 'V of', self.__port);
+			ramp = HVRamp(self, float(vol));
+			ramp.future.set_result((False, 'E7'));
+			return ramp;
+		if self.__ramp is not None and not self.__ramp.Done():
+			self.__ramp.Cancel();
+			self.__ramp.Wait();
+		self.__ramp = HVRamp(self, float(vol));
+		if subscriber is not None:
+			self.__ramp.Subscribe(subscriber);
+		self.__ramp.Start();
+		return self.__ramp;
+
+	#------------------------------------------------#
+	#   Get running ramp                             #
+	#------------------------------------------------#
+	#   The last HVRamp started, None if there was none.
+	def GetRamp(self):
+		return self.__ramp;
+
+	#------------------------------------------------#
+	#   Get voltage limits                           #
+	#------------------------------------------------#
+	def GetVoltageRange(self):
+		return (self.__minV, self.__maxV);
 
 	#------------------------------------------------#
 	#   Set ramp-up                                  #
@@ -191,65 +707,63 @@ class HVControl:
 	#------------------------------------------------#
 	#   Activate output                              #
 	#------------------------------------------------#
+	#   The output starts from 0 V and ramps up to the voltage set
+	# before in the background. Returns the HVRamp, or None if not
+	# ready.
 	def TurnOn(self):
 		if self.__Is_Ready:
+			ramp = self.__ramp;
+			if ramp is not None and not ramp.Done():
+				ramp.Cancel();
+				ramp.Wait();
+				goal = ramp.GetTarget();
+			else:
+				goal = self.GetVoltage();
+			try:
+				goal = float(goal);
+			except:
+				print(' Cannot get voltage setting of', self.__port, 'to ramp up to.');
+				return None;
+			self.SetVoltage('0');
 			self.__sendCommand(self.__cmd_On);
-#			goal = self.GetVoltage();
-#			if goal == '.0':
-#				goal = '0';
-#			self.SetVoltage('0');
-#			self.__sendCommand(self.__cmd_On);
-#			now = self.__rampUp;
-#			while float(now) < float(goal):
-#				self.SetVoltage(str(now));
-#				print(' Activating... V =', now);
-#				now = now + self.__rampUp;
-#				time.sleep(1);
-#			self.SetVoltage(goal);
+			return self.RampVoltage(goal);
 		else:
-			print(' Not ready. Cannot send command', __cmd_On, 'to', self.__port, '(', sys.exc_info()[0], ')');
+			print(' Not ready. Cannot send command', self.__cmd_On, 'to', self.__port);
+			return None;
 
 	#------------------------------------------------#
 	#   Deactivate output                            #
 	#------------------------------------------------#
 	def TurnOff(self):
 		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_Off);
+			return (True, '') if self.__sendCommand(self.__cmd_Off) else (False, 'E1');
 		else:
-			print(' Not ready. Cannot send command', __cmd_Off, 'to', self.__port, '(', sys.exc_info()[0], ')');
+			print(' Not ready. Cannot send command', self.__cmd_Off, 'to', self.__port);
+			return (False, 'E0');
 
 	#------------------------------------------------#
 	#   Get version                                  #
 	#------------------------------------------------#
 	def GetVer(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_GetVer);
-			time.sleep(0.1);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_GetVer, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+		return self.__query(self.__cmd_GetVer);
 
 	#------------------------------------------------#
 	#   Get serial number                            #
 	#------------------------------------------------#
 	def GetSN(self):
-		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_GetSN);
-			time.sleep(0.1);
-			return self.__readAns();
-		else:
-			print(' Not ready. Cannot send command', __cmd_GetSN, 'to', self.__port, '(', sys.exc_info()[0], ')');
-			return '';
+		return self.__query(self.__cmd_GetSN);
 
 	#------------------------------------------------#
 	#   Reset                                        #
 	#------------------------------------------------#
 	def Reset(self):
 		if self.__Is_Ready:
-			self.__sendCommand(self.__cmd_Reset);
+			sent = self.__sendCommand(self.__cmd_Reset);
+			self.InvalidateCache();
+			return (True, '') if sent else (False, 'E1');
 		else:
-			print(' Not ready. Cannot send command', __cmd_Reset, 'to', self.__port, '(', sys.exc_info()[0], ')');
+			print(' Not ready. Cannot send command', self.__cmd_Reset, 'to', self.__port);
+			return (False, 'E0');
 
 	#------------------------------------------------#
 	#   Print welcome                                #
@@ -277,13 +791,15 @@ class HVControl:
 	#   Print status                                 #
 	#------------------------------------------------#
 	def PrintStatus(self):
-		time.sleep(0.3);
 		print(' ==============================================');
 		print('  Machine status at', datetime.datetime.now());
 		print(' ----------------------------------------------');
+		status = self.GetStatus();
 		print('  Ramp-up/down setting:\x1b[1;36m', self.GetRampUp(), 'V/s \x1b[0m / \x1b[1;36m', self.GetRampDown(), 'V/s\x1b[0m');
-		print('  Output setting:      \x1b[1;36m', self.GetVoltage(), 'V \x1b[0m / \x1b[1;36m', self.GetCurrent(), 'uA\x1b[0m');
-		print('  Measured real output:\x1b[1;36m', self.MeasureVoltage(), 'V \x1b[0m / \x1b[1;36m', self.MeasureCurrent(), 'uA\x1b[0m');
+		print('  Output setting:      \x1b[1;36m', status[0], 'V \x1b[0m / \x1b[1;36m', status[1], 'uA\x1b[0m');
+		print('  Measured real output:\x1b[1;36m', status[2], 'V \x1b[0m / \x1b[1;36m', status[3], 'uA\x1b[0m');
+		if self.__ramp is not None and not self.__ramp.Done():
+			print('  Ramping:             \x1b[1;36m', int(round(self.__ramp.GetSetting() or 0)), 'V \x1b[0m -> \x1b[1;36m', int(round(self.__ramp.GetTarget())), 'V\x1b[0m');
 		print(' ==============================================');
 
 	#------------------------------------------------#
@@ -314,11 +830,13 @@ class HVControl:
 	#------------------------------------------------#
 	def PrintDescription(self):
 		print('  0. Show this.');
-		print('  1. Set voltage in V unit.');
+		print('  1. Set voltage in V unit. It ramps at the ramp-up/down');
+		print('     rate in the background.');
 		print('  2. Set current in uA unit.');
 		print('  3. Set maximum high voltage increase rate.');
 		print('  4. Set maximum high voltage decrease rate.');
-		print('  5. Turn on output.');
+		print('  5. Turn on output. It ramps up from 0 V to the');
+		print('     voltage setting.');
 		print('  6. Turn off output.');
 		print('  7. Show the version of the digital interface.');
 		print('     But it seems not working now...');
@@ -332,6 +850,140 @@ class HVControl:
 		print('     be switched to the local mode.');
 
 
+################################################################################
+#   Class definition of HVRamp                                                 #
+################################################################################
+#   One voltage ramp of HVControl running in its own thread. Every
+# rampStep the setting goes one step closer to the target and voltage
+# and current are measured in the same cycle. The ramp stops and the
+# output is turned off when the current exceeds the trip limit.
+class HVRamp:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, hv, target):
+		self.__hv = hv;
+		self.__target = target;
+		self.__subscribers = [];
+		self.__cancel = threading.Event();
+		self.__setting = None;
+		# Result is (True, '') or (False, code) of HVControl
+		self.future = concurrent.futures.Future();
+
+	#------------------------------------------------#
+	#   Get notified of every step                   #
+	#------------------------------------------------#
+	#   subscriber(setting, voltage, current) with voltage and current
+	# as measured.
+	def Subscribe(self, subscriber):
+		self.__subscribers.append(subscriber);
+
+	#------------------------------------------------#
+	#   Start ramping                                #
+	#------------------------------------------------#
+	def Start(self):
+		thread = threading.Thread(target=self.__run);
+		thread.daemon = True;
+		thread.start();
+
+	#------------------------------------------------#
+	#   Trip limit in uA                             #
+	#------------------------------------------------#
+	#   With a current setting of 0 or none readable the limit is left
+	# to the supply.
+	def __tripLimit(self):
+		if self.__hv.tripCurrent > 0:
+			return float(self.__hv.tripCurrent);
+		try:
+			setting = float(self.__hv.GetCurrent());
+		except ValueError:
+			return float('inf');
+		if not setting > 0:
+			return float('inf');
+		return self.__hv.tripFraction * setting;
+
+	#------------------------------------------------#
+	#   Ramp                                         #
+	#------------------------------------------------#
+	#   The setting follows the time since start, so a slow cycle
+	# makes a bigger step rather than a slower ramp.
+	def __run(self):
+		try:
+			start = float(self.__hv.GetVoltage());
+		except:
+			self.future.set_result((False, 'E6'));
+			return;
+		limit = self.__tripLimit();
+		rate = float(self.__hv.GetRampUp() if self.__target >= start else self.__hv.GetRampDown());
+		direction = 1.0 if self.__target >= start else -1.0;
+		begin = time.monotonic();
+		k = 0;
+		while True:
+			setting = start + direction * rate * (time.monotonic() - begin);
+			if (setting - self.__target) * direction >= 0 or rate <= 0:
+				setting = self.__target;
+			self.__setting = setting;
+			self.__hv.SetVoltage(str(int(round(setting))));
+			vol, cur = self.__hv.GetMeasurement(0);
+			for subscriber in self.__subscribers:
+				subscriber(setting, vol, cur);
+			try:
+				if float(cur) > limit:
+					self.__hv.TurnOff();
+					print(' Over-current', cur, 'uA >', limit, 'uA at', int(round(setting)), 'V. Output is turned off.');
+					self.future.set_result((False, 'E5'));
+					return;
+			except ValueError:
+				self.future.set_result((False, 'E6'));
+				return;
+			if setting == self.__target:
+				self.future.set_result((True, ''));
+				return;
+			k += 1;
+			due = begin + k * self.__hv.rampStep;
+			if self.__cancel.wait(max(0.0, due - time.monotonic())):
+				self.future.set_result((False, 'E4'));
+				return;
+
+	#------------------------------------------------#
+	#   Stop ramping where it is                     #
+	#------------------------------------------------#
+	def Cancel(self):
+		self.__cancel.set();
+
+	#------------------------------------------------#
+	#   Get whether the ramp has finished            #
+	#------------------------------------------------#
+	def Done(self):
+		return self.future.done();
+
+	#------------------------------------------------#
+	#   Wait until the ramp has finished             #
+	#------------------------------------------------#
+	#   Returns (True, '') when the target is reached, otherwise
+	# (False, code), also (False, 'E4') if the future was cancelled. None
+	# if still ramping after timeout.
+	def Wait(self, timeout = None):
+		try:
+			return self.future.result(timeout);
+		except concurrent.futures.CancelledError:
+			return (False, 'E4');
+		except concurrent.futures.TimeoutError:
+			return None;
+
+	#------------------------------------------------#
+	#   Get setting of the last step                 #
+	#------------------------------------------------#
+	def GetSetting(self):
+		return self.__setting;
+
+	#------------------------------------------------#
+	#   Get target                                   #
+	#------------------------------------------------#
+	def GetTarget(self):
+		return self.__target;
+
+
 ################################################################################
 #   Class definition of MotorControl                                           #
 ################################################################################
@@ -345,6 +997,14 @@ class MotorControl:
 	__cmd_ReadError   =  0xB3;
 	__cmd_GetPosition =  0xA7;
 	__cmd_Stop        =  0xFF;
+	# Encoded commands without argument
+	__frames          = dict([(cmd, bytes([cmd])) for cmd in
+	                    (__cmd_Init, __cmd_ReadError, __cmd_GetPosition, __cmd_Stop)]);
+	# Names of the commands in stats
+	__names           = { __cmd_Init        : 'Init',
+	                      __cmd_ReadError   : 'ReadError',
+	                      __cmd_GetPosition : 'GetPosition',
+	                      __cmd_Stop        : 'Stop' };
 	# Parameters
 	__minSteps        =   140;
 	__maxSteps        =  3610;
@@ -361,12 +1021,26 @@ class MotorControl:
 	__port            =    '';
 	rate              =  9600;
 	accuracy          =     4;
+	positionTTL       =   0.0; # in s, how long a position is reused
+	calibration       =  None; # PositionCalibration, default if None
+	# Instrumentation
+	stats             =  None; # CommandStats, None for none
+	# Reconnect after a read or write failure
+	autoReconnect     = False;
+	# Opens the port, serial.Serial if None. Set on the instance.
+	transport         =  None;
 
 	#------------------------------------------------#
 	#   Initialize when constructed                  #
 	#------------------------------------------------#
 	def __init__(self, port):
 		self.__port = port;
+		self.__position = None;
+		self.__target = None;
+		self.__move = None;
+		# A request and its answer must not be split by another thread
+		self.__lock = threading.RLock();
+		self.__reconnector = Reconnector(self.__reconnect, self.__recovered);
 
 	#------------------------------------------------#
 	#   Get whether it is ready or not               #
@@ -380,33 +1054,144 @@ class MotorControl:
 	def Connect(self):
 		if not self.__Is_Ready:
 			try:
-				self.__serial = serial.Serial(self.__port, baudrate=self.rate, timeout=0.5, interCharTimeout=0.005);
-				#init connection sending 0xAA
-				self.__serial.write(serial.to_bytes([self.__cmd_Init]));
-				self.__Is_Ready = True;
+				self.__open();
+				if self.stats is not None:
+					self.stats.Event(self.__port, 'connect');
 			except:
-				self.__Is_Ready = False;
+				self.__close();
 				print( 'Failed to Init PololuJRK on', self.__port, '(', sys.exc_info()[0] , ')');
 				return (False, 'E0');
 		return (True, '');
 
+	def __open(self):
+		with self.__lock:
+			self.__serial = (self.transport or serial.Serial)(self.__port, baudrate=self.rate, timeout=0.5, interCharTimeout=0.005);
+			self.__writer = FrameWriter(self.__serial);
+			#init connection sending 0xAA
+			self.__writer.Write(self.__frames[self.__cmd_Init]);
+			self.__Is_Ready = True;
+
+	#------------------------------------------------#
+	#   Handle a lost connection                     #
+	#------------------------------------------------#
+	#   Requests fail at once with E0 until the connection is back.
+	def __fail(self):
+		self.__close();
+		if self.stats is not None:
+			self.stats.Event(self.__port, 'disconnect');
+		if self.autoReconnect:
+			self.__reconnector.Start();
+
+	#   Closes the port quietly, also one that was just opened.
+	def __close(self):
+		self.__Is_Ready = False;
+		try:
+			self.__serial.close();
+		except:
+			pass;
+
+	#------------------------------------------------#
+	#   Reconnect and restore target                 #
+	#------------------------------------------------#
+	#   Opening sends 0xAA again. The target of a move still going on
+	# is sent again so that the move goes on.
+	#   A port opened in a failed attempt is closed again before the
+	# next one.
+	def __reconnect(self):
+		try:
+			self.__open();
+		except:
+			self.__close();
+			return False;
+		self.__position = None;
+		move = self.__move;
+		if move is not None and not move.Done() and not self.SetTarget(move.GetTarget())[0]:
+			self.__close();
+			return False;
+		print( 'Reconnected with', self.__port);
+		return True;
+
+	def __recovered(self, duration):
+		if self.stats is not None:
+			self.stats.Event(self.__port, 'reconnect');
+			self.stats.Command(self.__port, 'Reconnect', duration);
+
+	#------------------------------------------------#
+	#   Get whether it is reconnecting               #
+	#------------------------------------------------#
+	def IsReconnecting(self):
+		return self.__reconnector.IsRunning();
+
+	#------------------------------------------------#
+	#   Wait until the connection is back            #
+	#------------------------------------------------#
+	#   Returns IsReady() at the end.
+	def WaitReady(self, timeout = None):
+		deadline = None if timeout is None else time.monotonic() + timeout;
+		while not self.__Is_Ready and self.__reconnector.IsRunning():
+			if deadline is not None and time.monotonic() >= deadline:
+				break;
+			time.sleep(0.05);
+		return self.__Is_Ready;
+
+	#------------------------------------------------#
+	#   Stop reconnecting                            #
+	#------------------------------------------------#
+	def StopReconnect(self):
+		self.__reconnector.Stop();
+
+	#------------------------------------------------#
+	#   Get reconnection record                      #
+	#------------------------------------------------#
+	#   (attempts, [times to recover in s]).
+	def GetRecoveries(self):
+		return (self.__reconnector.attempts, self.__reconnector.GetRecoveries());
+
 	#------------------------------------------------#
 	#   Send command                                 #
 	#------------------------------------------------#
 	def __sendCommand(self, cmd, argument = []):
 		if self.__Is_Ready:
+			stats = self.stats;
+			if stats is not None:
+				start = time.perf_counter();
 			try:
-				# Send command byte
-				self.__serial.write(serial.to_bytes([cmd]));
-				# If arguments, attach them
-				for byte in argument:
-					self.__serial.write(serial.to_bytes([byte]));
+				if len(argument) == 0 and cmd in self.__frames:
+					frame = self.__frames[cmd];
+				else:
+					# Command byte followed by its arguments
+					frame = bytearray(1 + len(argument));
+					frame[0] = cmd;
+					frame[1:] = argument;
+					frame = bytes(frame);
+				self.__writer.Write(frame);
 			except:
-				self.__Is_Ready = False;
 				print( 'error sending command:', hex(cmd), 'to', self.__port, '(', sys.exc_info()[0] , ')');
+				self.__fail();
+				if stats is not None:
+					stats.Command(self.__port, self.__name(cmd), time.perf_counter() - start, 'E1');
 				return (False, 'E1');
+			# Queries are recorded with their answer
+			if stats is not None and cmd not in (self.__cmd_GetPosition, self.__cmd_ReadError):
+				stats.Command(self.__port, self.__name(cmd), time.perf_counter() - start, '', len(frame));
 		return (True, '');
 
+	def __name(self, cmd):
+		if cmd & 0xE0 == self.__cmd_MoveTo:
+			return 'SetTarget';
+		return self.__names.get(cmd, hex(cmd));
+
+	#------------------------------------------------#
+	#   Record a query in stats                      #
+	#------------------------------------------------#
+	#   An answer shorter than nBytes is a timeout, E4.
+	def __record(self, cmd, start, ans, nBytes):
+		if not ans[0]:
+			code, read = ans[1], 0;
+		else:
+			code, read = ('' if len(ans[1]) == nBytes else 'E4'), len(ans[1]);
+		self.stats.Command(self.__port, self.__name(cmd), time.perf_counter() - start, code, 1, read);
+
 	#------------------------------------------------#
 	#   Read answer                                  #
 	#------------------------------------------------#
@@ -418,58 +1203,129 @@ class MotorControl:
 				return (True, ans);
 			except:
 				print( 'error reading from', self.__port, '(', sys.exc_info()[0] , ')');
-				self.__Is_Ready = False;
+				self.__fail();
 				return (False, 'E1');
+		return (False, 'E0');
 
 	#------------------------------------------------#
 	#   Stop motor                                   #
 	#------------------------------------------------#
-	def MotorStop(self):
+	#   A running move is cancelled and finishes with E6. move is the
+	# MotorMove stopping the motor itself, it is not cancelled.
+	def MotorStop(self, move = None):
+		running = self.__move;
+		if running is not None and running is not move and not running.Done():
+			running.Cancel(True);
 		if self.__Is_Ready:
 			return self.__sendCommand(self.__cmd_Stop);
+		return (False, 'E0');
+
+	#------------------------------------------------#
+	#   Get range of position in steps               #
+	#------------------------------------------------#
+	def GetRange(self):
+		return (self.__minSteps, self.__maxSteps);
+
+	#------------------------------------------------#
+	#   Send target position without waiting         #
+	#------------------------------------------------#
+	def SetTarget(self, pos):
+		if not self.__Is_Ready or pos < self.__minSteps or pos > self.__maxSteps:
+			return (False, 'E2');
+		# the lower 5 bits are attached to the command byte
+		cmd = self.__cmd_MoveTo + (pos & 0x1F);
+		# the upper 7 bits are sent as the argument
+		arg = [(pos >> 5) & 0x7F];
+		ans = self.__sendCommand(cmd, arg);
+		if ans[0]:
+			self.__target = pos;
+		return ans;
 
 	#------------------------------------------------#
 	#   move position to input value                 #
 	#------------------------------------------------#
 	def MoveTo(self, pos):
-		if self.__Is_Ready and pos >= self.__minSteps and pos <=  self.__maxSteps:
-			# the lower 5 bits are attached to the command byte
-			cmd = self.__cmd_MoveTo + (pos & 0x1F);
-			# the upper 7 bits are sent as the argument
-			arg = [(pos >> 5) & 0x7F];
-			ans = self.__sendCommand(cmd, arg);
-		if not ans[0]: # error
-			return ans;
-		while True:
-			time.sleep(1);
-			currentPos = self.GetPosition();
-			#print( currentPos);
-			if not currentPos[0]: # error
-				return currentPos;
-			if currentPos[0] and abs(pos - currentPos[1]) <= self.accuracy:
-				break;
-		return self.MotorStop();
+		return self.StartMove(pos).Wait();
+
+	#------------------------------------------------#
+	#   Start moving and return at once              #
+	#------------------------------------------------#
+	#   Returns a MotorMove. subscriber(step, position in mm) is called
+	# with every position read on the way. A move still running is
+	# superseded, it finishes with E7 and the motor goes on to the new
+	# target.
+	def StartMove(self, pos, timeout = 0, subscriber = None):
+		move = MotorMove(self, pos, timeout);
+		if subscriber is not None:
+			move.Subscribe(subscriber);
+		previous = self.__move;
+		if previous is not None:
+			previous.Supersede();
+		self.__move = move;
+		move.Start();
+		return move;
+
+	#------------------------------------------------#
+	#   Get running move                             #
+	#------------------------------------------------#
+	#   The last MotorMove started, None if there was none.
+	def GetMove(self):
+		return self.__move;
 
 	#------------------------------------------------#
 	#   Get current position                         #
 	#------------------------------------------------#
-	def GetPosition(self):
-		if self.__Is_Ready:
-			#request position
-			self.__sendCommand(self.__cmd_GetPosition);
-		#read answer
-		ans = self.__readAns(2);
-		# convert answer
-		if ans[0]:
-			#print( 'raw:', ans[1][0], ans[1][1] );
-			if len(ans[1]):
-				step = (ans[1][0] & 0xff) + ((ans[1][1] & 0xff) << 8);
-#				return (True, (ans[1][0] & 0xff) +  ((ans[1][1] & 0xff) << 8));
-				return (True, step, self.LinearCal(step));
+	#   A position younger than maxAge (positionTTL if None) is
+	# answered from the cache without a request.
+	def GetPosition(self, maxAge = None):
+		if maxAge is None:
+			maxAge = self.positionTTL;
+		position = self.__position;
+		if maxAge > 0 and position is not None and time.monotonic() - position[1] <= maxAge:
+			return position[0];
+		with self.__lock:
+			position = self.__position;
+			if maxAge > 0 and position is not None and time.monotonic() - position[1] <= maxAge:
+				return position[0];
+			stats = self.stats;
+			if stats is not None:
+				start = time.perf_counter();
+			if self.__Is_Ready:
+				#request position
+				self.__sendCommand(self.__cmd_GetPosition);
+			#read answer
+			ans = self.__readAns(2);
+			if stats is not None:
+				self.__record(self.__cmd_GetPosition, start, ans, 2);
+			# convert answer
+			if ans[0]:
+				#print( 'raw:', ans[1][0], ans[1][1] );
+				if len(ans[1]) == 2:
+					step = (ans[1][0] & 0xff) + ((ans[1][1] & 0xff) << 8);
+#					return (True, (ans[1][0] & 0xff) +  ((ans[1][1] & 0xff) << 8));
+					self.__position = ((True, step, round(self.StepToMm(step), 1)), time.monotonic());
+					return self.__position[0];
+				else:
+					return (False, 'E4'); # connection lost?
 			else:
-				return (False, 'E4'); # connection lost?
-		else:
-			return (False, ans[1]);
+				return (False, ans[1]);
+
+	#------------------------------------------------#
+	#   Get cached position without any request      #
+	#------------------------------------------------#
+	#   (answer of GetPosition, age in s) or None if there is none.
+	def GetCachedPosition(self):
+		position = self.__position;
+		if position is None:
+			return None;
+		return (position[0], time.monotonic() - position[1]);
+
+	#------------------------------------------------#
+	#   Get last target sent                         #
+	#------------------------------------------------#
+	#   None before the first move.
+	def GetTarget(self):
+		return self.__target;
 
 	#------------------------------------------------#
 	#   Let's go home                                #
@@ -481,11 +1337,17 @@ class MotorControl:
 	#   Get status                                   #
 	#------------------------------------------------#
 	def Status(self):
-		if self.__Is_Ready:
-			#request status
-			self.__sendCommand(self.__cmd_ReadError);
-		# read answer
-		ans = self.__readAns(2);
+		with self.__lock:
+			stats = self.stats;
+			if stats is not None:
+				start = time.perf_counter();
+			if self.__Is_Ready:
+				#request status
+				self.__sendCommand(self.__cmd_ReadError);
+			# read answer
+			ans = self.__readAns(2);
+			if stats is not None:
+				self.__record(self.__cmd_ReadError, start, ans, 2);
 		if ( ans[0] ):
 			#print( 'raw:', ans[1][0], ans[1][1]);
 			statusMsg = (ans[1][0] & 0xff) +  ((ans[1][1] & 0xff) << 8);
@@ -506,10 +1368,35 @@ class MotorControl:
 	# According to my measurement...
 	#   @  140 -> 349 mm + 191.5 mm + 493 mm + 275 mm = 1308.5 mm
 	#   @ 3610 -> 480 mm + 191.5 mm + 493 mm + 275 mm = 1439.5 mm
+	#   Only for display, use StepToMm to compute with. More points
+	# go into calibration, see GEMSlowControlCalibration.
 	def LinearCal(self, step):
-		pos = (1439.5-1308.5)/(3610.0-140.0)*(float(step)-140.0) + 1308.5;
-		pos = round(pos, 1);
-		return str(pos) + ' mm';
+		return '%.1f mm' % self.StepToMm(step);
+
+	#------------------------------------------------#
+	#   Position in mm of steps                      #
+	#------------------------------------------------#
+	#   A number or a numpy array of them.
+	def StepToMm(self, step):
+		return self.GetCalibration().StepToMm(step);
+
+	#------------------------------------------------#
+	#   Nearest steps of positions in mm             #
+	#------------------------------------------------#
+	#   An int or a numpy array of them.
+	def MmToStep(self, mm):
+		return self.GetCalibration().MmToNearestStep(mm);
+
+	#------------------------------------------------#
+	#   Get calibration                              #
+	#------------------------------------------------#
+	#   numpy is only loaded once a position is converted, so that
+	# scripts not needing it start fast.
+	def GetCalibration(self):
+		if self.calibration is None:
+			from GEMSlowControlCalibration import PositionCalibration
+			self.calibration = PositionCalibration();
+		return self.calibration;
 
 	#------------------------------------------------#
 	#   Print welcome                                #
@@ -544,12 +1431,15 @@ class MotorControl:
 	#   Print status                                 #
 	#------------------------------------------------#
 	def PrintStatus(self):
-		time.sleep(0.3);
 		print(' ==============================================');
 		print('  Machine status at', datetime.datetime.now());
 		print(' ----------------------------------------------');
 		print('  Motor status:    \x1b[1;36m', self.Status(), '\x1b[0m');
-		print('  Current position:\x1b[1;36m', self.GetPosition(), '\x1b[0m');
+		ans = self.GetPosition();
+		if ans[0]:
+			print('  Current position:\x1b[1;36m', ans[1], 'step,', self.LinearCal(ans[1]), '\x1b[0m');
+		else:
+			print('  Current position:\x1b[1;36m', ans, '\x1b[0m');
 		print(' ==============================================');
 
 	#------------------------------------------------#
@@ -579,3 +1469,176 @@ class MotorControl:
 		print('    maintained.');
 		print(' 3. Quit this script with reset. Motor will be')
 		print('    set to home position before quit.');
+
+
+################################################################################
+#   Class definition of MotorMove                                              #
+################################################################################
+#   One move of MotorControl running in its own thread. The position is
+# read often when the actuator is about to arrive and rarely when it is
+# far away, based on the speed seen so far.
+class MotorMove:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	minInterval    =  0.02; # in s
+	maxInterval    =   0.5; # in s
+	firstInterval  =   0.1; # in s, before the speed is known
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, motor, pos, timeout = 0):
+		self.__motor = motor;
+		self.__target = pos;
+		self.__timeout = timeout;
+		self.__subscribers = [];
+		self.__cancel = threading.Event();
+		self.__superseded = False;
+		self.__stopped = False; # by MotorControl.MotorStop
+		# A stop must not come after the target of a new move
+		self.__stopLock = threading.Lock();
+		self.__position = None;
+		# Result is what MotorControl.MoveTo returns. Cancelling the
+		# future stops the motor like Cancel().
+		self.future = concurrent.futures.Future();
+		self.future.add_done_callback(self.__onDone);
+
+	#------------------------------------------------#
+	#   Get notified of positions                    #
+	#------------------------------------------------#
+	def Subscribe(self, subscriber):
+		self.__subscribers.append(subscriber);
+
+	#------------------------------------------------#
+	#   Start moving                                 #
+	#------------------------------------------------#
+	def Start(self):
+		ans = self.__motor.SetTarget(self.__target);
+		if not ans[0]: # error
+			self.__finish(ans);
+			return;
+		thread = threading.Thread(target=self.__follow);
+		thread.daemon = True;
+		thread.start();
+
+	#------------------------------------------------#
+	#   Follow the motor until it arrives            #
+	#------------------------------------------------#
+	def __follow(self):
+		start = time.monotonic();
+		interval = self.firstInterval;
+		last = None;
+		while not self.__cancel.wait(interval):
+			currentPos = self.__motor.GetPosition(0);
+			now = time.monotonic();
+			if not currentPos[0]: # error
+				if not self.__motor.IsReconnecting():
+					self.__finish(currentPos);
+					return;
+				# Go on once the connection is back
+				if self.__timeout > 0 and now - start > self.__timeout:
+					self.__finish((False, 'E5'));
+					return;
+				interval = self.firstInterval;
+				last = None;
+				continue;
+			# Another target was sent, the motor is not ours to stop
+			if self.__motor.GetTarget() != self.__target:
+				self.__superseded = True;
+				break;
+			self.__position = currentPos[1:];
+			for subscriber in self.__subscribers:
+				subscriber(currentPos[1], currentPos[2]);
+			distance = abs(self.__target - currentPos[1]);
+			if distance <= self.__motor.accuracy:
+				self.__finish(self.__stop());
+				return;
+			if self.__timeout > 0 and now - start > self.__timeout:
+				self.__finish(self.__stop((False, 'E5')));
+				return;
+			# Check again at half of the expected time of arrival
+			interval = self.firstInterval;
+			if last is not None and now > last[0] and currentPos[1] != last[1]:
+				speed = abs(currentPos[1] - last[1]) / (now - last[0]);
+				interval = 0.5 * max(0, distance - self.__motor.accuracy) / speed;
+			interval = min(self.maxInterval, max(self.minInterval, interval));
+			last = (now, currentPos[1]);
+		self.__finish(self.__stop((False, 'E6')));
+
+	#   Stops the motor and returns result, the answer of the stop if
+	# None. Superseded it is left running and E7 returned.
+	def __stop(self, result = None):
+		with self.__stopLock:
+			if self.__superseded:
+				return (False, 'E7');
+			if self.__stopped:
+				return (False, 'E6');
+			ans = self.__motor.MotorStop(self);
+		return ans if result is None else result;
+
+	#------------------------------------------------#
+	#   Set result unless cancelled before           #
+	#------------------------------------------------#
+	def __finish(self, result):
+		try:
+			self.future.set_result(result);
+		except concurrent.futures.InvalidStateError:
+			pass;
+
+	def __onDone(self, future):
+		if future.cancelled():
+			self.__cancel.set();
+
+	#------------------------------------------------#
+	#   Stop the motor where it is                   #
+	#------------------------------------------------#
+	#   Finishes with E6. stopped tells that the stop was sent already.
+	def Cancel(self, stopped = False):
+		if stopped:
+			self.__stopped = True;
+		self.__cancel.set();
+
+	#------------------------------------------------#
+	#   Give way to a new move                       #
+	#------------------------------------------------#
+	#   Finishes with E7 and leaves the motor running.
+	def Supersede(self):
+		with self.__stopLock:
+			self.__superseded = True;
+		self.__cancel.set();
+
+	#------------------------------------------------#
+	#   Get whether the move has finished            #
+	#------------------------------------------------#
+	def Done(self):
+		return self.future.done();
+
+	#------------------------------------------------#
+	#   Wait until the move has finished             #
+	#------------------------------------------------#
+	#   Returns the same as MotorControl.MoveTo, (False, 'E5') after
+	# the timeout of the move, (False, 'E6') if cancelled and (False,
+	# 'E7') if superseded by another move. A cancelled future counts as
+	# cancelled too. None if it is still moving after timeout of this
+	# wait.
+	def Wait(self, timeout = None):
+		try:
+			return self.future.result(timeout);
+		except concurrent.futures.CancelledError:
+			return (False, 'E6');
+		except concurrent.futures.TimeoutError:
+			return None;
+
+	#------------------------------------------------#
+	#   Get last position read                       #
+	#------------------------------------------------#
+	#   (step, position) or None before the first read.
+	def GetPosition(self):
+		return self.__position;
+
+	#------------------------------------------------#
+	#   Get target                                   #
+	#------------------------------------------------#
+	def GetTarget(self):
+		return self.__target;
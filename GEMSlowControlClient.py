@@ -0,0 +1,158 @@
+################################################################################
+#   Client of the GEM slow control server.                                     #
+# Requests and answers are JSON, one per line. A request is                    #
+#   {"id": 1, "dev": "hv0", "cmd": "MeasureVoltage", "args": []}               #
+# and its answer                                                               #
+#   {"id": 1, "ok": true, "result": "1000.2"}                                  #
+# or {"id": 1, "ok": false, "error": "..."}. A JSON list of requests is a      #
+# batch and is answered by a list in the same order.                           #
+#   {"cmd": "Subscribe", "args": [names, maxSize, every]} turns the connection #
+# into a stream of {"time": ..., "dev": ..., "values": [...]} lines.           #
+#                                                                              #
+#   This module only needs the standard library so that short scripts start    #
+# fast.                                                                        #
+################################################################################
+
+
+import json
+import socket
+
+
+# Where the server listens if nothing else is given
+DefaultAddress = '/tmp/gemslowcontrol.sock';
+
+
+################################################################################
+#   Parse address                                                              #
+################################################################################
+#   'host:port' is TCP, anything else a Unix socket path. Returns
+# (family, address) for socket.
+def ParseAddress(address):
+	if isinstance(address, tuple):
+		return (socket.AF_INET, address);
+	if ':' in address and not address.startswith('/'):
+		host, port = address.rsplit(':', 1);
+		return (socket.AF_INET, (host, int(port)));
+	return (socket.AF_UNIX, address);
+
+
+################################################################################
+#   Class definition of SlowControlClient                                      #
+################################################################################
+class SlowControlClient:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	timeout        =    30; # in s, per answer
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, address = DefaultAddress):
+		self.__address = address;
+		self.__socket = None;
+		self.__id = 0;
+
+	#------------------------------------------------#
+	#   Get connection                               #
+	#------------------------------------------------#
+	def Connect(self):
+		if self.__socket is not None:
+			return True;
+		family, address = ParseAddress(self.__address);
+		try:
+			self.__socket = socket.socket(family, socket.SOCK_STREAM);
+			self.__socket.settimeout(self.timeout);
+			self.__socket.connect(address);
+			self.__file = self.__socket.makefile('rb');
+		except OSError as error:
+			print(' Failed to connect with server at', self.__address, '(', error, ')');
+			self.__socket = None;
+			return False;
+		return True;
+
+	#------------------------------------------------#
+	#   Close connection                             #
+	#------------------------------------------------#
+	def Close(self):
+		if self.__socket is not None:
+			self.__file.close();
+			self.__socket.close();
+			self.__socket = None;
+
+	#------------------------------------------------#
+	#   Send a request and read its answer           #
+	#------------------------------------------------#
+	def __exchange(self, request):
+		if not self.Connect():
+			return None;
+		try:
+			self.__socket.sendall(json.dumps(request, separators=(',', ':')).encode() + b'\n');
+			line = self.__file.readline();
+		except OSError as error:
+			print(' Lost server at', self.__address, '(', error, ')');
+			self.Close();
+			return None;
+		if len(line) == 0:
+			print(' Server at', self.__address, 'closed the connection.');
+			self.Close();
+			return None;
+		return json.loads(line);
+
+	def __request(self, dev, cmd, args):
+		self.__id += 1;
+		return {'id' : self.__id, 'dev' : dev, 'cmd' : cmd, 'args' : list(args)};
+
+	@staticmethod
+	def __result(answer):
+		if answer is None:
+			return (False, 'No answer from server');
+		if answer.get('ok'):
+			return (True, answer.get('result'));
+		return (False, answer.get('error'));
+
+	#------------------------------------------------#
+	#   Call a command of a device                   #
+	#------------------------------------------------#
+	#   Returns (True, result) or (False, error).
+	def Call(self, dev, cmd, *args):
+		return self.__result(self.__exchange(self.__request(dev, cmd, args)));
+
+	#------------------------------------------------#
+	#   Call several commands in one exchange        #
+	#------------------------------------------------#
+	#   calls is a list of (dev, cmd, args...). Returns one
+	# (True, result) or (False, error) per call, in order.
+	def Batch(self, calls):
+		answers = self.__exchange([self.__request(call[0], call[1], call[2:]) for call in calls]);
+		if not isinstance(answers, list):
+			return [self.__result(None) for call in calls];
+		return [self.__result(answer) for answer in answers];
+
+	#------------------------------------------------#
+	#   Stream live readings                         #
+	#------------------------------------------------#
+	#   Yields (timestamp, device, values) as the server polls them.
+	# names limits the devices, None for all. The server keeps at most
+	# maxSize readings for this client and only each every-th of a
+	# device. Uses a connection of its own.
+	def Subscribe(self, names = None, maxSize = 100, every = 1):
+		stream = SlowControlClient(self.__address);
+		if not stream.Connect():
+			return;
+		try:
+			for answer in stream.__stream({'id' : 0, 'dev' : 'server', 'cmd' : 'Subscribe', 'args' : [names, maxSize, every]}):
+				if 'ok' in answer:
+					if not answer['ok']:
+						print(' Cannot subscribe:', answer.get('error'));
+						return;
+					continue;
+				yield (answer['time'], answer['dev'], tuple(answer['values']));
+		finally:
+			stream.Close();
+
+	def __stream(self, request):
+		self.__socket.settimeout(None);
+		self.__socket.sendall(json.dumps(request, separators=(',', ':')).encode() + b'\n');
+		for line in self.__file:
+			yield json.loads(line);
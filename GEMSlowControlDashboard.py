@@ -0,0 +1,418 @@
+################################################################################
+#   Live terminal dashboard of GEM slow control.                               #
+# A poller reads every HV supply and the actuator in background threads and    #
+# keeps the text of each field of the screen. Commands run in a thread of      #
+# their own, so typing, polling and a move or ramp never wait for each other.  #
+# The screen is redrawn field by field, only where the text changed.           #
+#                                                                              #
+#   poller = DashboardPoller(HVManager('hv.conf'), MotorControl(port));        #
+#   poller.Start();                                                            #
+#   curses.wrapper(Dashboard(poller).Run);                                     #
+################################################################################
+
+
+import curses
+import datetime
+import queue
+import sys
+import threading
+import time
+
+
+################################################################################
+#   Class definition of DashboardPoller                                        #
+################################################################################
+class DashboardPoller:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	period         =   0.5; # in s, between readings of each device
+	statusEvery    =    10; # motor error flags are read every this many periods
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   hv is an HVControl, an HVManager or None, motor a MotorControl
+	# or None.
+	def __init__(self, hv = None, motor = None, period = 0.5):
+		if hv is None:
+			self.__devices = {};
+		elif hasattr(hv, 'GetNames'):
+			self.__devices = dict([(name, hv.GetDevice(name)) for name in hv.GetNames()]);
+		else:
+			self.__devices = { 'hv' : hv };
+		self.__names = list(hv.GetNames()) if hasattr(hv, 'GetNames') else list(self.__devices);
+		self.__motor = motor;
+		self.period = float(period);
+		self.__fields = {};
+		self.__version = 0;
+		self.__lock = threading.Lock();
+		self.__stop = threading.Event();
+		self.__commands = queue.Queue();
+		self.__threads = [];
+
+	#------------------------------------------------#
+	#   Get devices                                  #
+	#------------------------------------------------#
+	def GetNames(self):
+		return list(self.__names);
+
+	def GetDevice(self, name):
+		return self.__devices[name];
+
+	def GetMotor(self):
+		return self.__motor;
+
+	#------------------------------------------------#
+	#   Start polling                                #
+	#------------------------------------------------#
+	#   One thread per supply and one for the actuator, each on its own
+	# port, plus one for commands.
+	def Start(self):
+		self.__stop.clear();
+		targets = [(self.__pollHV, (name,)) for name in self.__names];
+		if self.__motor is not None:
+			targets.append((self.__pollMotor, ()));
+		targets.append((self.__runCommands, ()));
+		for target, args in targets:
+			thread = threading.Thread(target=target, args=args);
+			thread.daemon = True;
+			thread.start();
+			self.__threads.append(thread);
+
+	#------------------------------------------------#
+	#   Stop polling                                 #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__stop.set();
+		self.__commands.put(None);
+		for thread in self.__threads:
+			thread.join();
+		self.__threads = [];
+
+	#------------------------------------------------#
+	#   Set the text of a field                      #
+	#------------------------------------------------#
+	def Set(self, key, text):
+		with self.__lock:
+			if self.__fields.get(key) != text:
+				self.__fields[key] = text;
+				self.__version += 1;
+
+	#------------------------------------------------#
+	#   Get texts of all fields                      #
+	#------------------------------------------------#
+	#   (version, {key: text}). The version changes with every change
+	# of a text, so nothing needs to be compared while it stays.
+	def GetFields(self):
+		with self.__lock:
+			return (self.__version, dict(self.__fields));
+
+	#------------------------------------------------#
+	#   Poll one supply                              #
+	#------------------------------------------------#
+	#   A running ramp measures by itself, its readings are reused.
+	def __pollHV(self, name):
+		device = self.__devices[name];
+		while not self.__stop.is_set():
+			start = time.monotonic();
+			if device.IsReady():
+				status = device.GetStatus(self.period);
+				self.Set((name, 'state'), 'ready' if '' not in status else 'error');
+				for field, value in zip(('setV', 'setI', 'measV', 'measI'), status):
+					self.Set((name, field), value);
+			else:
+				self.Set((name, 'state'), 'reconnecting' if device.IsReconnecting() else 'offline');
+			ramp = device.GetRamp();
+			if ramp is not None and not ramp.Done():
+				self.Set((name, 'ramp'), '%d -> %d V' % (round(ramp.GetSetting() or 0), round(ramp.GetTarget())));
+			elif ramp is not None:
+				result = ramp.Wait(0);
+				self.Set((name, 'ramp'), 'at %d V' % round(ramp.GetTarget()) if result[0] else 'stopped %s' % result[1]);
+			self.Set((name, 'rates'), '%s/%s V/s' % (device.GetRampUp(), device.GetRampDown()));
+			self.__stop.wait(max(0.0, self.period - (time.monotonic() - start)));
+
+	#------------------------------------------------#
+	#   Poll the actuator                            #
+	#------------------------------------------------#
+	#   A running move reads the position by itself, it is reused.
+	def __pollMotor(self):
+		motor = self.__motor;
+		count = 0;
+		while not self.__stop.is_set():
+			start = time.monotonic();
+			if motor.IsReady():
+				if count % max(1, self.statusEvery) == 0:
+					status = motor.Status();
+					self.Set(('motor', 'state'), status[1][1]);
+				count += 1;
+				ans = motor.GetPosition(self.period);
+				if ans[0]:
+					self.Set(('motor', 'step'), '%d' % ans[1]);
+					self.Set(('motor', 'mm'), '%.1f mm' % ans[2]);
+				else:
+					self.Set(('motor', 'step'), 'error %s' % (ans[1],));
+			else:
+				self.Set(('motor', 'state'), 'reconnecting' if motor.IsReconnecting() else 'offline');
+			move = motor.GetMove();
+			if move is not None and not move.Done():
+				self.Set(('motor', 'move'), 'moving to %d' % move.GetTarget());
+			elif move is not None:
+				result = move.Wait(0);
+				self.Set(('motor', 'move'), 'at %d' % move.GetTarget() if result[0] else 'stopped %s' % (result[1],));
+			self.__stop.wait(max(0.0, self.period - (time.monotonic() - start)));
+
+	#------------------------------------------------#
+	#   Run a command in the background              #
+	#------------------------------------------------#
+	#   function(*args) runs in the command thread, its outcome goes to
+	# the 'message' field.
+	def Do(self, description, function, *args):
+		self.Set('message', '%s ...' % description);
+		self.__commands.put((description, function, args));
+
+	def __runCommands(self):
+		while not self.__stop.is_set():
+			command = self.__commands.get();
+			if command is None:
+				break;
+			description, function, args = command;
+			try:
+				result = function(*args);
+			except Exception as error:
+				self.Set('message', '%s failed: %s' % (description, error));
+				continue;
+			if isinstance(result, tuple) and len(result) > 0 and result[0] is False:
+				self.Set('message', '%s failed: %s' % (description, ' '.join([str(value) for value in result[1:]])));
+			else:
+				self.Set('message', '%s done' % description);
+
+
+################################################################################
+#   Class definition of Printed                                                #
+################################################################################
+#   Stands in for sys.stdout while the dashboard runs and shows the last
+# line printed in the 'message' field.
+class Printed:
+	def __init__(self, poller):
+		self.__poller = poller;
+
+	def write(self, text):
+		lines = [line.strip() for line in text.split('\n') if line.strip() != ''];
+		if len(lines) > 0:
+			self.__poller.Set('message', lines[-1]);
+		return len(text);
+
+	def flush(self):
+		pass;
+
+
+################################################################################
+#   Class definition of Dashboard                                              #
+################################################################################
+#   Draws the fields of a DashboardPoller and reads a command line.
+# Commands, NAME being a supply or 'all' and left out with one supply:
+#   v NAME VOLT     ramp voltage         i NAME UA      set current
+#   on NAME         output on            off NAME       output off
+#   up NAME V/S     ramp-up rate         down NAME V/S  ramp-down rate
+#   m STEP          move to step         mm MM          move to position
+#   stop            stop the actuator    home           move home
+#   q               quit
+class Dashboard:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	refresh        =   0.1; # in s, longest time between redraws
+	# Columns of a supply: field, title, width
+	__hvColumns    = (('state', 'State',        13),
+	                  ('setV',  'Set V',        10),
+	                  ('setI',  'Set uA',       10),
+	                  ('measV', 'Meas. V',      10),
+	                  ('measI', 'Meas. uA',     10),
+	                  ('rates', 'Up/down',      12),
+	                  ('ramp',  'Ramp',         20));
+	__motorColumns = (('state', 'State',        23),
+	                  ('step',  'Step',         10),
+	                  ('mm',    'Position',     12),
+	                  ('move',  'Move',         20));
+	__nameWidth    =    10;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, poller):
+		self.__poller = poller;
+		self.__line = '';
+		self.__drawn = {};
+		self.__version = None;
+
+	#------------------------------------------------#
+	#   Run until quit                               #
+	#------------------------------------------------#
+	#   To be called by curses.wrapper.
+	def Run(self, screen):
+		# What the drivers print would scramble the screen
+		stdout = sys.stdout;
+		sys.stdout = Printed(self.__poller);
+		try:
+			self.__run(screen);
+		finally:
+			sys.stdout = stdout;
+
+	def __run(self, screen):
+		self.__screen = screen;
+		curses.curs_set(1);
+		screen.timeout(int(self.refresh * 1000));
+		self.__layout();
+		while True:
+			self.__draw();
+			key = screen.getch();
+			if key == -1:
+				continue;
+			if key in (curses.KEY_ENTER, 10, 13):
+				line = self.__line.strip();
+				self.__line = '';
+				if line in ('q', 'quit', 'exit'):
+					break;
+				if line != '':
+					self.__execute(line.split());
+			elif key in (curses.KEY_BACKSPACE, 127, 8):
+				self.__line = self.__line[:-1];
+			elif key == curses.KEY_RESIZE:
+				self.__layout();
+			elif 32 <= key < 127:
+				self.__line += chr(key);
+			self.__put(self.__inputRow, 0, '> ' + self.__line, self.__width);
+
+	#------------------------------------------------#
+	#   Place the fields                             #
+	#------------------------------------------------#
+	#   Static text is drawn once here, fields get (row, column, width).
+	def __layout(self):
+		screen = self.__screen;
+		screen.erase();
+		self.__drawn = {};
+		self.__version = None;
+		self.__width = max(1, screen.getmaxyx()[1] - 1);
+		self.__cells = { 'clock' : (0, 40, 30), 'message' : None };
+		self.__put(0, 0, ' GEM slow control', 40, curses.A_BOLD);
+		row = 2;
+		names = self.__poller.GetNames();
+		if len(names) > 0:
+			row = self.__header(row, 'Supply', self.__hvColumns);
+			for name in names:
+				self.__row(row, name, name, self.__hvColumns);
+				row += 1;
+			row += 1;
+		if self.__poller.GetMotor() is not None:
+			row = self.__header(row, 'Actuator', self.__motorColumns);
+			self.__row(row, 'motor', 'motor', self.__motorColumns);
+			row += 2;
+		self.__cells['message'] = (row, 1, self.__width - 1);
+		self.__inputRow = row + 1;
+		self.__put(row + 3, 0, ' v/i/on/off/up/down NAME [VALUE], m STEP, mm MM, stop, home, q', self.__width, curses.A_DIM);
+		self.__put(self.__inputRow, 0, '> ' + self.__line, self.__width);
+
+	def __header(self, row, title, columns):
+		column = self.__nameWidth + 1;
+		self.__put(row, 1, title, self.__nameWidth, curses.A_UNDERLINE);
+		for field, text, width in columns:
+			self.__put(row, column, text, width - 1, curses.A_UNDERLINE);
+			column += width;
+		return row + 1;
+
+	def __row(self, row, key, name, columns):
+		self.__put(row, 1, name, self.__nameWidth);
+		column = self.__nameWidth + 1;
+		for field, text, width in columns:
+			self.__cells[(key, field)] = (row, column, width - 1);
+			column += width;
+
+	#------------------------------------------------#
+	#   Redraw what changed                          #
+	#------------------------------------------------#
+	def __draw(self):
+		self.__poller.Set('clock', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'));
+		version, fields = self.__poller.GetFields();
+		if version != self.__version:
+			self.__version = version;
+			for key, text in fields.items():
+				if self.__drawn.get(key) == text or key not in self.__cells:
+					continue;
+				self.__drawn[key] = text;
+				row, column, width = self.__cells[key];
+				self.__put(row, column, text, width);
+		self.__screen.move(self.__inputRow, min(self.__width, 2 + len(self.__line)));
+		self.__screen.refresh();
+
+	def __put(self, row, column, text, width, attributes = 0):
+		height, columns = self.__screen.getmaxyx();
+		width = min(width, columns - 1 - column);
+		if row >= height or width <= 0:
+			return;
+		try:
+			self.__screen.addstr(row, column, str(text)[:width].ljust(width), attributes);
+		except curses.error:
+			pass;
+
+	#------------------------------------------------#
+	#   Execute a command line                       #
+	#------------------------------------------------#
+	def __execute(self, words):
+		poller = self.__poller;
+		command, words = words[0], words[1:];
+		motor = poller.GetMotor();
+		try:
+			if command in ('m', 'mm', 'stop', 'home'):
+				if motor is None:
+					raise ValueError('no actuator');
+				if command == 'm':
+					poller.Do('move to %s' % words[0], self.__move, motor, int(words[0]));
+				elif command == 'mm':
+					poller.Do('move to %s mm' % words[0], self.__move, motor, motor.MmToStep(float(words[0])));
+				elif command == 'stop':
+					poller.Do('stop', motor.MotorStop);
+				else:
+					poller.Do('home', self.__move, motor, motor.GetRange()[0]);
+				return;
+			need = { 'v' : 1, 'i' : 1, 'up' : 1, 'down' : 1, 'on' : 0, 'off' : 0 };
+			if command not in need:
+				raise ValueError('unknown command %s' % command);
+			names = poller.GetNames();
+			if len(words) == need[command] and len(names) == 1:
+				words = names[:1] + words;
+			if len(words) != need[command] + 1:
+				raise ValueError('%s takes NAME%s' % (command, ' VALUE' if need[command] else ''));
+			targets = names if words[0] == 'all' else [words[0]];
+			for name in targets:
+				if name not in names:
+					raise ValueError('no supply %s' % name);
+			for name in targets:
+				device = poller.GetDevice(name);
+				if command == 'v':
+					poller.Do('%s ramp to %s V' % (name, words[1]), device.RampVoltage, float(words[1]));
+				elif command == 'i':
+					poller.Do('%s current %s uA' % (name, words[1]), device.SetCurrent, words[1]);
+				elif command == 'up':
+					poller.Do('%s ramp-up %s V/s' % (name, words[1]), device.SetRampUp, words[1]);
+				elif command == 'down':
+					poller.Do('%s ramp-down %s V/s' % (name, words[1]), device.SetRampDown, words[1]);
+				elif command == 'on':
+					poller.Do('%s on' % name, device.TurnOn);
+				else:
+					poller.Do('%s off' % name, device.TurnOff);
+		except (ValueError, IndexError) as error:
+			poller.Set('message', 'not done: %s' % (error if str(error) != '' else 'missing value'));
+
+	#   Moves go on in their own thread, the command only starts them.
+	# A move still running is cancelled first.
+	@staticmethod
+	def __move(motor, step):
+		low, high = motor.GetRange();
+		if step < low or step > high:
+			return (False, 'step %d outside %d to %d' % (step, low, high));
+		move = motor.GetMove();
+		if move is not None and not move.Done():
+			move.Cancel();
+		motor.StartMove(step);
+		return (True,);
@@ -0,0 +1,368 @@
+################################################################################
+#   Interlock of the GEM HV supplies.                                          #
+# Every supply has a thread reading only MEAS:CURR? as fast as the supply      #
+# answers, at most once per period. Each reading is checked against rules;     #
+# on a violation the affected supplies are made safe at once and the          #
+# readings leading up to it are written to the log. The time from detection   #
+# to the command being written is kept as the reaction latency. A supply that  #
+# gives no reading for too long raises an alert, or trips if so set.           #
+#                                                                              #
+#   interlock = Interlock(manager, [CurrentLimit(50), CurrentSpike(100)]);    #
+#   interlock.Start();                                                         #
+################################################################################
+
+
+import collections
+import math
+import sys
+import threading
+import time
+import traceback
+
+
+################################################################################
+#   Rules                                                                      #
+################################################################################
+#   Check(history) looks at the readings (time, current in uA) of one
+# supply, newest last, and returns the reason of a violation or None.
+
+#------------------------------------------------#
+#   Current above an absolute limit              #
+#------------------------------------------------#
+class CurrentLimit:
+	def __init__(self, limit):
+		self.limit = float(limit);
+
+	def Check(self, history):
+		if history[-1][1] > self.limit:
+			return 'current %.3f uA above %.3f uA' % (history[-1][1], self.limit);
+		return None;
+
+#------------------------------------------------#
+#   Current rising faster than a rate            #
+#------------------------------------------------#
+#   rate in uA/s between two readings. Small steps below minStep are
+# noise and ignored.
+class CurrentSpike:
+	def __init__(self, rate, minStep = 0.0):
+		self.rate = float(rate);
+		self.minStep = float(minStep);
+
+	def Check(self, history):
+		if len(history) < 2:
+			return None;
+		(t0, i0), (t1, i1) = history[-2], history[-1];
+		if t1 <= t0 or i1 - i0 <= self.minStep:
+			return None;
+		rate = (i1 - i0) / (t1 - t0);
+		if rate > self.rate:
+			return 'current rising %.1f uA/s above %.1f uA/s' % (rate, self.rate);
+		return None;
+
+#------------------------------------------------#
+#   Repeated excursions above a level            #
+#------------------------------------------------#
+#   Short discharges that each stay below the other rules, count times
+# within window s.
+class RepeatedTrips:
+	def __init__(self, level, count, window):
+		self.level = float(level);
+		self.count = int(count);
+		self.window = float(window);
+
+	def Check(self, history):
+		crossings = 0;
+		above = False;
+		first = history[-1][0] - self.window;
+		for t, current in history:
+			if current > self.level and not above and t >= first:
+				crossings += 1;
+			above = current > self.level;
+		if crossings >= self.count:
+			return '%d excursions above %.3f uA within %.1f s' % (crossings, self.level, self.window);
+		return None;
+
+
+################################################################################
+#   Class definition of Interlock                                              #
+################################################################################
+class Interlock:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	period         =  0.05; # in s, shortest time between readings
+	bufferSize     =   200; # readings kept per supply for the log, more
+	                         # if the window of a rule needs them
+	# A supply is blind after this many failed readings in a row or this
+	# long without a reading, 0 for no limit
+	maxFailures    =    10;
+	maxAge         =   0.0; # in s
+	blindAction    = 'alert'; # 'alert' or 'trip' when blind
+	__Is_Running   = False;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   hv is an HVControl or an HVManager, rules a list of rules for
+	# every supply or a dictionary of name to such a list. action is
+	#   'off'  output off
+	#   'zero' voltage setting 0, the supply ramps down by itself
+	#   'ramp' ramp down to 0 V at the ramp-down rate
+	# scope 'supply' acts on the supply that violated a rule, 'all' on
+	# every supply, as for a stack sharing a discharge.
+	def __init__(self, hv, rules, action = 'off', scope = 'supply', log = sys.stderr):
+		if action not in ('off', 'zero', 'ramp'):
+			raise ValueError('Action must be off, zero or ramp, not %s' % action);
+		if scope not in ('supply', 'all'):
+			raise ValueError('Scope must be supply or all, not %s' % scope);
+		if hasattr(hv, 'GetNames'):
+			self.__devices = dict([(name, hv.GetDevice(name)) for name in hv.GetNames()]);
+		else:
+			self.__devices = { 'hv' : hv };
+		if not isinstance(rules, dict):
+			rules = dict([(name, rules) for name in self.__devices]);
+		self.__rules = rules;
+		self.action = action;
+		self.scope = scope;
+		self.__log = log;
+		self.__lock = threading.Lock();
+		self.__history = dict([(name, collections.deque(maxlen=self.bufferSize)) for name in self.__devices]);
+		self.__tripped = {};
+		self.__blind = {};
+		self.__subscribers = [];
+		self.__alertSubscribers = [];
+		self.__latencies = [];
+		self.__threads = [];
+		self.stats = None; # CommandStats to record latencies in
+
+	#------------------------------------------------#
+	#   Get notified of trips                        #
+	#------------------------------------------------#
+	#   subscriber(name, reason, latency in s).
+	def Subscribe(self, subscriber):
+		self.__subscribers.append(subscriber);
+
+	#------------------------------------------------#
+	#   Get notified of alerts                       #
+	#------------------------------------------------#
+	#   subscriber(name, reason), once when a supply goes blind and for
+	# an error in its watch.
+	def SubscribeAlerts(self, subscriber):
+		self.__alertSubscribers.append(subscriber);
+
+	#------------------------------------------------#
+	#   Start watching                               #
+	#------------------------------------------------#
+	#   The history of each supply is sized from bufferSize, period and
+	# the windows of its rules as they are now.
+	def Start(self):
+		self.__Is_Running = True;
+		for name in self.__devices:
+			size = self.__historySize(name);
+			if self.__history[name].maxlen != size:
+				self.__history[name] = collections.deque(self.__history[name], maxlen=size);
+		for name in self.__devices:
+			thread = threading.Thread(target=self.__watch, args=(name,));
+			thread.daemon = True;
+			thread.start();
+			self.__threads.append(thread);
+
+	#   Readings are at least period apart, so a window of w s holds up
+	# to w / period + 1 of them.
+	def __historySize(self, name):
+		window = max([0.0] + [getattr(rule, 'window', 0.0) for rule in self.__rules.get(name, [])]);
+		if window <= 0:
+			return self.bufferSize;
+		if self.period <= 0:
+			raise ValueError('A period of 0 gives no bound on the readings within a window of %.1f s' % window);
+		return max(self.bufferSize, int(math.ceil(window / self.period)) + 1);
+
+	#------------------------------------------------#
+	#   Stop watching                                #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__Is_Running = False;
+		for thread in self.__threads:
+			thread.join();
+		self.__threads = [];
+
+	#------------------------------------------------#
+	#   Watch one supply                             #
+	#------------------------------------------------#
+	#   A failed reading or an error in the loop counts as no reading.
+	# Errors are reported, a repeated one only once, and the watch goes
+	# on.
+	def __watch(self, name):
+		device = self.__devices[name];
+		history = self.__history[name];
+		failures = 0;
+		last = time.monotonic();
+		error = None;
+		while self.__Is_Running:
+			start = time.monotonic();
+			try:
+				current = device.MeasureCurrent(0);
+				detected = time.monotonic();
+				try:
+					current = float(current);
+				except ValueError:
+					current = None;
+				if current is not None:
+					failures = 0;
+					last = detected;
+					error = None;
+					self.__blind.pop(name, None);
+					history.append((detected, current));
+					if name not in self.__tripped:
+						for rule in self.__rules.get(name, []):
+							reason = rule.Check(history);
+							if reason is not None:
+								self.Trip(name, reason, detected);
+								break;
+				else:
+					failures += 1;
+					self.__checkBlind(name, failures, last);
+			except Exception:
+				failures += 1;
+				details = traceback.format_exc();
+				if details.strip().splitlines()[-1] != error:
+					error = details.strip().splitlines()[-1];
+					self.__alert(name, 'error in watch: %s' % error, details);
+				try:
+					self.__checkBlind(name, failures, last);
+				except Exception:
+					pass;
+			rest = self.period - (time.monotonic() - start);
+			if rest > 0:
+				time.sleep(rest);
+
+	#   Alerts or trips once until the next good reading.
+	def __checkBlind(self, name, failures, last):
+		age = time.monotonic() - last;
+		if self.maxFailures > 0 and failures >= self.maxFailures:
+			reason = 'no reading in %d tries' % failures;
+		elif self.maxAge > 0 and age >= self.maxAge:
+			reason = 'no reading for %.1f s' % age;
+		else:
+			return;
+		if name in self.__blind:
+			return;
+		self.__blind[name] = reason;
+		if self.blindAction == 'trip' and name not in self.__tripped:
+			self.Trip(name, reason);
+		else:
+			self.__alert(name, reason);
+
+	#------------------------------------------------#
+	#   Report an alert                              #
+	#------------------------------------------------#
+	#   details, e.g. a traceback, go to the log as comment lines.
+	def __alert(self, name, reason, details = ''):
+		if self.__log is not None:
+			lines = ['# ALERT %s at %.6f: %s\n' % (name, time.time(), reason)] + ['#   %s\n' % line for line in details.splitlines()];
+			self.__log.write(''.join(lines));
+			self.__log.flush();
+		for subscriber in self.__alertSubscribers:
+			subscriber(name, reason);
+
+	#------------------------------------------------#
+	#   Make supplies safe                           #
+	#------------------------------------------------#
+	#   detected is the time.monotonic() of the violation, now if None.
+	# Can be called by hand as an emergency stop.
+	def Trip(self, name, reason, detected = None):
+		if detected is None:
+			detected = time.monotonic();
+		with self.__lock:
+			names = list(self.__devices) if self.scope == 'all' else [name];
+			names = [other for other in names if other not in self.__tripped or other == name];
+			for other in names:
+				self.__tripped[other] = reason if other == name else 'with ' + name;
+		# The commands go out first, book-keeping afterwards
+		ramps = [];
+		for other in names:
+			ramps.append(self.__act(self.__devices[other]));
+		latency = time.monotonic() - detected;
+		self.__latencies.append(latency);
+		if self.stats is not None:
+			self.stats.Command('interlock', 'Trip', latency);
+		for device, ramp in zip([self.__devices[other] for other in names], ramps):
+			# A cancelled ramp may have sent one more setting
+			if ramp is not None:
+				ramp.Wait();
+				if self.action != 'off':
+					self.__act(device);
+		self.__write(name, reason, names, latency);
+		for subscriber in self.__subscribers:
+			subscriber(name, reason, latency);
+
+	def __act(self, device):
+		ramp = device.GetRamp();
+		if ramp is not None and not ramp.Done():
+			ramp.Cancel();
+		else:
+			ramp = None;
+		if self.action == 'off':
+			device.TurnOff();
+		elif self.action == 'zero':
+			device.SetVoltage('0');
+		elif ramp is None:
+			device.RampVoltage(0);
+		return ramp;
+
+	#------------------------------------------------#
+	#   Log a trip with the readings before it       #
+	#------------------------------------------------#
+	def __write(self, name, reason, names, latency):
+		if self.__log is None:
+			return;
+		offset = time.time() - time.monotonic();
+		lines = ['# TRIP %s at %.6f: %s, action %s on %s, latency %.3f ms\n'
+		         % (name, time.time(), reason, self.action, ' '.join(names), latency * 1e3)];
+		for other in names:
+			for t, current in list(self.__history[other]):
+				lines.append('%.6f %s %.3f\n' % (t + offset, other, current));
+		self.__log.write(''.join(lines));
+		self.__log.flush();
+
+	#------------------------------------------------#
+	#   Get tripped supplies                         #
+	#------------------------------------------------#
+	#   {name: reason}.
+	def GetTripped(self):
+		return dict(self.__tripped);
+
+	#------------------------------------------------#
+	#   Get supplies without readings                #
+	#------------------------------------------------#
+	#   {name: reason}.
+	def GetBlind(self):
+		return dict(self.__blind);
+
+	#------------------------------------------------#
+	#   Arm again after a trip                       #
+	#------------------------------------------------#
+	#   Outputs and settings are left to the operator. None for all.
+	def Reset(self, name = None):
+		with self.__lock:
+			for other in (list(self.__tripped) if name is None else [name]):
+				self.__tripped.pop(other, None);
+				self.__history[other].clear();
+
+	#------------------------------------------------#
+	#   Get reaction latencies                       #
+	#------------------------------------------------#
+	#   In s from the reading that violated a rule to the commands
+	# being written, one per trip.
+	def GetLatencies(self):
+		return list(self.__latencies);
+
+	#------------------------------------------------#
+	#   Get reading rate                             #
+	#------------------------------------------------#
+	#   Readings per second of a supply over its buffer.
+	def GetRate(self, name):
+		history = list(self.__history[name]);
+		if len(history) < 2 or history[-1][0] <= history[0][0]:
+			return 0.0;
+		return (len(history) - 1) / (history[-1][0] - history[0][0]);
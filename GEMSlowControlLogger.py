@@ -0,0 +1,293 @@
+################################################################################
+#   Continuous logger of GEM slow control readings.                            #
+# The port stays open and samples are taken on a fixed time grid, so a late    #
+# sample does not shift the following ones. With a schedule (see               #
+# GEMSlowControlScheduler) the grid spacing follows how fast the readings      #
+# change. ScheduledLogger instead reads every supply on its own schedule       #
+# within a shared budget of serial queries. MotorLogger logs the position of   #
+# the actuator the same way.                                                   #
+################################################################################
+
+
+import sys
+import threading
+import time
+import math
+
+
+################################################################################
+#   Class definition of HVLogger                                               #
+################################################################################
+class HVLogger:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	period         =   1.0; # in s
+	statsInterval  =    60; # in s, 0 for no periodic report
+	schedule       =  None; # AdaptiveSchedule, None for a fixed period
+	clock          = time.time; # gives the timestamps, e.g. Replay.Time
+	__Is_Running   = False;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   hv is an HVControl, an HVManager or anything else with
+	# GetMeasurement, e.g. a MotorMeasurement. output is a text stream,
+	# store a SlowControlStore with matching columns. Either can be
+	# None.
+	def __init__(self, hv, output = sys.stdout, period = 1.0, store = None):
+		self.__hv = hv;
+		self.__output = output;
+		self.__store = store;
+		self.period = float(period);
+		self.ResetStats();
+
+	#------------------------------------------------#
+	#   Reset statistics                             #
+	#------------------------------------------------#
+	def ResetStats(self):
+		self.__samples = 0;
+		self.__errors  = 0;
+		self.__missed  = 0;
+		self.__first   = 0.0;
+		self.__last    = 0.0;
+		self.__lateSum = 0.0;
+		self.__lateSq  = 0.0;
+		self.__lateMax = 0.0;
+
+	#------------------------------------------------#
+	#   Take one sample and write it                 #
+	#------------------------------------------------#
+	#   Returns the record (timestamp, voltage, current, ...). The
+	# timestamp is the middle of the query like in GetHV.py.
+	def Sample(self):
+		start = self.clock();
+		values = self.__hv.GetMeasurement();
+		timestamp = (start + self.clock()) / 2;
+		if '' in values:
+			self.__errors += 1;
+		self.Write(timestamp, *values);
+		return (timestamp,) + tuple(values);
+
+	#------------------------------------------------#
+	#   Write one record                             #
+	#------------------------------------------------#
+	def Write(self, timestamp, *values):
+		if self.__output is not None:
+			self.__output.write('%.3f %s\n' % (timestamp, ' '.join(values)));
+			self.__output.flush();
+		if self.__store is not None:
+			self.__store.Append(timestamp, *values);
+
+	#------------------------------------------------#
+	#   Run until stopped or count/duration reached  #
+	#------------------------------------------------#
+	#   Each sample is due one period after the slot of the previous
+	# one. When a sample takes longer than a period the slots already
+	# passed are counted as missed and skipped instead of being taken
+	# in a burst. With a schedule the period is its interval after
+	# each sample. Period 0 samples as fast as the supplies answer.
+	def Run(self, count = 0, duration = 0):
+		self.__Is_Running = True;
+		start = time.monotonic();
+		nextReport = start + self.statsInterval;
+		due = start;
+		period = self.period;
+		while self.__Is_Running:
+			now = time.monotonic();
+			if due > now:
+				time.sleep(due - now);
+				now = time.monotonic();
+			self.__account(now, now - due);
+			record = self.Sample();
+			if self.schedule is not None:
+				period = self.schedule.Update(record[0], record[1:]);
+			due += period;
+			if count > 0 and self.__samples >= count:
+				break;
+			if duration > 0 and now - start >= duration:
+				break;
+			now = time.monotonic();
+			late = now - due;
+			if period > 0 and late >= period:
+				skipped = int(late / period);
+				self.__missed += skipped;
+				due += skipped * period;
+			elif period <= 0:
+				due = now;
+			if self.statsInterval > 0 and now >= nextReport:
+				self.PrintStats(sys.stderr);
+				nextReport = now + self.statsInterval;
+		self.__Is_Running = False;
+
+	#------------------------------------------------#
+	#   Stop running                                 #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__Is_Running = False;
+
+	#------------------------------------------------#
+	#   Book-keeping of one sample                   #
+	#------------------------------------------------#
+	def __account(self, now, late):
+		if self.__samples == 0:
+			self.__first = now;
+		self.__last = now;
+		self.__samples += 1;
+		self.__lateSum += late;
+		self.__lateSq  += late * late;
+		self.__lateMax  = max(self.__lateMax, late);
+
+	#------------------------------------------------#
+	#   Get statistics                               #
+	#------------------------------------------------#
+	#   Rate is achieved samples per second. Jitter is the spread of how
+	# late each sample started against its slot, both in s.
+	def GetStats(self):
+		n = self.__samples;
+		rate = (n - 1) / (self.__last - self.__first) if n > 1 and self.__last > self.__first else 0.0;
+		mean = self.__lateSum / n if n > 0 else 0.0;
+		jitter = math.sqrt(max(0.0, self.__lateSq / n - mean * mean)) if n > 0 else 0.0;
+		return { 'samples' : n,
+		         'errors'  : self.__errors,
+		         'missed'  : self.__missed,
+		         'rate'    : rate,
+		         'jitter'  : jitter,
+		         'maxLate' : self.__lateMax };
+
+	#------------------------------------------------#
+	#   Print statistics                             #
+	#------------------------------------------------#
+	def PrintStats(self, output = sys.stdout):
+		stats = self.GetStats();
+		period = self.schedule.GetInterval() if self.schedule is not None else self.period;
+		output.write(' Samples: %d, errors: %d, missed: %d, rate: %.3f Hz (target %.3f Hz), jitter: %.2f ms, max. late: %.2f ms\n'
+		             % (stats['samples'], stats['errors'], stats['missed'], stats['rate'], 1.0 / period if period > 0 else float('inf'),
+		                stats['jitter'] * 1e3, stats['maxLate'] * 1e3));
+		output.flush();
+
+
+################################################################################
+#   Class definition of MotorMeasurement                                       #
+################################################################################
+#   Reads a MotorControl the way HVLogger reads a supply: GetMeasurement
+# gives (step, position in mm) as text, '' for a failed reading.
+class MotorMeasurement:
+	def __init__(self, motor):
+		self.__motor = motor;
+
+	def GetMeasurement(self, maxAge = 0):
+		ans = self.__motor.GetPosition(maxAge);
+		if not ans[0]:
+			return ('', '');
+		return ('%d' % ans[1], '%.1f' % ans[2]);
+
+
+################################################################################
+#   Logger of the actuator position                                            #
+################################################################################
+#   An HVLogger of a MotorMeasurement, for a MotorStore.
+def MotorLogger(motor, output = sys.stdout, period = 1.0, store = None):
+	return HVLogger(MotorMeasurement(motor), output, period, store);
+
+
+################################################################################
+#   Class definition of ScheduledLogger                                        #
+################################################################################
+#   Each supply of an HVManager, or the one HVControl, is read by an
+# AdaptiveScheduler on its own schedule, and all of them share budget
+# queries per second. Every reading writes a record of the same columns
+# as HVLogger with the last values of the other supplies, from the time
+# each supply has been read once.
+class ScheduledLogger:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	statsInterval  =    60; # in s, 0 for no periodic report
+	clock          = time.time; # gives the timestamps, e.g. Replay.Time
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   resolution, minInterval and maxInterval are those of HVSchedule
+	# for every supply.
+	def __init__(self, hv, budget, output = sys.stdout, store = None, resolution = (1.0, 0.1), minInterval = 0.1, maxInterval = 10.0):
+		from GEMSlowControlScheduler import AdaptiveScheduler, HVSchedule
+		self.__output = output;
+		self.__store = store;
+		names = hv.GetNames() if hasattr(hv, 'GetNames') else [''];
+		self.__index = dict([(name, i) for i, name in enumerate(names)]);
+		self.__values = [None] * (2 * len(names));
+		self.__lock = threading.Lock();
+		self.__done = threading.Event();
+		self.__samples = 0;
+		self.__errors = 0;
+		self.__count = 0;
+		self.__scheduler = AdaptiveScheduler(budget);
+		for name in names:
+			device = hv.GetDevice(name) if name != '' else hv;
+			# A reading is two queries
+			self.__scheduler.AddChannel(name, self.__source(device), HVSchedule(device, resolution[0], resolution[1], minInterval, maxInterval), 2);
+		self.__scheduler.Subscribe(self.__reading);
+
+	#   Failed readings are written as such, like HVLogger does.
+	@staticmethod
+	def __source(device):
+		return lambda: device.GetMeasurement(0);
+
+	def __reading(self, timestamp, name, values):
+		with self.__lock:
+			i = 2 * self.__index[name];
+			self.__values[i:i+2] = values;
+			self.__samples += 1;
+			if '' in values:
+				self.__errors += 1;
+			if None in self.__values:
+				return;
+			if self.__output is not None:
+				self.__output.write('%.3f %s\n' % (timestamp, ' '.join(self.__values)));
+				self.__output.flush();
+			if self.__store is not None:
+				self.__store.Append(timestamp, *self.__values);
+			if self.__count > 0 and self.__samples >= self.__count:
+				self.__done.set();
+
+	#------------------------------------------------#
+	#   Run until stopped or count/duration reached  #
+	#------------------------------------------------#
+	#   count is readings of all supplies together.
+	def Run(self, count = 0, duration = 0):
+		self.__count = count;
+		self.__done.clear();
+		start = time.monotonic();
+		self.__scheduler.clock = self.clock;
+		self.__scheduler.Start();
+		try:
+			while not self.__done.is_set():
+				wait = self.statsInterval if self.statsInterval > 0 else 1.0;
+				if duration > 0:
+					wait = min(wait, max(0.0, start + duration - time.monotonic()));
+				if self.__done.wait(wait):
+					break;
+				if duration > 0 and time.monotonic() - start >= duration:
+					break;
+				if self.statsInterval > 0:
+					self.PrintStats(sys.stderr);
+		finally:
+			self.__scheduler.Stop();
+
+	#------------------------------------------------#
+	#   Stop running                                 #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__done.set();
+
+	#------------------------------------------------#
+	#   Print statistics                             #
+	#------------------------------------------------#
+	def PrintStats(self, output = sys.stdout):
+		with self.__lock:
+			output.write(' Samples: %d, errors: %d\n' % (self.__samples, self.__errors));
+		for name, stats in sorted(self.__scheduler.GetStats().items()):
+			output.write('  %-10s samples: %d, interval: %.3f s, waited for budget: %.3f s, errors: %d\n' % (name if name != '' else 'supply', stats[0], stats[1], stats[2], stats[3]));
+		output.flush();
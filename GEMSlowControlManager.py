@@ -0,0 +1,161 @@
+################################################################################
+#   Manager of several HV supplies.                                            #
+# Every electrode of the GEM stack has its own Heinzinger supply on its own    #
+# serial port. The manager talks to all of them at the same time, one thread   #
+# per supply, so a polling cycle costs as much as the slowest supply.          #
+#                                                                              #
+#   A configuration file has one 'name port' pair per line, e.g.               #
+#     # name   port                                                            #
+#     drift    /dev/ttyUSB0                                                    #
+#     gem1     /dev/ttyUSB1                                                    #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl
+import concurrent.futures
+import time
+
+
+################################################################################
+#   Read configuration file                                                    #
+################################################################################
+#   Returns a list of (name, port).
+def LoadConfig(path):
+	config = [];
+	with open(path) as f:
+		for line in f:
+			words = line.split('#')[0].split();
+			if len(words) == 0:
+				continue;
+			if len(words) != 2:
+				raise ValueError('Expected "name port" in %s but got "%s"' % (path, line.strip()));
+			config.append((words[0], words[1]));
+	return config;
+
+
+################################################################################
+#   Class definition of HVManager                                              #
+################################################################################
+class HVManager:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   config is a configuration file, a list of (name, port) or a
+	# dictionary of name to port.
+	def __init__(self, config):
+		if isinstance(config, str):
+			config = LoadConfig(config);
+		elif isinstance(config, dict):
+			config = list(config.items());
+		self.__names = [name for name, port in config];
+		self.__devices = dict([(name, HVControl(port)) for name, port in config]);
+		self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(config)));
+		self.spread = 0.0;
+
+	#------------------------------------------------#
+	#   Get names in configuration order             #
+	#------------------------------------------------#
+	def GetNames(self):
+		return list(self.__names);
+
+	#------------------------------------------------#
+	#   Get one supply                               #
+	#------------------------------------------------#
+	def GetDevice(self, name):
+		return self.__devices[name];
+
+	#------------------------------------------------#
+	#   Call a method of every supply at once        #
+	#------------------------------------------------#
+	#   Returns a dictionary of name to what the method returned.
+	def ForAll(self, method, *args):
+		futures = [self.__executor.submit(getattr(self.__devices[name], method), *args) for name in self.__names];
+		return dict(zip(self.__names, [future.result() for future in futures]));
+
+	#------------------------------------------------#
+	#   Call a method per supply with its own value  #
+	#------------------------------------------------#
+	#   values is a dictionary of name to argument.
+	def ForEach(self, method, values):
+		names = [name for name in self.__names if name in values];
+		futures = [self.__executor.submit(getattr(self.__devices[name], method), values[name]) for name in names];
+		return dict(zip(names, [future.result() for future in futures]));
+
+	#------------------------------------------------#
+	#   Get connection of all supplies               #
+	#------------------------------------------------#
+	def Connect(self):
+		return all(self.ForAll('Connect').values());
+
+	#------------------------------------------------#
+	#   Get whether all of them are ready            #
+	#------------------------------------------------#
+	def IsReady(self):
+		return all([self.__devices[name].IsReady() for name in self.__names]);
+
+	#------------------------------------------------#
+	#   Set voltages                                 #
+	#------------------------------------------------#
+	def SetVoltages(self, voltages):
+		return self.ForEach('SetVoltage', voltages);
+
+	#------------------------------------------------#
+	#   Set currents                                 #
+	#------------------------------------------------#
+	def SetCurrents(self, currents):
+		return self.ForEach('SetCurrent', currents);
+
+	#------------------------------------------------#
+	#   Ramp voltages at the same time               #
+	#------------------------------------------------#
+	#   Returns a dictionary of name to HVRamp.
+	def RampVoltages(self, voltages):
+		return self.ForEach('RampVoltage', voltages);
+
+	#------------------------------------------------#
+	#   Wait for ramps                               #
+	#------------------------------------------------#
+	#   Returns a dictionary of name to result of the ramp. A failing
+	# ramp does not stop the others.
+	def WaitRamps(self, ramps, timeout = None):
+		return dict([(name, ramps[name].Wait(timeout)) for name in ramps]);
+
+	#------------------------------------------------#
+	#   Measure all supplies once                    #
+	#------------------------------------------------#
+	#   Returns (timestamp, {name : (voltage, current)}). The timestamp
+	# is the middle of the cycle and spread is how long it took, so
+	# every reading lies within timestamp +- spread/2.
+	def Poll(self):
+		start = time.time();
+		readings = self.ForAll('GetMeasurement');
+		stop = time.time();
+		self.spread = stop - start;
+		return ((start + stop) / 2, readings);
+
+	#------------------------------------------------#
+	#   Get full status of all supplies              #
+	#------------------------------------------------#
+	def GetStatus(self):
+		return self.ForAll('GetStatus');
+
+	#------------------------------------------------#
+	#   Measure all supplies as one flat record      #
+	#------------------------------------------------#
+	#   (voltage, current) of every supply in configuration order,
+	# matching GetFields(). Used by HVLogger.
+	def GetMeasurement(self):
+		timestamp, readings = self.Poll();
+		return tuple([value for name in self.__names for value in readings[name]]);
+
+	#------------------------------------------------#
+	#   Names of the values of GetMeasurement        #
+	#------------------------------------------------#
+	def GetFields(self):
+		return tuple([name + '.' + field for name in self.__names for field in ('voltage', 'current')]);
+
+	#------------------------------------------------#
+	#   Stop the worker threads                      #
+	#------------------------------------------------#
+	def Close(self):
+		self.__executor.shutdown(wait=True);
@@ -0,0 +1,299 @@
+################################################################################
+#   Compressing recorder of GEM slow control readings.                         #
+# Sits between a reader and a SlowControlStore and only passes on the records  #
+# needed to rebuild every reading within a tolerance per column:               #
+#   'door'     swinging door, rebuilt by linear interpolation between records  #
+#   'deadband' a record whenever a value leaves the band of the last one,      #
+#              rebuilt by holding the last record                              #
+# A failed reading (NaN) is always kept. Readings are rebuilt with Align of    #
+# GEMSlowControlAlign, mode 'interp' for 'door' and 'last' for 'deadband'.     #
+#   A recorded store can be packed for archiving: timestamps exact to a given  #
+# resolution as varints of their differences, values as they are. A packed     #
+# file reads back as a PackedStore, which takes the place of the store.        #
+#                                                                              #
+#   store = DeadbandRecorder(HVStore('hv.gsc'), (0.5, 0.05));                  #
+#   HVLogger(HV, None, 1.0, store).Run();                                      #
+#   PackStore(HVStore('hv.gsc'), 'hv.gsp');                                    #
+################################################################################
+
+
+from GEMSlowControlStorage import SlowControlStore, ToFloat
+import math
+import numpy
+import os
+import struct
+
+
+################################################################################
+#   Class definition of DeadbandRecorder                                       #
+################################################################################
+class DeadbandRecorder:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	maxInterval    =  60.0; # in s, longest time without a record
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   store takes Append(timestamp, *values), e.g. a SlowControlStore.
+	# tolerances holds one value per column, 0 to keep every change.
+	def __init__(self, store, tolerances, mode = 'door'):
+		if mode not in ('door', 'deadband'):
+			raise ValueError('Mode must be door or deadband, not %s' % mode);
+		self.__store = store;
+		self.__tolerances = [float(tolerance) for tolerance in tolerances];
+		self.mode = mode;
+		self.__anchor = None;  # last record passed on
+		self.__previous = None; # last reading, not passed on yet
+		self.__offered = 0;
+		self.__recorded = 0;
+
+	#------------------------------------------------#
+	#   Offer a reading                              #
+	#------------------------------------------------#
+	#   Same call as SlowControlStore.Append.
+	def Append(self, timestamp, *values):
+		if len(values) != len(self.__tolerances):
+			print(' Expected', len(self.__tolerances), 'values but got', len(values));
+			return False;
+		reading = (float(timestamp), [ToFloat(value) for value in values]);
+		self.__offered += 1;
+		if self.__anchor is None or self.__hasNan(reading) or self.__hasNan(self.__anchor):
+			# Failed readings and the ones next to them are kept as they are
+			self.__passPrevious();
+			return self.__pass(reading);
+		if reading[0] - self.__anchor[0] > self.maxInterval:
+			self.__passPrevious();
+			if reading[0] - self.__anchor[0] > self.maxInterval:
+				return self.__pass(reading);
+		if self.mode == 'deadband':
+			return self.__deadband(reading);
+		return self.__door(reading);
+
+	#------------------------------------------------#
+	#   Deadband around the last record              #
+	#------------------------------------------------#
+	def __deadband(self, reading):
+		for value, anchor, tolerance in zip(reading[1], self.__anchor[1], self.__tolerances):
+			if abs(value - anchor) > tolerance:
+				return self.__pass(reading);
+		return True;
+
+	#------------------------------------------------#
+	#   Swinging door from the last record           #
+	#------------------------------------------------#
+	#   The window holds per column the range of slopes from the last
+	# record that keeps every reading since within tolerance. The line
+	# to a new reading is fine while its slope lies in all windows.
+	# Otherwise the previous reading, whose line was fine, is recorded
+	# and the door starts again from there.
+	def __door(self, reading):
+		elapsed = reading[0] - self.__anchor[0];
+		if elapsed <= 0:
+			return self.__pass(reading);
+		if self.__previous is not None:
+			for value, anchor, window in zip(reading[1], self.__anchor[1], self.__window):
+				slope = (value - anchor) / elapsed;
+				if slope < window[0] or slope > window[1]:
+					self.__passPrevious();
+					return self.__door(reading);
+		self.__narrow(reading);
+		self.__previous = reading;
+		return True;
+
+	def __narrow(self, reading):
+		elapsed = reading[0] - self.__anchor[0];
+		bands = [((value - tolerance - anchor) / elapsed, (value + tolerance - anchor) / elapsed)
+		         for value, anchor, tolerance in zip(reading[1], self.__anchor[1], self.__tolerances)];
+		if self.__previous is None:
+			self.__window = bands;
+		else:
+			self.__window = [(max(window[0], band[0]), min(window[1], band[1]))
+			                 for window, band in zip(self.__window, bands)];
+
+	#------------------------------------------------#
+	#   Pass records on to the store                 #
+	#------------------------------------------------#
+	def __pass(self, reading):
+		self.__anchor = reading;
+		self.__previous = None;
+		self.__recorded += 1;
+		return self.__store.Append(reading[0], *reading[1]);
+
+	def __passPrevious(self):
+		if self.__previous is not None:
+			self.__pass(self.__previous);
+
+	@staticmethod
+	def __hasNan(reading):
+		return any([math.isnan(value) for value in reading[1]]);
+
+	#------------------------------------------------#
+	#   Get compression                              #
+	#------------------------------------------------#
+	#   (readings offered, records passed on).
+	def GetStats(self):
+		return (self.__offered, self.__recorded);
+
+	#------------------------------------------------#
+	#   Flush the store                              #
+	#------------------------------------------------#
+	#   The last reading is held back until the next record and is only
+	# passed on by Close.
+	def Flush(self):
+		if hasattr(self.__store, 'Flush'):
+			self.__store.Flush();
+
+	#------------------------------------------------#
+	#   Pass on the last reading and close the store #
+	#------------------------------------------------#
+	def Close(self):
+		self.__passPrevious();
+		if hasattr(self.__store, 'Close'):
+			self.__store.Close();
+
+
+################################################################################
+#   Pack timestamps                                                            #
+################################################################################
+#   Timestamps are rounded to resolution in s and stored as the first one
+# followed by the differences, each a zigzag varint. Sampling every
+# second takes three bytes per timestamp at 1 us instead of eight.
+def EncodeTimes(times, resolution = 1e-6):
+	ticks = numpy.rint(numpy.asarray(times, dtype=float) / resolution).astype(numpy.int64);
+	if len(ticks) == 0:
+		return b'';
+	deltas = numpy.diff(ticks, prepend=0);
+	data = bytearray();
+	for delta in deltas.tolist():
+		value = (delta << 1) ^ (delta >> 63); # zigzag
+		while value >= 0x80:
+			data.append((value & 0x7F) | 0x80);
+			value >>= 7;
+		data.append(value);
+	return bytes(data);
+
+
+################################################################################
+#   Unpack timestamps                                                          #
+################################################################################
+#   Returns a float64 array. resolution must be the one of EncodeTimes.
+# All varints are decoded at once: each byte is shifted by its place in
+# its varint and the bytes of every varint summed.
+def DecodeTimes(data, resolution = 1e-6):
+	data = numpy.frombuffer(data, dtype=numpy.uint8);
+	ends = numpy.flatnonzero(data < 0x80);
+	if len(ends) == 0:
+		return numpy.zeros(0);
+	data = data[:ends[-1]+1];
+	starts = numpy.concatenate(([0], ends[:-1] + 1));
+	group = numpy.concatenate(([0], numpy.cumsum(data[:-1] < 0x80)));
+	shifts = (7 * (numpy.arange(len(data)) - starts[group])).astype(numpy.uint64);
+	values = numpy.add.reduceat((data & 0x7F).astype(numpy.uint64) << shifts, starts);
+	deltas = (values >> numpy.uint64(1)).astype(numpy.int64) ^ -(values & numpy.uint64(1)).astype(numpy.int64);
+	return numpy.cumsum(deltas) * resolution;
+
+
+# Packed file: magic, resolution as float64, number of records, length of
+# the times in bytes and a line of the columns, then the times and the
+# values as float64, record by record.
+PackMagic = b'GEMSCPK1';
+PackHeader = struct.Struct('<dQQ');
+
+
+################################################################################
+#   Pack a store                                                               #
+################################################################################
+#   Writes every record of store, a SlowControlStore or anything with
+# GetFields and Read, to path. The file is read back and compared; a
+# time further than half the resolution from the original or a changed
+# value raises ValueError. Returns (records, bytes written).
+def PackStore(store, path, resolution = 1e-6):
+	fields = store.GetFields();
+	records = store.Read();
+	times = EncodeTimes(records['time'], resolution);
+	values = numpy.column_stack([numpy.asarray(records[field], dtype='<f8') for field in fields]) if len(records) > 0 else numpy.zeros((0, len(fields)));
+	with open(path, 'wb') as f:
+		f.write(PackMagic + PackHeader.pack(resolution, len(records), len(times)));
+		f.write(' '.join(fields).encode('ascii') + b'\n');
+		f.write(times);
+		f.write(numpy.ascontiguousarray(values, dtype='<f8').tobytes());
+	packed = PackedStore(path).Read();
+	if len(packed) != len(records) or numpy.any(numpy.abs(packed['time'] - records['time']) > 0.5 * resolution * (1 + 1e-6)):
+		raise ValueError('Times of %s do not read back' % path);
+	for field in fields:
+		if not numpy.array_equal(packed[field], records[field], equal_nan=True):
+			raise ValueError('Column %s of %s does not read back' % (field, path));
+	return (len(records), os.path.getsize(path));
+
+
+################################################################################
+#   Class definition of PackedStore                                            #
+################################################################################
+#   Reads a file of PackStore. Has the reading calls of SlowControlStore
+# and gives records of the same layout, so it can stand in for one, e.g.
+# in an Aligner.
+class PackedStore:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			content = f.read();
+		if not content.startswith(PackMagic):
+			raise ValueError('%s is not a packed store' % path);
+		offset = len(PackMagic);
+		self.resolution, size, length = PackHeader.unpack_from(content, offset);
+		offset += PackHeader.size;
+		line = content.index(b'\n', offset);
+		self.__fields = tuple(content[offset:line].decode('ascii').split());
+		offset = line + 1;
+		times = DecodeTimes(content[offset:offset+length], self.resolution);
+		offset += length;
+		values = numpy.frombuffer(content, dtype='<f8', count=size * len(self.__fields), offset=offset);
+		if len(times) != size:
+			raise ValueError('%s holds %d times for %d records' % (path, len(times), size));
+		values = values.reshape((size, len(self.__fields)));
+		self.__records = numpy.empty(size, dtype=[('time', '<f8')] + [(field, '<f8') for field in self.__fields]);
+		self.__records['time'] = times;
+		for i, field in enumerate(self.__fields):
+			self.__records[field] = values[:,i];
+
+	#------------------------------------------------#
+	#   Get columns                                  #
+	#------------------------------------------------#
+	def GetFields(self):
+		return self.__fields;
+
+	#------------------------------------------------#
+	#   Number of records                            #
+	#------------------------------------------------#
+	def GetSize(self):
+		return len(self.__records);
+
+	#------------------------------------------------#
+	#   Read records in [start, stop)                #
+	#------------------------------------------------#
+	def Read(self, start = None, stop = None):
+		records = self.__records;
+		first = 0 if start is None else numpy.searchsorted(records['time'], start, side='left');
+		last = len(records) if stop is None else numpy.searchsorted(records['time'], stop, side='left');
+		return records[first:last];
+
+	#------------------------------------------------#
+	#   Read last n records                          #
+	#------------------------------------------------#
+	def Tail(self, n):
+		return self.__records[max(0, len(self.__records)-n):];
+
+
+################################################################################
+#   Open a store or a packed store                                             #
+################################################################################
+def OpenStore(path):
+	with open(path, 'rb') as f:
+		packed = f.read(len(PackMagic)) == PackMagic;
+	if packed:
+		return PackedStore(path);
+	return SlowControlStore(path);
@@ -0,0 +1,275 @@
+################################################################################
+#   Multi-resolution rollups of GEM slow control time series.                  #
+# Readings are summed up into buckets of several widths, e.g. 1 s, 10 s,       #
+# 1 min and 10 min, each level kept in its own SlowControlStore with min, max, #
+# mean and count per column. A plot of any range reads the coarsest level      #
+# that still gives the requested number of points, so the cost follows the     #
+# width of the screen rather than the number of readings.                      #
+#   Only finished buckets go into the levels. The buckets still being filled   #
+# are kept in prefix + '.open' by Close and taken up again by the next Rollup, #
+# so a restart goes on filling them instead of writing them twice.             #
+#                                                                              #
+#   rollup = Rollup('hv.gsc', HVFields, store=HVStore('hv.gsc'));              #
+#   HVLogger(HV, None, 1.0, rollup).Run();                                     #
+#   ...                                                                        #
+#   plot = rollup.Query(start, stop, 1000, HVStore('hv.gsc'));                 #
+################################################################################
+
+
+import math
+import numpy
+import os
+from GEMSlowControlStorage import SlowControlStore, ToFloat
+
+
+# Statistics kept per column and level
+Statistics = ('min', 'max', 'mean', 'n');
+
+
+################################################################################
+#   Columns of a level store                                                   #
+################################################################################
+#   Short names so that many columns fit into the store header.
+def LevelFields(count):
+	return tuple(['%s%d' % (statistic, i) for i in range(count) for statistic in Statistics]);
+
+#   Columns of the store of open buckets, which keeps sums instead of
+# means to go on adding to them.
+def OpenFields(count):
+	return ('width',) + tuple(['%s%d' % (statistic, i) for i in range(count) for statistic in ('min', 'max', 'sum', 'n')]);
+
+
+################################################################################
+#   Sum up records into buckets                                                #
+################################################################################
+#   times must be sorted. mins, maxs, sums and counts hold one array per
+# column. Returns the same for the buckets of width, with the bucket
+# start as time. NaN is left out of everything but the count of 0.
+def Aggregate(times, mins, maxs, sums, counts, width):
+	times = numpy.asarray(times, dtype=float);
+	if len(times) == 0:
+		return (times, mins, maxs, sums, counts);
+	index = numpy.floor(times / width);
+	first = numpy.concatenate(([0], numpy.nonzero(numpy.diff(index))[0] + 1));
+	return (index[first] * width,
+	        [numpy.fmin.reduceat(numpy.asarray(column, dtype=float), first) for column in mins],
+	        [numpy.fmax.reduceat(numpy.asarray(column, dtype=float), first) for column in maxs],
+	        [numpy.add.reduceat(numpy.nan_to_num(numpy.asarray(column, dtype=float)), first) for column in sums],
+	        [numpy.add.reduceat(numpy.asarray(column, dtype=float), first) for column in counts]);
+
+
+################################################################################
+#   Class definition of Rollup                                                 #
+################################################################################
+class Rollup:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   Level of width w is kept in prefix + '.<w>s'. Every width must be
+	# a multiple of the one before. Readings are passed on to store, e.g.
+	# the SlowControlStore of the raw readings, if given. Buckets left
+	# open by the last Close are filled on.
+	def __init__(self, prefix, fields, levels = (1, 10, 60, 600), store = None):
+		levels = sorted([float(width) for width in levels]);
+		for finer, coarser in zip(levels[:-1], levels[1:]):
+			if abs(coarser / finer - round(coarser / finer)) > 1e-9:
+				raise ValueError('Width %g s is no multiple of %g s' % (coarser, finer));
+		self.__fields = tuple(fields);
+		self.__widths = levels;
+		self.__stores = [SlowControlStore('%s.%gs' % (prefix, width), LevelFields(len(self.__fields))) for width in levels];
+		self.__buckets = [None] * len(levels);
+		self.__store = store;
+		self.__openPath = prefix + '.open';
+		self.__loadOpen();
+
+	#------------------------------------------------#
+	#   Get widths of the levels                     #
+	#------------------------------------------------#
+	def GetWidths(self):
+		return list(self.__widths);
+
+	#------------------------------------------------#
+	#   Add a reading                                #
+	#------------------------------------------------#
+	#   Same call as SlowControlStore.Append.
+	def Append(self, timestamp, *values):
+		if len(values) != len(self.__fields):
+			print(' Expected', len(self.__fields), 'values', self.__fields, 'but got', len(values));
+			return False;
+		values = [ToFloat(value) for value in values];
+		counts = [0.0 if math.isnan(value) else 1.0 for value in values];
+		self.__add(0, float(timestamp), values, values, [value * n if n else 0.0 for value, n in zip(values, counts)], counts);
+		if self.__store is not None:
+			return self.__store.Append(timestamp, *values);
+		return True;
+
+	def __add(self, level, timestamp, mins, maxs, sums, counts):
+		index = math.floor(timestamp / self.__widths[level]);
+		bucket = self.__buckets[level];
+		if bucket is not None and bucket[0] != index:
+			self.__close(level);
+			bucket = None;
+		if bucket is None:
+			self.__buckets[level] = [index, list(mins), list(maxs), list(sums), list(counts)];
+			return;
+		# min/max of NaN are NaN, fmin/fmax semantics by hand
+		bucket[1] = [b if a != a or a >= b else a for a, b in zip(mins, bucket[1])];
+		bucket[1] = [a if b != b else b for a, b in zip(mins, bucket[1])];
+		bucket[2] = [b if a != a or a <= b else a for a, b in zip(maxs, bucket[2])];
+		bucket[2] = [a if b != b else b for a, b in zip(maxs, bucket[2])];
+		bucket[3] = [a + b for a, b in zip(sums, bucket[3])];
+		bucket[4] = [a + b for a, b in zip(counts, bucket[4])];
+
+	#------------------------------------------------#
+	#   Write a finished bucket                      #
+	#------------------------------------------------#
+	#   It also goes into the next coarser level.
+	def __close(self, level):
+		bucket = self.__buckets[level];
+		self.__buckets[level] = None;
+		start = bucket[0] * self.__widths[level];
+		self.__stores[level].Append(start, *self.__row(bucket));
+		if level + 1 < len(self.__widths):
+			self.__add(level + 1, start, bucket[1], bucket[2], bucket[3], bucket[4]);
+
+	@staticmethod
+	def __row(bucket):
+		row = [];
+		for low, high, total, n in zip(bucket[1], bucket[2], bucket[3], bucket[4]):
+			row += [low, high, total / n if n > 0 else float('nan'), n];
+		return row;
+
+	#------------------------------------------------#
+	#   Keep open buckets over a restart             #
+	#------------------------------------------------#
+	#   Open buckets are written from the coarsest level on, so that
+	# their start times do not go backwards.
+	def __saveOpen(self):
+		if os.path.exists(self.__openPath):
+			os.remove(self.__openPath);
+		if all([bucket is None for bucket in self.__buckets]):
+			return;
+		store = SlowControlStore(self.__openPath, OpenFields(len(self.__fields)));
+		for level in reversed(range(len(self.__widths))):
+			bucket = self.__buckets[level];
+			if bucket is None:
+				continue;
+			row = [];
+			for low, high, total, n in zip(bucket[1], bucket[2], bucket[3], bucket[4]):
+				row += [low, high, total, n];
+			store.Append(bucket[0] * self.__widths[level], self.__widths[level], *row);
+		store.Close();
+
+	#   The file is removed once read, a crash then loses the open
+	# buckets but writes none of them twice.
+	def __loadOpen(self):
+		if not os.path.exists(self.__openPath):
+			return;
+		store = SlowControlStore(self.__openPath);
+		if store.GetFields() != OpenFields(len(self.__fields)):
+			raise ValueError('%s has columns %s, not %s' % (self.__openPath, store.GetFields(), OpenFields(len(self.__fields))));
+		for record in store.Read():
+			if float(record['width']) not in self.__widths:
+				print(' Dropped an open bucket of', float(record['width']), 's, no such level in', self.__openPath);
+				continue;
+			level = self.__widths.index(float(record['width']));
+			columns = [[float(record['%s%d' % (statistic, i)]) for i in range(len(self.__fields))] for statistic in ('min', 'max', 'sum', 'n')];
+			self.__buckets[level] = [round(float(record['time']) / self.__widths[level])] + columns;
+		store.Close();
+		os.remove(self.__openPath);
+
+	#------------------------------------------------#
+	#   Build levels from stored readings            #
+	#------------------------------------------------#
+	#   For readings taken before the rollup existed, e.g. a store
+	# filled by ImportText. The levels must be empty, and readings go
+	# chunk by chunk so that a long run need not fit into memory. The
+	# last bucket of every level stays open like with Append.
+	def Build(self, store, chunk = 1000000):
+		records = store.Read();
+		end = len(records);
+		first = 0;
+		while first < end:
+			last = min(end, first + chunk);
+			if last < end:
+				# Cut at a bucket of the coarsest level
+				width = self.__widths[-1];
+				edge = (math.floor(records['time'][last] / width)) * width;
+				cut = first + int(numpy.searchsorted(records['time'][first:last], edge, side='left'));
+				if cut == first:
+					# The chunk lies in one bucket, take the bucket whole
+					edge = (math.floor(records['time'][first] / width) + 1) * width;
+					cut = first + int(numpy.searchsorted(records['time'][first:], edge, side='left'));
+				last = cut;
+			part = records[first:last];
+			columns = [numpy.asarray(part[field], dtype=float) for field in self.__fields];
+			counts = [(~numpy.isnan(column)).astype(float) for column in columns];
+			level = (part['time'], columns, columns, columns, counts);
+			for i, width in enumerate(self.__widths):
+				level = Aggregate(level[0], level[1], level[2], level[3], level[4], width);
+				if last == end and len(level[0]) > 0:
+					# Readings may follow, the coarser level only gets
+					# the last bucket once it is finished
+					self.__buckets[i] = [round(level[0][-1] / width)] + [[float(column[-1]) for column in columns] for columns in level[1:]];
+					level = (level[0][:-1],) + tuple([[column[:-1] for column in columns] for columns in level[1:]]);
+				means = [numpy.where(n > 0, total / numpy.maximum(n, 1), numpy.nan) for total, n in zip(level[3], level[4])];
+				row = [];
+				for low, high, mean, n in zip(level[1], level[2], means, level[4]):
+					row += [low, high, mean, n];
+				self.__stores[i].AppendArrays(level[0], *row);
+			first = last;
+		return end;
+
+	#------------------------------------------------#
+	#   Read a range for plotting                    #
+	#------------------------------------------------#
+	#   Picks the coarsest level with at least pixels buckets in
+	# [start, stop). Finer than the finest level raw readings are read
+	# from raw, a SlowControlStore, if given. Returns a dictionary with
+	# 'width' (0 for raw), 'time' and per column (min, max, mean, count).
+	def Query(self, start, stop, pixels = 1000, raw = None):
+		target = (stop - start) / max(1, pixels);
+		level = None;
+		for i, width in enumerate(self.__widths):
+			if width <= target:
+				level = i;
+		if level is None and raw is not None:
+			records = raw.Read(start, stop);
+			result = { 'width' : 0.0, 'time' : numpy.array(records['time']) };
+			for field in self.__fields:
+				column = numpy.array(records[field]);
+				result[field] = (column, column, column, (~numpy.isnan(column)).astype(float));
+			return result;
+		if level is None:
+			level = 0;
+		records = self.__stores[level].Read(start, stop);
+		times = numpy.array(records['time']);
+		columns = [numpy.array(records[name]) for name in LevelFields(len(self.__fields))];
+		# The bucket still being filled
+		bucket = self.__buckets[level];
+		if bucket is not None and start <= bucket[0] * self.__widths[level] < stop:
+			times = numpy.append(times, bucket[0] * self.__widths[level]);
+			columns = [numpy.append(column, value) for column, value in zip(columns, self.__row(bucket))];
+		result = { 'width' : self.__widths[level], 'time' : times };
+		for i, field in enumerate(self.__fields):
+			result[field] = tuple(columns[4*i:4*i+4]);
+		return result;
+
+	#------------------------------------------------#
+	#   Flush                                        #
+	#------------------------------------------------#
+	def Flush(self):
+		for store in self.__stores:
+			store.Flush();
+		if self.__store is not None and hasattr(self.__store, 'Flush'):
+			self.__store.Flush();
+
+	#------------------------------------------------#
+	#   Keep open buckets and close                  #
+	#------------------------------------------------#
+	def Close(self):
+		self.__saveOpen();
+		for store in self.__stores:
+			store.Close();
+		if self.__store is not None and hasattr(self.__store, 'Close'):
+			self.__store.Close();
@@ -0,0 +1,120 @@
+################################################################################
+#   Position scan of the linear actuator with HV readings at every point.      #
+# The points are visited in the order of least travel. At each point the       #
+# scan waits for the actuator to settle and records a number of HV readings.   #
+# Everything goes to one result file with a line per reading:                  #
+#   point target reached position timestamp voltage current [...]              #
+################################################################################
+
+
+import sys
+import time
+
+
+################################################################################
+#   Order points for least travel                                              #
+################################################################################
+#   On a line the shortest path through all points from start runs to
+# the nearer end first and then sweeps to the other end.
+def OrderPositions(positions, start):
+	points = sorted(set(positions));
+	if len(points) == 0:
+		return points;
+	if abs(start - points[-1]) < abs(start - points[0]):
+		points.reverse();
+	return points;
+
+
+################################################################################
+#   Range of positions including the stop value                                #
+################################################################################
+def PositionRange(first, last, step):
+	if step == 0 or (last - first) * step < 0:
+		return [first];
+	n = int(round((last - first) / step + 1e-9)) + 1;
+	return [first + i * step for i in range(n)];
+
+
+################################################################################
+#   Class definition of PositionScan                                           #
+################################################################################
+class PositionScan:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	settleTime     =   1.0; # in s, after arrival
+	readings       =    10; # HV readings per point
+	readInterval   =   0.0; # in s, between readings
+	moveTimeout    =   120; # in s, per point
+	__Is_Running   = False;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   motor is a connected MotorControl, hv a connected HVControl or
+	# HVManager or None. positions are steps, or mm with unit 'mm'.
+	def __init__(self, motor, hv, positions, unit = 'step'):
+		self.__motor = motor;
+		self.__hv = hv;
+		if unit == 'mm':
+			positions = list(motor.MmToStep(list(positions)));
+		elif unit != 'step':
+			raise ValueError('Unit must be step or mm, not %s' % unit);
+		minSteps, maxSteps = motor.GetRange();
+		self.__positions = [];
+		for pos in positions:
+			if pos < minSteps or pos > maxSteps:
+				print(' Skip', pos, 'out of range', minSteps, '-', maxSteps);
+			else:
+				self.__positions.append(int(pos));
+
+	#------------------------------------------------#
+	#   Get points in the order they will be visited #
+	#------------------------------------------------#
+	def GetPlan(self):
+		ans = self.__motor.GetPosition();
+		start = ans[1] if ans[0] else 0;
+		return OrderPositions(self.__positions, start);
+
+	#------------------------------------------------#
+	#   Run the scan                                 #
+	#------------------------------------------------#
+	#   output is a file name or a stream. Returns True when every
+	# point has been taken.
+	def Run(self, output = sys.stdout):
+		if isinstance(output, str):
+			with open(output, 'w') as f:
+				return self.Run(f);
+		plan = self.GetPlan();
+		fields = self.__hv.GetFields() if hasattr(self.__hv, 'GetFields') else ('voltage', 'current');
+		output.write('# point target reached position timestamp ' + (' '.join(fields) if self.__hv is not None else '') + '\n');
+		self.__Is_Running = True;
+		for point, pos in enumerate(plan):
+			if not self.__Is_Running:
+				print(' Scan stopped before point', point);
+				return False;
+			print(' Point', point + 1, 'of', len(plan), ': moving to', pos);
+			ans = self.__motor.StartMove(pos, self.moveTimeout).Wait();
+			if not ans or not ans[0]:
+				print(' Scan aborted at point', point, 'moving to', pos, ':', ans);
+				return False;
+			time.sleep(self.settleTime);
+			reached = self.__motor.GetPosition();
+			if not reached[0]:
+				print(' Scan aborted at point', point, 'reading position :', reached);
+				return False;
+			prefix = '%d %d %d %.2f' % (point, pos, reached[1], self.__motor.StepToMm(reached[1]));
+			for i in range(self.readings if self.__hv is not None else 1):
+				if i > 0 and self.readInterval > 0:
+					time.sleep(self.readInterval);
+				values = self.__hv.GetMeasurement() if self.__hv is not None else ();
+				output.write('%s %.3f %s\n' % (prefix, time.time(), ' '.join(values)));
+			output.flush();
+		self.__Is_Running = False;
+		return True;
+
+	#------------------------------------------------#
+	#   Stop after the current point                 #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__Is_Running = False;
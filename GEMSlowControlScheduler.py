@@ -0,0 +1,260 @@
+################################################################################
+#   Adaptive polling of GEM slow control readings.                             #
+# The interval to the next reading of a channel follows how fast its values    #
+# change: short while they move or come close to a limit, growing back to a    #
+# long baseline while they are stable. All channels share a budget of serial   #
+# queries per second, so a ramp or trip is caught at high resolution without   #
+# keeping the links busy all the time.                                         #
+#                                                                              #
+#   scheduler = AdaptiveScheduler(budget=20);                                  #
+#   scheduler.AddChannel('hv', HVSource(HV), HVSchedule(HV), 2);               #
+#   scheduler.AddChannel('motor', MotorSource(Motor), MotorSchedule(Motor));   #
+#   scheduler.Subscribe(lambda timestamp, name, values: ...);                  #
+#   scheduler.Start();                                                         #
+################################################################################
+
+
+from GEMSlowControlStorage import ToFloat
+import math
+import sys
+import threading
+import time
+import traceback
+
+
+################################################################################
+#   Class definition of AdaptiveSchedule                                       #
+################################################################################
+#   Decides the interval after each reading of one channel.
+class AdaptiveSchedule:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	minInterval    =   0.1; # in s
+	maxInterval    =  10.0; # in s
+	growth         =   1.5; # largest factor the interval grows by at once
+	limitMargin    =   0.1; # of the limit, at full rate closer than this
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   resolution holds per value the change worth a reading, None to
+	# ignore the value. limits holds per value (low, high) with None or 0
+	# for no limit, or is a function returning that list.
+	def __init__(self, resolution, limits = None, minInterval = 0.1, maxInterval = 10.0):
+		self.__resolution = tuple(resolution);
+		self.__limits = limits;
+		self.minInterval = float(minInterval);
+		self.maxInterval = float(maxInterval);
+		self.Reset();
+
+	#------------------------------------------------#
+	#   Start over at the shortest interval          #
+	#------------------------------------------------#
+	def Reset(self):
+		self.__last = None;
+		self.__interval = self.minInterval;
+
+	#------------------------------------------------#
+	#   Get current interval                         #
+	#------------------------------------------------#
+	def GetInterval(self):
+		return self.__interval;
+
+	#------------------------------------------------#
+	#   Take a reading and get the next interval     #
+	#------------------------------------------------#
+	#   values is the reading, None if it failed. The interval shrinks
+	# at once when needed but grows by at most growth per reading.
+	def Update(self, timestamp, values):
+		if values is None:
+			return self.__interval;
+		values = [ToFloat(value) for value in values];
+		ideal = self.maxInterval;
+		if self.__last is not None and timestamp > self.__last[0]:
+			elapsed = timestamp - self.__last[0];
+			for value, last, resolution in zip(values, self.__last[1], self.__resolution):
+				if resolution is None or math.isnan(value) or math.isnan(last) or value == last:
+					continue;
+				# Time the value takes to move by its resolution
+				ideal = min(ideal, resolution * elapsed / abs(value - last));
+		if self.__nearLimit(values):
+			ideal = self.minInterval;
+		self.__last = (timestamp, values);
+		interval = ideal if ideal < self.__interval else min(ideal, self.__interval * self.growth);
+		self.__interval = min(self.maxInterval, max(self.minInterval, interval));
+		return self.__interval;
+
+	def __nearLimit(self, values):
+		limits = self.__limits() if callable(self.__limits) else self.__limits;
+		if limits is None:
+			return False;
+		for value, limit in zip(values, limits):
+			if math.isnan(value) or limit is None:
+				continue;
+			low, high = limit;
+			# A limit of 0 has no margin, every value at 0 would be close
+			if low and value - low <= self.limitMargin * abs(low):
+				return True;
+			if high and high - value <= self.limitMargin * abs(high):
+				return True;
+		return False;
+
+
+################################################################################
+#   Schedules of the drivers                                                   #
+################################################################################
+#   HV: a change of resolution V or uA is worth a reading, and the
+# current coming close to the current setting (trip limit of a ramp)
+# gives full rate. A setting of 0 or one that cannot be read is no
+# limit. hv is an HVControl or an HVManager.
+def HVSchedule(hv, voltage = 1.0, current = 0.1, minInterval = 0.1, maxInterval = 10.0):
+	devices = [hv.GetDevice(name) for name in hv.GetNames()] if hasattr(hv, 'GetNames') else [hv];
+	def limits():
+		values = [];
+		for device in devices:
+			limit = device.tripCurrent if device.tripCurrent > 0 else ToFloat(device.GetCurrent());
+			# NaN is not > 0 either
+			values += [None, (None, limit if limit > 0 else None)];
+		return values;
+	return AdaptiveSchedule((voltage, current) * len(devices), limits, minInterval, maxInterval);
+
+#   Motor: a move of accuracy steps is worth a reading. The ends of the
+# range are no limits here since the actuator is parked at one.
+def MotorSchedule(motor, minInterval = 0.05, maxInterval = 10.0):
+	return AdaptiveSchedule((motor.accuracy, None), None, minInterval, maxInterval);
+
+
+################################################################################
+#   Class definition of AdaptiveScheduler                                      #
+################################################################################
+#   Reads every channel in its own thread when its schedule says so.
+# Each reading costs some serial queries and waits for the shared budget.
+class AdaptiveScheduler:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	clock          = time.time; # gives the timestamps
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   budget is queries per second over all channels, 0 for none.
+	# Up to one second of budget can be saved up for a burst, but at
+	# least the cost of the dearest reading so that it comes through.
+	def __init__(self, budget = 0):
+		self.budget = float(budget);
+		self.__channels = {};
+		self.__subscribers = [];
+		self.__lock = threading.Lock();
+		self.__stop = threading.Event();
+		self.__threads = [];
+		self.__tokens = self.budget;
+		self.__refilled = time.monotonic();
+
+	#------------------------------------------------#
+	#   Add a channel                                #
+	#------------------------------------------------#
+	#   source() returns a tuple of values or None, schedule is an
+	# AdaptiveSchedule, cost the number of queries of a reading.
+	def AddChannel(self, name, source, schedule, cost = 1):
+		self.__channels[name] = { 'source'   : source,
+		                          'schedule' : schedule,
+		                          'cost'     : cost,
+		                          'samples'  : 0,
+		                          'waited'   : 0.0,
+		                          'errors'   : 0 };
+
+	#------------------------------------------------#
+	#   Subscribe to readings                        #
+	#------------------------------------------------#
+	#   subscriber(timestamp, name, values) is called from the thread of
+	# the channel.
+	def Subscribe(self, subscriber):
+		self.__subscribers.append(subscriber);
+
+	#------------------------------------------------#
+	#   Start reading                                #
+	#------------------------------------------------#
+	def Start(self):
+		self.__stop.clear();
+		for name in self.__channels:
+			thread = threading.Thread(target=self.__run, args=(name,));
+			thread.daemon = True;
+			thread.start();
+			self.__threads.append(thread);
+
+	#------------------------------------------------#
+	#   Stop reading                                 #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__stop.set();
+		for thread in self.__threads:
+			thread.join();
+		self.__threads = [];
+
+	#------------------------------------------------#
+	#   Take queries from the budget                 #
+	#------------------------------------------------#
+	#   Returns the time waited, or None if stopped while waiting.
+	def __acquire(self, cost):
+		if self.budget <= 0:
+			return 0.0;
+		start = time.monotonic();
+		capacity = max([self.budget] + [channel['cost'] for channel in self.__channels.values()]);
+		while True:
+			with self.__lock:
+				now = time.monotonic();
+				self.__tokens = min(capacity, self.__tokens + (now - self.__refilled) * self.budget);
+				self.__refilled = now;
+				if self.__tokens >= cost:
+					self.__tokens -= cost;
+					return now - start;
+				wait = (cost - self.__tokens) / self.budget;
+			if self.__stop.wait(wait):
+				return None;
+
+	#------------------------------------------------#
+	#   Read one channel                             #
+	#------------------------------------------------#
+	#   An exception of the source, a subscriber or the schedule is
+	# counted and reported when it differs from the last one, and the
+	# channel goes on after its current interval.
+	def __run(self, name):
+		channel = self.__channels[name];
+		due = time.monotonic();
+		error = None;
+		while not self.__stop.wait(max(0.0, due - time.monotonic())):
+			waited = self.__acquire(channel['cost']);
+			if waited is None:
+				break;
+			start = time.monotonic();
+			try:
+				begin = self.clock();
+				values = channel['source']();
+				# Stamped with the middle of the query like GetHV.py
+				timestamp = (begin + self.clock()) / 2;
+				channel['samples'] += 1;
+				channel['waited'] += waited;
+				if values is not None:
+					for subscriber in self.__subscribers:
+						subscriber(timestamp, name, values);
+				due = start + channel['schedule'].Update(timestamp, values);
+				error = None;
+			except Exception:
+				channel['errors'] += 1;
+				details = traceback.format_exc();
+				if details.strip().splitlines()[-1] != error:
+					error = details.strip().splitlines()[-1];
+					sys.stderr.write(' Error in reading %s: %s' % (name, details));
+					sys.stderr.flush();
+				due = start + channel['schedule'].GetInterval();
+
+	#------------------------------------------------#
+	#   Get statistics                               #
+	#------------------------------------------------#
+	#   {name: (samples, current interval in s, time waited for budget
+	# in s, errors)}.
+	def GetStats(self):
+		return dict([(name, (channel['samples'], channel['schedule'].GetInterval(), channel['waited'], channel['errors']))
+		             for name, channel in self.__channels.items()]);
@@ -0,0 +1,498 @@
+################################################################################
+#   GEM slow control server.                                                   #
+# One process owns the serial ports of the HV supplies and the motor. Each     #
+# device has a command queue worked off by its own thread, so requests of      #
+# all clients reach a device one after the other. Clients connect over a       #
+# Unix or TCP socket with the protocol described in GEMSlowControlClient.      #
+# With polling on, readings are refreshed in the background and reads are     #
+# answered from the cache without waiting for the device. The same readings    #
+# are streamed to every client that subscribes.                                #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl, MotorControl, HVRamp, MotorMove
+from GEMSlowControlClient import DefaultAddress, ParseAddress
+from GEMSlowControlStream import Publisher, HVSource, MotorSource
+from GEMSlowControlStats import CommandStats
+import concurrent.futures
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+
+
+################################################################################
+#   Conversion of request arguments                                            #
+################################################################################
+#   Each takes a value from JSON and returns it as the driver wants it, or
+# raises ValueError.
+def Number(value):
+	if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+		raise ValueError('%r is no number' % (value,));
+	number = float(value);
+	if number != number or number in (float('inf'), -float('inf')):
+		raise ValueError('%r is no finite number' % (value,));
+	return number;
+
+#   Settings of the HV driver are strings of whole numbers.
+def Setting(value):
+	return '%d' % round(Number(value));
+
+def Step(value):
+	return int(round(Number(value)));
+
+def Seconds(value):
+	age = Number(value);
+	if age < 0:
+		raise ValueError('%r is negative' % (value,));
+	return age;
+
+
+################################################################################
+#   Class definition of DeviceWorker                                           #
+################################################################################
+#   Runs calls on one device in the order they were submitted.
+class DeviceWorker:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, name, device):
+		self.name = name;
+		self.device = device;
+		self.__queue = queue.Queue();
+		self.__thread = threading.Thread(target=self.__work);
+		self.__thread.daemon = True;
+		self.__thread.start();
+
+	#------------------------------------------------#
+	#   Queue a call                                 #
+	#------------------------------------------------#
+	#   Returns a concurrent.futures.Future of its result.
+	def Submit(self, func, *args):
+		future = concurrent.futures.Future();
+		self.__queue.put((future, func, args));
+		return future;
+
+	#------------------------------------------------#
+	#   Get number of queued calls                   #
+	#------------------------------------------------#
+	def Pending(self):
+		return self.__queue.qsize();
+
+	#------------------------------------------------#
+	#   Stop after the queued calls                  #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__queue.put(None);
+		self.__thread.join();
+
+	#------------------------------------------------#
+	#   Work off the queue                           #
+	#------------------------------------------------#
+	def __work(self):
+		while True:
+			item = self.__queue.get();
+			if item is None:
+				return;
+			future, func, args = item;
+			if not future.set_running_or_notify_cancel():
+				continue;
+			try:
+				future.set_result(func(*args));
+			except Exception as error:
+				future.set_exception(error);
+
+
+################################################################################
+#   Class definition of SlowControlServer                                      #
+################################################################################
+class SlowControlServer:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	# Commands clients may call
+	hvCommands     = ('SetVoltage', 'SetCurrent', 'GetVoltage', 'GetCurrent',
+	                  'MeasureVoltage', 'MeasureCurrent', 'GetMeasurement', 'GetStatus',
+	                  'RampVoltage', 'SetRampUp', 'SetRampDown', 'GetRampUp', 'GetRampDown',
+	                  'TurnOn', 'TurnOff', 'GetVer', 'GetSN', 'Reset', 'IsReady');
+	motorCommands  = ('GetPosition', 'Status', 'MotorStop', 'SetTarget', 'StartMove',
+	                  'MoveTo', 'GoHome', 'GetTarget', 'GetRange', 'IsReady');
+	# Arguments of the commands: (required, optional) conversions. A
+	# command not listed takes none.
+	__arguments    = { 'SetVoltage'     : ((Setting,), ()),
+	                   'SetCurrent'     : ((Setting,), ()),
+	                   'RampVoltage'    : ((Number,), ()),
+	                   'SetRampUp'      : ((Setting,), ()),
+	                   'SetRampDown'    : ((Setting,), ()),
+	                   'MeasureVoltage' : ((), (Seconds,)),
+	                   'MeasureCurrent' : ((), (Seconds,)),
+	                   'GetMeasurement' : ((), (Seconds,)),
+	                   'GetStatus'      : ((), (Seconds,)),
+	                   'GetPosition'    : ((), (Seconds,)),
+	                   'SetTarget'      : ((Step,), ()),
+	                   'StartMove'      : ((Step,), (Seconds,)),
+	                   'MoveTo'         : ((Step,), (Seconds,)),
+	                   'GoHome'         : ((), (Seconds,)) };
+	# Reads answered from the cache, with the queries they need
+	__hvReads      = { 'GetVoltage'     : ('VOLT?',),
+	                   'GetCurrent'     : ('CURR?',),
+	                   'MeasureVoltage' : ('MEAS:VOLT?',),
+	                   'MeasureCurrent' : ('MEAS:CURR?',),
+	                   'GetMeasurement' : ('MEAS:VOLT?', 'MEAS:CURR?'),
+	                   'GetStatus'      : ('VOLT?', 'CURR?', 'MEAS:VOLT?', 'MEAS:CURR?') };
+	__settings     = ('VOLT?', 'CURR?');
+	# Reads of the HV whose failure is only known from GetLastError
+	__hvQueries    = ('GetVoltage', 'GetCurrent', 'MeasureVoltage', 'MeasureCurrent',
+	                  'GetMeasurement', 'GetStatus', 'GetVer', 'GetSN');
+	pollInterval   =   0.0; # in s, 0 for no background polling
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self):
+		self.__workers = {};
+		self.__kinds = {};
+		self.__servers = [];
+		self.__publisher = None;
+		self.__stats = None;
+
+	#------------------------------------------------#
+	#   Add devices                                  #
+	#------------------------------------------------#
+	def AddHV(self, name, port):
+		self.__add(name, 'hv', HVControl(port));
+
+	def AddMotor(self, name, port):
+		self.__add(name, 'motor', MotorControl(port));
+
+	def __add(self, name, kind, device):
+		# A lost device comes back on its own and the rest keeps going
+		device.autoReconnect = True;
+		device.stats = self.__stats;
+		self.__workers[name] = DeviceWorker(name, device);
+		self.__kinds[name] = kind;
+
+	#------------------------------------------------#
+	#   Record command statistics of all devices     #
+	#------------------------------------------------#
+	#   Devices added later are recorded too. Returns the CommandStats.
+	def EnableStats(self):
+		if self.__stats is None:
+			self.__stats = CommandStats();
+		for worker in self.__workers.values():
+			worker.device.stats = self.__stats;
+		return self.__stats;
+
+	#------------------------------------------------#
+	#   Get device                                   #
+	#------------------------------------------------#
+	def GetDevice(self, name):
+		return self.__workers[name].device;
+
+	#------------------------------------------------#
+	#   Get connection of all devices                #
+	#------------------------------------------------#
+	def Connect(self):
+		futures = [worker.Submit(worker.device.Connect) for worker in self.__workers.values()];
+		answers = [future.result() for future in futures];
+		return all([ans[0] if isinstance(ans, tuple) else ans for ans in answers]);
+
+	#------------------------------------------------#
+	#   Poll readings in the background              #
+	#------------------------------------------------#
+	#   Readings stay valid for two intervals, so reads in between are
+	# answered from the cache. Each reading goes through the queue of
+	# its device and is published to subscribers. Polling started before
+	# is stopped.
+	def StartPolling(self, interval):
+		publisher = Publisher(interval);
+		if self.__publisher is not None:
+			self.__publisher.Stop();
+		self.__publisher = publisher;
+		self.pollInterval = interval;
+		for name, worker in self.__workers.items():
+			if self.__kinds[name] == 'hv':
+				worker.device.measureTTL = 2 * interval;
+				source = HVSource(worker.device);
+			else:
+				worker.device.positionTTL = 2 * interval;
+				source = MotorSource(worker.device);
+			self.__publisher.AddSource(name, self.__queued(worker, source));
+		self.__publisher.Start();
+
+	def __queued(self, worker, source):
+		return lambda: worker.Submit(source).result();
+
+	#------------------------------------------------#
+	#   Get publisher of polled readings             #
+	#------------------------------------------------#
+	#   None while not polling.
+	def GetPublisher(self):
+		return self.__publisher;
+
+	#------------------------------------------------#
+	#   Stream readings to a client                  #
+	#------------------------------------------------#
+	#   args are [names, maxSize, every] as in Publisher.Subscribe, all
+	# optional. Each reading is written as a JSON line
+	#   {"time": ..., "dev": ..., "values": [...], "dropped": n}
+	# until the client goes away.
+	def Stream(self, output, ident, args):
+		if self.__publisher is None:
+			output.write(json.dumps({'id' : ident, 'ok' : False, 'error' : 'Server is not polling'}).encode() + b'\n');
+			output.flush();
+			return;
+		try:
+			names, maxSize, every = self.__subscribeArguments(args);
+		except ValueError as error:
+			output.write(json.dumps({'id' : ident, 'ok' : False, 'error' : 'Bad arguments for Subscribe: %s' % error}).encode() + b'\n');
+			output.flush();
+			return;
+		subscription = self.__publisher.Subscribe(maxSize, every, names);
+		try:
+			output.write(json.dumps({'id' : ident, 'ok' : True, 'result' : 'streaming'}).encode() + b'\n');
+			output.flush();
+			while subscription.IsOpen():
+				record = subscription.Get(1.0);
+				if record is None:
+					continue;
+				output.write(json.dumps({'time' : record[0], 'dev' : record[1], 'values' : list(record[2]),
+				                         'dropped' : subscription.GetDropped()}, separators=(',', ':')).encode() + b'\n');
+				output.flush();
+		except OSError:
+			pass;
+		finally:
+			self.__publisher.Unsubscribe(subscription);
+
+	#   Raises ValueError unless args is a list of a list of device
+	# names or null, and two counts of at least 1.
+	def __subscribeArguments(self, args):
+		if not isinstance(args, list) or len(args) > 3:
+			raise ValueError('args must be a list of up to 3');
+		names = args[0] if len(args) > 0 else None;
+		maxSize = args[1] if len(args) > 1 else 100;
+		every = args[2] if len(args) > 2 else 1;
+		if names is not None and (not isinstance(names, list) or not all([isinstance(name, str) for name in names])):
+			raise ValueError('names must be a list of device names or null');
+		for value in (maxSize, every):
+			if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+				raise ValueError('%r is no count of at least 1' % (value,));
+		return (names, maxSize, every);
+
+	#------------------------------------------------#
+	#   Answer a read from the cache                 #
+	#------------------------------------------------#
+	#   Returns (True, answer) or (False, None) if not cached.
+	def __cachedRead(self, name, cmd):
+		device = self.__workers[name].device;
+		if self.__kinds[name] == 'motor':
+			if cmd != 'GetPosition' or device.positionTTL <= 0:
+				return (False, None);
+			cached = device.GetCachedPosition();
+			if cached is None or cached[1] > device.positionTTL:
+				return (False, None);
+			return (True, cached[0]);
+		if cmd not in self.__hvReads:
+			return (False, None);
+		values = [];
+		for query in self.__hvReads[cmd]:
+			cached = device.GetCached(query);
+			if cached is None or (query not in self.__settings and cached[1] > device.measureTTL):
+				return (False, None);
+			values.append(cached[0]);
+		return (True, values[0] if len(values) == 1 else tuple(values));
+
+	#------------------------------------------------#
+	#   Start one request                            #
+	#------------------------------------------------#
+	#   Returns a function giving the answer, so that all requests of a
+	# batch are queued before any of them is waited for. Whatever goes
+	# wrong is answered with ok false.
+	def __start(self, request):
+		ident = request.get('id') if isinstance(request, dict) else None;
+		try:
+			answer = self.__begin(ident, request);
+		except Exception as error:
+			message = '%s: %s' % (type(error).__name__, error);
+			return lambda: {'id' : ident, 'ok' : False, 'error' : message};
+		def safe():
+			try:
+				return answer();
+			except Exception as error:
+				return {'id' : ident, 'ok' : False, 'error' : '%s: %s' % (type(error).__name__, error)};
+		return safe;
+
+	def __begin(self, ident, request):
+		try:
+			name = request.get('dev', '');
+			cmd = request['cmd'];
+			args = request.get('args', []);
+		except (AttributeError, KeyError, TypeError):
+			return lambda: {'id' : ident, 'ok' : False, 'error' : 'Malformed request'};
+		if not isinstance(name, str) or not isinstance(cmd, str):
+			return lambda: {'id' : ident, 'ok' : False, 'error' : 'Malformed request'};
+		if name in ('', 'server'):
+			return lambda: self.__serverCommand(ident, cmd, args);
+		if name not in self.__workers:
+			return lambda: {'id' : ident, 'ok' : False, 'error' : 'No device ' + str(name)};
+		kind = self.__kinds[name];
+		if cmd not in (self.hvCommands if kind == 'hv' else self.motorCommands):
+			return lambda: {'id' : ident, 'ok' : False, 'error' : 'No command %s for %s' % (cmd, name)};
+		try:
+			args = self.__convert(cmd, args);
+		except ValueError as error:
+			message = 'Bad arguments for %s: %s' % (cmd, error);
+			return lambda: {'id' : ident, 'ok' : False, 'error' : message};
+		cached = self.__cachedRead(name, cmd);
+		if cached[0]:
+			return lambda: {'id' : ident, 'ok' : True, 'result' : self.__plain(cached[1])};
+		worker = self.__workers[name];
+		wait = False;
+		if cmd == 'MoveTo' or cmd == 'GoHome':
+			# The move is followed outside the queue, args is [target,]
+			# [timeout]
+			if cmd == 'GoHome':
+				args = [worker.device.GetRange()[0]] + args;
+			future = worker.Submit(worker.device.StartMove, *args);
+			wait = True;
+		elif kind == 'hv' and cmd in self.__hvQueries:
+			future = worker.Submit(self.__withError, worker.device, getattr(worker.device, cmd), args);
+		else:
+			future = worker.Submit(getattr(worker.device, cmd), *args);
+		def answer():
+			try:
+				result = future.result();
+				if wait:
+					result = result.Wait();
+				elif kind == 'hv' and cmd in self.__hvQueries:
+					result, error = result;
+					if not error[0]:
+						return {'id' : ident, 'ok' : False, 'error' : error[1]};
+				elif isinstance(result, (HVRamp, MotorMove)) and result.Done() and not result.Wait()[0]:
+					# Refused at once, e.g. out of range
+					return {'id' : ident, 'ok' : False, 'error' : result.Wait()[1]};
+				elif result is None and cmd == 'TurnOn':
+					return {'id' : ident, 'ok' : False, 'error' : 'E0'};
+			except Exception as error:
+				return {'id' : ident, 'ok' : False, 'error' : '%s: %s' % (type(error).__name__, error)};
+			if isinstance(result, tuple) and len(result) > 1 and result[0] is False:
+				# (False, code) of the driver, e.g. a setting out of range
+				return {'id' : ident, 'ok' : False, 'error' : self.__plain(result[1])};
+			return {'id' : ident, 'ok' : True, 'result' : self.__plain(result)};
+		return answer;
+
+	#------------------------------------------------#
+	#   Run a query with its error                   #
+	#------------------------------------------------#
+	#   Runs on the device thread, where GetLastError belongs to.
+	def __withError(self, device, func, args):
+		result = func(*args);
+		return (result, device.GetLastError());
+
+	#------------------------------------------------#
+	#   Check and convert arguments of a command     #
+	#------------------------------------------------#
+	#   Raises ValueError for a wrong number or kind of arguments, so
+	# that nothing else, e.g. a subscriber, reaches the driver.
+	def __convert(self, cmd, args):
+		if not isinstance(args, list):
+			raise ValueError('args must be a list');
+		required, optional = self.__arguments.get(cmd, ((), ()));
+		if len(args) < len(required) or len(args) > len(required) + len(optional):
+			if len(optional) == 0:
+				raise ValueError('takes %d, got %d' % (len(required), len(args)));
+			raise ValueError('takes %d to %d, got %d' % (len(required), len(required) + len(optional), len(args)));
+		return [convert(value) for convert, value in zip(required + optional, args)];
+
+	#------------------------------------------------#
+	#   Commands of the server itself                #
+	#------------------------------------------------#
+	def __serverCommand(self, ident, cmd, args):
+		if cmd == 'Ping':
+			return {'id' : ident, 'ok' : True, 'result' : 'pong'};
+		if cmd == 'List':
+			return {'id' : ident, 'ok' : True, 'result' : dict(self.__kinds)};
+		if cmd == 'Stats':
+			# args [format], 'text' or 'prometheus'
+			if self.__stats is None:
+				return {'id' : ident, 'ok' : False, 'error' : 'Stats are not enabled'};
+			if not isinstance(args, list) or len(args) > 1 or (len(args) == 1 and args[0] not in ('text', 'prometheus')):
+				return {'id' : ident, 'ok' : False, 'error' : "Bad arguments for Stats: args must be [] or ['text'] or ['prometheus']"};
+			if len(args) > 0 and args[0] == 'text':
+				return {'id' : ident, 'ok' : True, 'result' : self.__stats.Dump()};
+			return {'id' : ident, 'ok' : True, 'result' : self.__stats.DumpPrometheus()};
+		return {'id' : ident, 'ok' : False, 'error' : 'No server command ' + str(cmd)};
+
+	#------------------------------------------------#
+	#   Make a result JSON friendly                  #
+	#------------------------------------------------#
+	def __plain(self, result):
+		if isinstance(result, (HVRamp, MotorMove)):
+			return result.GetTarget();
+		if isinstance(result, tuple):
+			return [self.__plain(value) for value in result];
+		return result;
+
+	#------------------------------------------------#
+	#   Execute a request or a batch                 #
+	#------------------------------------------------#
+	def Execute(self, request):
+		if isinstance(request, list):
+			answers = [self.__start(item) for item in request];
+			return [answer() for answer in answers];
+		return self.__start(request)();
+
+	#------------------------------------------------#
+	#   Listen on an address                         #
+	#------------------------------------------------#
+	#   address is a Unix socket path or 'host:port'. Can be called for
+	# several addresses. Serves in background threads.
+	def Listen(self, address = DefaultAddress):
+		family, address = ParseAddress(address);
+		owner = self;
+		class Handler(socketserver.StreamRequestHandler):
+			def handle(self):
+				for line in self.rfile:
+					try:
+						request = json.loads(line);
+					except ValueError:
+						answer = {'id' : None, 'ok' : False, 'error' : 'Not JSON'};
+					else:
+						if isinstance(request, dict) and request.get('dev', '') in ('', 'server') and request.get('cmd') == 'Subscribe':
+							# The connection only streams from here on
+							owner.Stream(self.wfile, request.get('id'), request.get('args', []));
+							return;
+						answer = owner.Execute(request);
+					self.wfile.write(json.dumps(answer, separators=(',', ':')).encode() + b'\n');
+					self.wfile.flush();
+		if family == socket.AF_UNIX:
+			if os.path.exists(address):
+				os.remove(address);
+			server = socketserver.ThreadingUnixStreamServer(address, Handler);
+		else:
+			socketserver.ThreadingTCPServer.allow_reuse_address = True;
+			server = socketserver.ThreadingTCPServer(address, Handler);
+		server.daemon_threads = True;
+		thread = threading.Thread(target=server.serve_forever);
+		thread.daemon = True;
+		thread.start();
+		self.__servers.append((server, family, address));
+		print(' Listening on', address);
+
+	#------------------------------------------------#
+	#   Stop serving                                 #
+	#------------------------------------------------#
+	def Shutdown(self):
+		if self.__publisher is not None:
+			self.__publisher.Stop();
+		for server, family, address in self.__servers:
+			server.shutdown();
+			server.server_close();
+			if family == socket.AF_UNIX and os.path.exists(address):
+				os.remove(address);
+		self.__servers = [];
+		for worker in self.__workers.values():
+			worker.device.StopReconnect();
+			worker.Stop();
@@ -0,0 +1,259 @@
+################################################################################
+#   Simulated devices for GEM slow control.                                    #
+# Each device sits behind a pseudo-terminal, so HVControl and MotorControl     #
+# talk to it through their usual serial port code without lab hardware.       #
+#                                                                              #
+#   HV = SimulatedHeinzinger();                                                #
+#   HV.Start();                                                                #
+#   HVControl(HV.port).Connect();                                              #
+################################################################################
+
+
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+
+################################################################################
+#   Class definition of SimulatedDevice                                        #
+################################################################################
+#   Reads requests from the master side of a pseudo-terminal and writes
+# answers back after responseDelay plus the time the bytes would take
+# on a line of the given rate. Requests that arrive together, as a
+# pipelined batch does, pay responseDelay once when pipelined and their
+# answers follow each other without a pause.
+class SimulatedDevice:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	responseDelay  = 0.005; # in s, turnaround of a request
+	rate           =  9600; # baud, 0 for no transfer time
+	pipelined      =  True; # one turnaround per batch of requests
+	__Is_Running   = False;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self):
+		self.__master, self.__slave = os.openpty();
+		tty.setraw(self.__slave);
+		self.port = os.ttyname(self.__slave);
+		self.requests = 0;
+
+	#------------------------------------------------#
+	#   Start answering                              #
+	#------------------------------------------------#
+	def Start(self):
+		self.__Is_Running = True;
+		self.__thread = threading.Thread(target=self.__serve);
+		self.__thread.daemon = True;
+		self.__thread.start();
+
+	#------------------------------------------------#
+	#   Stop answering                               #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__Is_Running = False;
+		self.__thread.join();
+		os.close(self.__master);
+		os.close(self.__slave);
+
+	#------------------------------------------------#
+	#   Serve requests                               #
+	#------------------------------------------------#
+	def __serve(self):
+		while self.__Is_Running:
+			ready = select.select([self.__master], [], [], 0.05)[0];
+			if len(ready) == 0:
+				continue;
+			try:
+				data = os.read(self.__master, 1024);
+			except OSError:
+				continue;
+			for i, answer in enumerate(self.Handle(data)):
+				self.Send(answer, i == 0 or not self.pipelined);
+
+	#------------------------------------------------#
+	#   Send an answer                               #
+	#------------------------------------------------#
+	#   turnaround adds responseDelay before the transfer.
+	def Send(self, answer, turnaround = True):
+		delay = (self.responseDelay if turnaround else 0.0) + (len(answer) * 10.0 / self.rate if self.rate > 0 else 0.0);
+		if delay > 0:
+			time.sleep(delay);
+		os.write(self.__master, answer);
+
+	#------------------------------------------------#
+	#   Handle received bytes                        #
+	#------------------------------------------------#
+	#   Returns the answers in order. Implemented by each device.
+	def Handle(self, data):
+		return [];
+
+
+################################################################################
+#   Class definition of SimulatedHeinzinger                                    #
+################################################################################
+#   The SCPI subset HVControl uses. Measured values follow the setting
+# with a little noise while the output is on and are 0 otherwise.
+class SimulatedHeinzinger(SimulatedDevice):
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	measureDelay   =  0.02; # in s, extra time of MEAS queries
+	noise          =   0.5; # in V
+	load           = 1.0e7; # in Ohm, measured current is V / load
+	serialNumber   = 'HEINZINGER PNC 6000-10,SIMULATED,0';
+	version        = 'SIMULATED';
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self):
+		SimulatedDevice.__init__(self);
+		self.__buffer = b'';
+		self.Reset();
+
+	#------------------------------------------------#
+	#   Reset settings                               #
+	#------------------------------------------------#
+	def Reset(self):
+		self.voltage = 0.0;
+		self.current = 0.0;
+		self.output = False;
+
+	#------------------------------------------------#
+	#   Measured values                              #
+	#------------------------------------------------#
+	def MeasuredVoltage(self):
+		if not self.output:
+			return 0.0;
+		return max(0.0, self.voltage + random.gauss(0.0, self.noise));
+
+	def MeasuredCurrent(self):
+		return self.MeasuredVoltage() / self.load * 1e6;
+
+	#------------------------------------------------#
+	#   Handle received bytes                        #
+	#------------------------------------------------#
+	def Handle(self, data):
+		self.__buffer += data;
+		answers = [];
+		while b'\n' in self.__buffer:
+			line, self.__buffer = self.__buffer.split(b'\n', 1);
+			self.requests += 1;
+			answer = self.Command(line.decode('ascii', 'replace').strip());
+			if answer is not None:
+				answers.append((answer + '\n').encode('ascii'));
+		return answers;
+
+	#------------------------------------------------#
+	#   Execute one command                          #
+	#------------------------------------------------#
+	#   Returns the answer without terminator, None if there is none.
+	def Command(self, line):
+		words = line.split();
+		if len(words) == 0:
+			return None;
+		cmd = words[0].upper();
+		if cmd == 'VOLT?':
+			return '%.1f' % self.voltage;
+		if cmd == 'CURR?':
+			return '%.1f' % self.current;
+		if cmd == 'MEAS:VOLT?':
+			time.sleep(self.measureDelay);
+			return '%.1f' % self.MeasuredVoltage();
+		if cmd == 'MEAS:CURR?':
+			time.sleep(self.measureDelay);
+			return '%.3f' % self.MeasuredCurrent();
+		if cmd == '*IDN?':
+			return self.serialNumber;
+		if cmd == 'VERS?':
+			return self.version;
+		if cmd == 'VOLT' and len(words) > 1:
+			self.voltage = float(words[1]);
+		elif cmd == 'CURR' and len(words) > 1:
+			self.current = float(words[1]);
+		elif cmd == 'OUTP' and len(words) > 1:
+			self.output = words[1].upper() == 'ON';
+		elif cmd == '*RST':
+			self.Reset();
+		return None;
+
+
+################################################################################
+#   Class definition of SimulatedJrk                                           #
+################################################################################
+#   The Pololu Jrk byte protocol MotorControl uses. The feedback moves
+# toward the target at speed steps per second while the motor is on.
+class SimulatedJrk(SimulatedDevice):
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	speed          =   250; # in steps/s
+	responseDelay  = 0.001; # in s
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self, position = 140):
+		SimulatedDevice.__init__(self);
+		self.__buffer = b'';
+		self.__position = float(position);
+		self.__target = None;
+		self.__time = time.monotonic();
+		self.error = 0;
+
+	#------------------------------------------------#
+	#   Move the feedback up to now                  #
+	#------------------------------------------------#
+	def __update(self):
+		now = time.monotonic();
+		if self.__target is not None:
+			travel = self.speed * (now - self.__time);
+			distance = self.__target - self.__position;
+			if abs(distance) <= travel:
+				self.__position = float(self.__target);
+			else:
+				self.__position += travel if distance > 0 else -travel;
+		self.__time = now;
+
+	#------------------------------------------------#
+	#   Get feedback position                        #
+	#------------------------------------------------#
+	def GetPosition(self):
+		self.__update();
+		return int(round(self.__position));
+
+	#------------------------------------------------#
+	#   Handle received bytes                        #
+	#------------------------------------------------#
+	def Handle(self, data):
+		self.__buffer += data;
+		answers = [];
+		while len(self.__buffer):
+			cmd = self.__buffer[0];
+			if cmd & 0xE0 == 0xC0:
+				# Set target, upper 7 bits follow
+				if len(self.__buffer) < 2:
+					break;
+				self.__update();
+				self.__target = (cmd & 0x1F) + ((self.__buffer[1] & 0x7F) << 5);
+				self.__buffer = self.__buffer[2:];
+				self.requests += 1;
+				continue;
+			self.__buffer = self.__buffer[1:];
+			self.requests += 1;
+			if cmd == 0xA7:
+				position = self.GetPosition();
+				answers.append(bytes([position & 0xFF, (position >> 8) & 0xFF]));
+			elif cmd == 0xB3:
+				answers.append(bytes([self.error & 0xFF, (self.error >> 8) & 0xFF]));
+			elif cmd == 0xFF:
+				self.__update();
+				self.__target = None;
+			# 0xAA is only for baud rate detection
+		return answers;
@@ -0,0 +1,218 @@
+################################################################################
+#   Instrumentation of GEM slow control drivers.                               #
+# Counts calls, errors and bytes per device and command and keeps latency      #
+# histograms with fixed buckets. A driver only records while its stats member  #
+# is set, so with stats = None the cost is one attribute check per command.    #
+#                                                                              #
+#   stats = CommandStats();                                                    #
+#   HV.stats = stats;  Motor.stats = stats;                                    #
+#   ...                                                                        #
+#   print(stats.Dump());                                                       #
+################################################################################
+
+
+import threading
+
+
+################################################################################
+#   Class definition of LatencyHistogram                                       #
+################################################################################
+#   Fixed buckets, upper edges in s. The last bucket takes the rest.
+class LatencyHistogram:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	bounds         = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+	                  0.1, 0.2, 0.5, 1.0, 2.0, 5.0);
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self):
+		self.counts = [0] * (len(self.bounds) + 1);
+		self.count = 0;
+		self.sum = 0.0;
+		self.max = 0.0;
+
+	#------------------------------------------------#
+	#   Add a duration                               #
+	#------------------------------------------------#
+	def Add(self, duration):
+		i = 0;
+		for bound in self.bounds:
+			if duration <= bound:
+				break;
+			i += 1;
+		self.counts[i] += 1;
+		self.count += 1;
+		self.sum += duration;
+		if duration > self.max:
+			self.max = duration;
+
+	#------------------------------------------------#
+	#   Get quantile                                 #
+	#------------------------------------------------#
+	#   Upper edge of the bucket holding quantile q, at most the
+	# largest duration. 0 while empty.
+	def GetQuantile(self, q):
+		if self.count == 0:
+			return 0.0;
+		rank = q * self.count;
+		total = 0;
+		for i, n in enumerate(self.counts):
+			total += n;
+			if total >= rank and n > 0:
+				return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max;
+		return self.max;
+
+	#------------------------------------------------#
+	#   Get mean                                     #
+	#------------------------------------------------#
+	def GetMean(self):
+		return self.sum / self.count if self.count > 0 else 0.0;
+
+
+################################################################################
+#   Class definition of CommandStats                                           #
+################################################################################
+#   One instance can be shared by several drivers. Devices are told
+# apart by their port.
+class CommandStats:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	def __init__(self):
+		self.__lock = threading.Lock();
+		self.__hooks = [];
+		self.Reset();
+
+	#------------------------------------------------#
+	#   Forget everything recorded                   #
+	#------------------------------------------------#
+	def Reset(self):
+		with self.__lock:
+			self.__latency = {}; # (device, cmd) -> LatencyHistogram
+			self.__errors = {};  # (device, cmd, code) -> count
+			self.__written = {}; # device -> bytes
+			self.__read = {};    # device -> bytes
+			self.__events = {};  # (device, event) -> count
+
+	#------------------------------------------------#
+	#   Add a hook                                   #
+	#------------------------------------------------#
+	#   hook(device, cmd, duration, code) is called for every command
+	# recorded, code is '' if it succeeded. Called from the thread of
+	# the driver, so it must be quick.
+	def AddHook(self, hook):
+		self.__hooks.append(hook);
+
+	def RemoveHook(self, hook):
+		if hook in self.__hooks:
+			self.__hooks.remove(hook);
+
+	#------------------------------------------------#
+	#   Record a command                             #
+	#------------------------------------------------#
+	#   duration in s from sending to the end of the answer, code the
+	# error code of the driver or '' on success.
+	def Command(self, device, cmd, duration, code = '', written = 0, read = 0):
+		with self.__lock:
+			histogram = self.__latency.get((device, cmd));
+			if histogram is None:
+				histogram = self.__latency[(device, cmd)] = LatencyHistogram();
+			histogram.Add(duration);
+			if code != '':
+				key = (device, cmd, code);
+				self.__errors[key] = self.__errors.get(key, 0) + 1;
+			if written > 0:
+				self.__written[device] = self.__written.get(device, 0) + written;
+			if read > 0:
+				self.__read[device] = self.__read.get(device, 0) + read;
+		for hook in self.__hooks:
+			hook(device, cmd, duration, code);
+
+	#------------------------------------------------#
+	#   Record an event                              #
+	#------------------------------------------------#
+	#   e.g. 'connect', 'reconnect', 'disconnect'.
+	def Event(self, device, event):
+		with self.__lock:
+			key = (device, event);
+			self.__events[key] = self.__events.get(key, 0) + 1;
+
+	#------------------------------------------------#
+	#   Get summary                                  #
+	#------------------------------------------------#
+	#   {(device, cmd): (count, errors, mean, p50, p99, max)}, times in s.
+	def GetSummary(self):
+		with self.__lock:
+			summary = {};
+			for key, histogram in self.__latency.items():
+				errors = sum([n for (device, cmd, code), n in self.__errors.items() if (device, cmd) == key]);
+				summary[key] = (histogram.count, errors, histogram.GetMean(),
+				                histogram.GetQuantile(0.5), histogram.GetQuantile(0.99), histogram.max);
+			return summary;
+
+	#------------------------------------------------#
+	#   Get counters                                 #
+	#------------------------------------------------#
+	def GetErrors(self):
+		with self.__lock:
+			return dict(self.__errors);
+
+	def GetBytes(self, device):
+		return (self.__written.get(device, 0), self.__read.get(device, 0));
+
+	def GetEvents(self):
+		with self.__lock:
+			return dict(self.__events);
+
+	#------------------------------------------------#
+	#   Dump as text                                 #
+	#------------------------------------------------#
+	def Dump(self):
+		lines = [' %-20s %-12s %8s %6s %9s %9s %9s %9s' % ('device', 'command', 'count', 'errors', 'mean/ms', 'p50/ms', 'p99/ms', 'max/ms')];
+		for (device, cmd), values in sorted(self.GetSummary().items()):
+			lines.append(' %-20s %-12s %8d %6d %9.2f %9.2f %9.2f %9.2f'
+			             % ((device, cmd, values[0], values[1]) + tuple([1e3 * value for value in values[2:]])));
+		for (device, cmd, code), n in sorted(self.GetErrors().items()):
+			lines.append(' %-20s %-12s error %s x %d' % (device, cmd, code, n));
+		for device in sorted(set(self.__written) | set(self.__read)):
+			written, read = self.GetBytes(device);
+			lines.append(' %-20s written %d B, read %d B' % (device, written, read));
+		for (device, event), n in sorted(self.GetEvents().items()):
+			lines.append(' %-20s %s x %d' % (device, event, n));
+		return '\n'.join(lines);
+
+	#------------------------------------------------#
+	#   Dump in Prometheus text format               #
+	#------------------------------------------------#
+	def DumpPrometheus(self, prefix = 'gemsc'):
+		lines = [];
+		with self.__lock:
+			lines.append('# TYPE %s_command_seconds histogram' % prefix);
+			for (device, cmd), histogram in sorted(self.__latency.items()):
+				labels = 'device="%s",command="%s"' % (self.__escape(device), self.__escape(cmd));
+				total = 0;
+				for bound, n in zip(histogram.bounds, histogram.counts):
+					total += n;
+					lines.append('%s_command_seconds_bucket{%s,le="%g"} %d' % (prefix, labels, bound, total));
+				lines.append('%s_command_seconds_bucket{%s,le="+Inf"} %d' % (prefix, labels, histogram.count));
+				lines.append('%s_command_seconds_sum{%s} %.9g' % (prefix, labels, histogram.sum));
+				lines.append('%s_command_seconds_count{%s} %d' % (prefix, labels, histogram.count));
+			lines.append('# TYPE %s_command_errors_total counter' % prefix);
+			for (device, cmd, code), n in sorted(self.__errors.items()):
+				lines.append('%s_command_errors_total{device="%s",command="%s",code="%s"} %d'
+				             % (prefix, self.__escape(device), self.__escape(cmd), code, n));
+			for name, counts in (('bytes_written', self.__written), ('bytes_read', self.__read)):
+				lines.append('# TYPE %s_%s_total counter' % (prefix, name));
+				for device, n in sorted(counts.items()):
+					lines.append('%s_%s_total{device="%s"} %d' % (prefix, name, self.__escape(device), n));
+			lines.append('# TYPE %s_events_total counter' % prefix);
+			for (device, event), n in sorted(self.__events.items()):
+				lines.append('%s_events_total{device="%s",event="%s"} %d' % (prefix, self.__escape(device), event, n));
+		return '\n'.join(lines) + '\n';
+
+	@staticmethod
+	def __escape(value):
+		return str(value).replace('\\', '\\\\').replace('"', '\\"');
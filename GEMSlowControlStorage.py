@@ -0,0 +1,201 @@
+################################################################################
+#   Binary storage of GEM slow control time series.                            #
+# A file is a fixed header followed by fixed-width records of little-endian    #
+# float64 columns, the first of which is the unix time. Records are appended   #
+# as they arrive and time ranges are read through a memory map by binary       #
+# search on the time column, so nothing has to be parsed.                      #
+################################################################################
+
+
+import numpy
+import os
+
+
+# Columns of the usual stores
+HVFields    = ('voltage', 'current');
+MotorFields = ('step', 'position');
+
+
+################################################################################
+#   Convert a reading to float, NaN if it failed                               #
+################################################################################
+def ToFloat(value):
+	try:
+		return float(value);
+	except (TypeError, ValueError):
+		return float('nan');
+
+
+################################################################################
+#   Class definition of SlowControlStore                                       #
+################################################################################
+class SlowControlStore:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	__magic        = b'GEMSC001';
+	__headerSize   =       256; # in bytes
+	bufferSize     =         1; # records kept before writing
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   An existing file keeps its own columns and fields must match
+	# them if given. A new file needs fields.
+	def __init__(self, path, fields = None):
+		self.__path = path;
+		self.__pending = [];
+		self.__lastTime = -float('inf');
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			stored = self.__readHeader();
+			if fields is not None and tuple(fields) != stored:
+				raise ValueError('%s has columns %s, not %s' % (path, stored, tuple(fields)));
+			fields = stored;
+		elif fields is None:
+			raise ValueError('%s does not exist and no columns are given' % path);
+		else:
+			self.__writeHeader(tuple(fields));
+		self.__fields = tuple(fields);
+		self.__dtype = numpy.dtype([('time', '<f8')] + [(field, '<f8') for field in self.__fields]);
+		size = self.GetSize();
+		complete = self.__headerSize + size * self.__dtype.itemsize;
+		if os.path.getsize(path) > complete:
+			# A record cut short, e.g. by a crash, would shift every later one
+			print(' Dropped', os.path.getsize(path) - complete, 'bytes of an incomplete record at the end of', path);
+			os.truncate(path, complete);
+		if size > 0:
+			self.__lastTime = float(self.__map()['time'][size-1]);
+		self.__file = open(path, 'ab');
+
+	#------------------------------------------------#
+	#   Header                                       #
+	#------------------------------------------------#
+	def __writeHeader(self, fields):
+		header = self.__magic + ' '.join(fields).encode('ascii') + b'\n';
+		if len(header) > self.__headerSize:
+			raise ValueError('Too many columns for %s' % self.__path);
+		with open(self.__path, 'wb') as f:
+			f.write(header.ljust(self.__headerSize, b'\0'));
+
+	def __readHeader(self):
+		with open(self.__path, 'rb') as f:
+			header = f.read(self.__headerSize);
+		if not header.startswith(self.__magic) or len(header) < self.__headerSize:
+			raise ValueError('%s is not a slow control store' % self.__path);
+		return tuple(header[len(self.__magic):].split(b'\n')[0].decode('ascii').split());
+
+	#------------------------------------------------#
+	#   Get columns                                  #
+	#------------------------------------------------#
+	def GetFields(self):
+		return self.__fields;
+
+	#------------------------------------------------#
+	#   Append one record                            #
+	#------------------------------------------------#
+	#   Time must not go backwards, otherwise range reads would be
+	# wrong. Such a record is refused.
+	def Append(self, timestamp, *values):
+		if len(values) != len(self.__fields):
+			print(' Expected', len(self.__fields), 'values', self.__fields, 'but got', len(values));
+			return False;
+		if timestamp < self.__lastTime:
+			print(' Record at', timestamp, 'is older than the last one at', self.__lastTime, 'in', self.__path);
+			return False;
+		self.__lastTime = timestamp;
+		self.__pending.append((timestamp,) + tuple([ToFloat(value) for value in values]));
+		if len(self.__pending) >= self.bufferSize:
+			self.Flush();
+		return True;
+
+	#------------------------------------------------#
+	#   Append many records at once                  #
+	#------------------------------------------------#
+	#   times is 1-D, columns is one 1-D array per field.
+	def AppendArrays(self, times, *columns):
+		times = numpy.asarray(times, dtype='<f8');
+		if len(times) == 0:
+			return True;
+		if numpy.any(numpy.diff(times) < 0) or times[0] < self.__lastTime:
+			print(' Records are not in time order, refused for', self.__path);
+			return False;
+		self.Flush();
+		records = numpy.empty(len(times), dtype=self.__dtype);
+		records['time'] = times;
+		for field, column in zip(self.__fields, columns):
+			records[field] = column;
+		self.__file.write(records.tobytes());
+		self.__file.flush();
+		self.__lastTime = float(times[-1]);
+		return True;
+
+	#------------------------------------------------#
+	#   Write pending records                        #
+	#------------------------------------------------#
+	def Flush(self):
+		if len(self.__pending):
+			self.__file.write(numpy.array(self.__pending, dtype=self.__dtype).tobytes());
+			self.__pending = [];
+		self.__file.flush();
+
+	#------------------------------------------------#
+	#   Close                                        #
+	#------------------------------------------------#
+	def Close(self):
+		self.Flush();
+		self.__file.close();
+
+	#------------------------------------------------#
+	#   Number of complete records on disk           #
+	#------------------------------------------------#
+	def GetSize(self):
+		return (os.path.getsize(self.__path) - self.__headerSize) // self.__dtype.itemsize;
+
+	#------------------------------------------------#
+	#   Memory map of the records on disk            #
+	#------------------------------------------------#
+	def __map(self):
+		size = self.GetSize();
+		if size <= 0:
+			return numpy.zeros(0, dtype=self.__dtype);
+		return numpy.memmap(self.__path, dtype=self.__dtype, mode='r', offset=self.__headerSize, shape=(size,));
+
+	#------------------------------------------------#
+	#   Read records in [start, stop)                #
+	#------------------------------------------------#
+	#   Only the pages holding the range are touched. The result is a
+	# read-only view into the file; copy it to keep it after Close.
+	def Read(self, start = None, stop = None):
+		records = self.__map();
+		first = 0 if start is None else numpy.searchsorted(records['time'], start, side='left');
+		last = len(records) if stop is None else numpy.searchsorted(records['time'], stop, side='left');
+		return records[first:last];
+
+	#------------------------------------------------#
+	#   Read last n records                          #
+	#------------------------------------------------#
+	def Tail(self, n):
+		records = self.__map();
+		return records[max(0, len(records)-n):];
+
+
+################################################################################
+#   Stores with the usual columns                                              #
+################################################################################
+def HVStore(path):
+	return SlowControlStore(path, HVFields);
+
+def MotorStore(path):
+	return SlowControlStore(path, MotorFields);
+
+
+################################################################################
+#   Import text output of GetHV.py or HVLogger.py into a store                 #
+################################################################################
+def ImportText(textPath, store):
+	data = numpy.genfromtxt(textPath, ndmin=2, invalid_raise=False);
+	if data.size == 0:
+		return 0;
+	data = data[numpy.argsort(data[:,0], kind='stable')];
+	store.AppendArrays(data[:,0], *[data[:,i+1] for i in range(len(store.GetFields()))]);
+	return len(data);
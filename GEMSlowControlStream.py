@@ -0,0 +1,241 @@
+################################################################################
+#   Publish/subscribe of live GEM slow control readings.                       #
+# Every source is sampled once per period by its own thread, and each reading  #
+# is handed to all subscribers. A subscriber has a bounded queue: when it      #
+# falls behind, its oldest readings are dropped, so a slow viewer never holds  #
+# up acquisition and the serial load does not depend on the number of viewers. #
+################################################################################
+
+
+import collections
+import threading
+import time
+
+
+################################################################################
+#   Sources of the drivers                                                     #
+################################################################################
+#   A source returns a tuple of values, or None if the reading failed.
+def HVSource(hv):
+	def source():
+		values = hv.GetMeasurement(0);
+		return None if '' in values else values;
+	return source;
+
+def MotorSource(motor):
+	def source():
+		ans = motor.GetPosition(0);
+		return (ans[1], ans[2]) if ans[0] else None;
+	return source;
+
+
+################################################################################
+#   Class definition of Subscription                                           #
+################################################################################
+class Subscription:
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   Keeps at most maxSize readings. With every = n only each n-th
+	# reading of a source is kept. names limits it to some sources,
+	# None for all.
+	def __init__(self, maxSize = 100, every = 1, names = None):
+		self.__queue = collections.deque(maxlen=max(1, maxSize));
+		self.__condition = threading.Condition();
+		self.__every = max(1, int(every));
+		self.__names = None if names is None else set(names);
+		self.__counts = {};
+		self.__dropped = 0;
+		self.__Is_Open = True;
+
+	#------------------------------------------------#
+	#   Offer a reading                              #
+	#------------------------------------------------#
+	#   Never blocks. Called by the Publisher.
+	def Put(self, record):
+		name = record[1];
+		if self.__names is not None and name not in self.__names:
+			return;
+		with self.__condition:
+			count = self.__counts.get(name, 0);
+			self.__counts[name] = count + 1;
+			if count % self.__every != 0:
+				return;
+			if len(self.__queue) == self.__queue.maxlen:
+				self.__dropped += 1;
+			self.__queue.append(record);
+			self.__condition.notify();
+
+	#------------------------------------------------#
+	#   Take the oldest reading                      #
+	#------------------------------------------------#
+	#   Returns (timestamp, name, values), or None after timeout or
+	# when closed.
+	def Get(self, timeout = None):
+		with self.__condition:
+			if not self.__condition.wait_for(lambda: len(self.__queue) > 0 or not self.__Is_Open, timeout):
+				return None;
+			if len(self.__queue) == 0:
+				return None;
+			return self.__queue.popleft();
+
+	#------------------------------------------------#
+	#   Take everything queued                       #
+	#------------------------------------------------#
+	def GetAll(self):
+		with self.__condition:
+			records = list(self.__queue);
+			self.__queue.clear();
+			return records;
+
+	#------------------------------------------------#
+	#   Get number of dropped readings               #
+	#------------------------------------------------#
+	def GetDropped(self):
+		return self.__dropped;
+
+	#------------------------------------------------#
+	#   Get whether it is still open                 #
+	#------------------------------------------------#
+	def IsOpen(self):
+		return self.__Is_Open;
+
+	#------------------------------------------------#
+	#   Close, wakes up a waiting Get                #
+	#------------------------------------------------#
+	def Close(self):
+		with self.__condition:
+			self.__Is_Open = False;
+			self.__condition.notify_all();
+
+
+################################################################################
+#   Class definition of Publisher                                              #
+################################################################################
+class Publisher:
+	#------------------------------------------------#
+	#   Members                                      #
+	#------------------------------------------------#
+	period         =   1.0; # in s, per source
+	__Is_Running   = False;
+
+	#------------------------------------------------#
+	#   Initialize when constructed                  #
+	#------------------------------------------------#
+	#   period must be above 0, sampling has to leave the device time
+	# for other requests.
+	def __init__(self, period = 1.0):
+		if not float(period) > 0:
+			raise ValueError('Period must be above 0 s, not %s' % period);
+		self.period = float(period);
+		self.__sources = {};
+		self.__subscriptions = [];
+		self.__lock = threading.Lock();
+		self.__stop = threading.Event();
+		self.__threads = [];
+		self.__last = {};
+
+	#------------------------------------------------#
+	#   Add a source                                 #
+	#------------------------------------------------#
+	#   source() returns a tuple of values or None. A source added
+	# while running starts at once.
+	def AddSource(self, name, source):
+		self.__sources[name] = source;
+		if self.__Is_Running:
+			self.__startSource(name);
+
+	#------------------------------------------------#
+	#   Subscribe                                    #
+	#------------------------------------------------#
+	#   The latest reading of every source is queued at once so that a
+	# new viewer has something to show.
+	def Subscribe(self, maxSize = 100, every = 1, names = None):
+		subscription = Subscription(maxSize, every, names);
+		with self.__lock:
+			for record in list(self.__last.values()):
+				subscription.Put(record);
+			self.__subscriptions.append(subscription);
+		return subscription;
+
+	def Unsubscribe(self, subscription):
+		with self.__lock:
+			if subscription in self.__subscriptions:
+				self.__subscriptions.remove(subscription);
+		subscription.Close();
+
+	#------------------------------------------------#
+	#   Get number of subscribers                    #
+	#------------------------------------------------#
+	def GetSubscribers(self):
+		return len(self.__subscriptions);
+
+	#------------------------------------------------#
+	#   Get latest reading of a source               #
+	#------------------------------------------------#
+	#   (timestamp, name, values) or None.
+	def GetLatest(self, name):
+		return self.__last.get(name);
+
+	#------------------------------------------------#
+	#   Hand a reading to all subscribers            #
+	#------------------------------------------------#
+	def Publish(self, name, values, timestamp = None):
+		record = (time.time() if timestamp is None else timestamp, name, values);
+		with self.__lock:
+			self.__last[name] = record;
+			subscriptions = list(self.__subscriptions);
+		for subscription in subscriptions:
+			if subscription.IsOpen():
+				subscription.Put(record);
+			else:
+				self.Unsubscribe(subscription);
+
+	#------------------------------------------------#
+	#   Start sampling                               #
+	#------------------------------------------------#
+	def Start(self):
+		self.__Is_Running = True;
+		self.__stop.clear();
+		for name in list(self.__sources):
+			self.__startSource(name);
+
+	def __startSource(self, name):
+		thread = threading.Thread(target=self.__sample, args=(name,));
+		thread.daemon = True;
+		thread.start();
+		self.__threads.append(thread);
+
+	#------------------------------------------------#
+	#   Sample one source on a fixed time grid       #
+	#------------------------------------------------#
+	def __sample(self, name):
+		source = self.__sources[name];
+		start = time.monotonic();
+		k = 0;
+		while not self.__stop.is_set():
+			begin = time.time();
+			values = source();
+			if values is not None:
+				# Stamped with the middle of the query
+				self.Publish(name, values, (begin + time.time()) / 2);
+			k += 1;
+			now = time.monotonic();
+			# Skip slots already passed
+			k = max(k, int((now - start) / self.period) + 1);
+			if self.__stop.wait(start + k * self.period - now):
+				break;
+
+	#------------------------------------------------#
+	#   Stop sampling                                #
+	#------------------------------------------------#
+	def Stop(self):
+		self.__stop.set();
+		self.__Is_Running = False;
+		for thread in self.__threads:
+			thread.join();
+		self.__threads = [];
+		with self.__lock:
+			subscriptions = list(self.__subscriptions);
+		for subscription in subscriptions:
+			subscription.Close();
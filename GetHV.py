@@ -13,9 +13,11 @@ if __name__ == '__main__':
 	HV = HVControl('/dev/ttyUSB0');
 	HV.Connect();
 
-	timestamp = int(time.time());
-	vol = HV.MeasureVoltage();
-	cur = HV.MeasureCurrent();
+	# Middle of the query, to the microsecond, so readings can be
+	# matched to event times
+	start = time.time();
+	vol, cur = HV.GetMeasurement();
+	timestamp = (start + time.time()) / 2;
 
 #	print('Time =', timestamp, ', Voltage =', vol, ', Current =', cur);
-	print(timestamp, vol, cur);
+	print('%.6f' % timestamp, vol, cur);
@@ -18,10 +18,17 @@ from GEMSlowControlClasses import HVControl
 if __name__ == '__main__':
 
 	HV = HVControl('/dev/ttyUSB0');
+	HV.autoReconnect = True;
 	HV.PrintWelcome();
 	HV.Connect();
 
-	while HV.IsReady():
+	while HV.IsReady() or HV.IsReconnecting():
+		# Wait for a lost connection rather than quit
+		if not HV.IsReady():
+			print(' Connection lost. Reconnecting...');
+			if not HV.WaitReady(60):
+				print(' Still not connected. Press Ctrl-C to quit.');
+				continue;
 		HV.PrintStatus();
 		menu = HV.PrintMenu();
 		if menu == '0':
@@ -29,7 +36,10 @@ if __name__ == '__main__':
 			print();
 		if menu == '1':
 			command = input(' -> Voltage? (in V): ');
-			HV.SetVoltage(command);
+			try:
+				HV.RampVoltage(float(command));
+			except ValueError:
+				print(' Not a voltage:', command);
 			print();
 		if menu == '2':
 			command = input(' -> Current? (in uA): ');
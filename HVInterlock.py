@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to watch HV currents and make the supplies safe on a discharge      #
+# Reads MEAS:CURR? of every supply as fast as it answers and trips on the      #
+# rules given. Each trip is logged with the readings leading up to it. A       #
+# supply that stops answering raises an alert, or trips with --blind trip.     #
+#                                                                              #
+#   ./HVInterlock.py -c stack.cfg --limit 50 --spike 200 --all -o trips.log    #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl
+from GEMSlowControlInterlock import Interlock, CurrentLimit, CurrentSpike, RepeatedTrips
+import argparse
+import sys
+import time
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Watch HV currents and trip on discharges.');
+	parser.add_argument('-p', '--port', default='/dev/ttyUSB0', help='serial port of the HV supply');
+	parser.add_argument('-c', '--config', default='', help='configuration of several supplies, instead of --port');
+	parser.add_argument('--limit', type=float, default=0, help='trip above this current in uA, 0 for none');
+	parser.add_argument('--spike', type=float, default=0, help='trip when current rises faster in uA/s, 0 for none');
+	parser.add_argument('--repeat', nargs=3, type=float, metavar=('UA', 'COUNT', 'SECONDS'), help='trip on COUNT excursions above UA within SECONDS');
+	parser.add_argument('--action', choices=('off', 'zero', 'ramp'), default='off', help='what a trip does');
+	parser.add_argument('--all', action='store_true', help='a trip acts on every supply');
+	parser.add_argument('-r', '--rate', type=float, default=20, help='highest readings per second per supply');
+	parser.add_argument('--max-failures', type=int, default=10, help='failed readings in a row before a supply counts as blind, 0 for no limit');
+	parser.add_argument('--max-age', type=float, default=0, help='seconds without a reading before a supply counts as blind, 0 for no limit');
+	parser.add_argument('--blind', choices=('alert', 'trip'), default='alert', help='what a blind supply does');
+	parser.add_argument('-o', '--output', default='', help='trip log, stderr if not given');
+	args = parser.parse_args();
+
+	rules = [];
+	if args.limit > 0:
+		rules.append(CurrentLimit(args.limit));
+	if args.spike > 0:
+		rules.append(CurrentSpike(args.spike));
+	if args.repeat is not None:
+		rules.append(RepeatedTrips(args.repeat[0], int(args.repeat[1]), args.repeat[2]));
+	if len(rules) == 0:
+		parser.error('Give at least one of --limit, --spike and --repeat');
+
+	if args.config != '':
+		from GEMSlowControlManager import HVManager
+		HV = HVManager(args.config);
+	else:
+		HV = HVControl(args.port);
+	if not HV.Connect():
+		sys.exit(1);
+
+	log = open(args.output, 'a') if args.output != '' else sys.stderr;
+	interlock = Interlock(HV, rules, args.action, 'all' if args.all else 'supply', log);
+	interlock.period = 1.0 / args.rate;
+	interlock.maxFailures = args.max_failures;
+	interlock.maxAge = args.max_age;
+	interlock.blindAction = args.blind;
+	interlock.Subscribe(lambda name, reason, latency: print(' Tripped', name, '(', reason, ') in %.2f ms' % (latency * 1e3)));
+	interlock.SubscribeAlerts(lambda name, reason: print(' Alert', name, '(', reason, ')'));
+	interlock.Start();
+	print(' Watching. Press Ctrl-C to stop.');
+	try:
+		while True:
+			time.sleep(1);
+	except KeyboardInterrupt:
+		pass;
+	interlock.Stop();
+	latencies = interlock.GetLatencies();
+	if len(latencies) > 0:
+		print(' Trips: %d, latency mean %.2f ms, max %.2f ms' % (len(latencies), 1e3 * sum(latencies) / len(latencies), 1e3 * max(latencies)));
+	if log is not sys.stderr:
+		log.close();
+	print(' Bye bye :)');
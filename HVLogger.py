@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to log HV continuously                                              #
+# Keeps the port open and writes 'timestamp voltage current' lines at a fixed  #
+# rate. Statistics of the achieved rate go to stderr. With a configuration of  #
+# several supplies (see GEMSlowControlManager) all of them are measured at     #
+# once and each line holds 'timestamp v1 i1 v2 i2 ...'.                        #
+#   With --adaptive the rate goes up to --rate while readings change or the   #
+# current comes close to its setting and down to the slower rate otherwise.    #
+# With --budget each supply gets such a rate of its own, and all of them       #
+# together make at most that many serial queries per second.                   #
+#   With --capture the serial traffic is recorded, with --replay such a        #
+# recording stands in for the supplies (see GEMSlowControlCapture), and with   #
+# --recorded-time its readings are stamped with the time of the recording.     #
+################################################################################
+
+
+from GEMSlowControlClasses import HVControl
+from GEMSlowControlLogger import HVLogger
+import argparse
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Log HV continuously.');
+	parser.add_argument('-p', '--port', default='/dev/ttyUSB0', help='serial port of the HV supply');
+	parser.add_argument('-c', '--config', default='', help='configuration of several supplies, instead of --port');
+	parser.add_argument('-r', '--rate', type=float, default=1.0, help='samples per second');
+	parser.add_argument('-o', '--output', default='', help='output file, stdout if not given');
+	parser.add_argument('-b', '--store', default='', help='binary store to append to as well');
+	parser.add_argument('-t', '--tolerance', nargs=2, type=float, metavar=('V', 'UA'), help='only store what is needed to rebuild readings within this');
+	parser.add_argument('--deadband', action='store_true', help='with --tolerance, hold values instead of swinging door');
+	parser.add_argument('--rollup', action='store_true', help='keep min/max/mean rollups of --store for plotting');
+	parser.add_argument('-q', '--quiet', action='store_true', help='no text output');
+	parser.add_argument('-n', '--count', type=int, default=0, help='stop after this many samples');
+	parser.add_argument('-s', '--stats', type=float, default=60, help='seconds between statistics reports, 0 for none');
+	parser.add_argument('-a', '--adaptive', type=float, default=0, metavar='RATE', help='slowest samples per second of adaptive rate, 0 for a fixed rate');
+	parser.add_argument('--capture', default='', help='record the serial traffic to this file');
+	parser.add_argument('--replay', default='', help='play back a capture instead of using the port');
+	parser.add_argument('--speed', type=float, default=1.0, help='speed of --replay, 0 for as fast as possible');
+	parser.add_argument('--recorded-time', action='store_true', help='stamp readings of --replay with the time of the capture');
+	parser.add_argument('--resolution', nargs=2, type=float, default=(1.0, 0.1), metavar=('V', 'UA'), help='changes worth a sample with --adaptive');
+	parser.add_argument('--budget', type=float, default=0, metavar='QUERIES', help='adaptive rate per supply within this many queries per second over all supplies');
+	args = parser.parse_args();
+	if args.recorded_time and args.replay == '':
+		parser.error('--recorded-time needs --replay');
+
+	if args.config != '':
+		from GEMSlowControlManager import HVManager
+		HV = HVManager(args.config);
+		fields = HV.GetFields();
+	else:
+		HV = HVControl(args.port);
+		fields = ('voltage', 'current');
+	transport = None;
+	if args.replay != '':
+		from GEMSlowControlCapture import Replay
+		transport = Replay(args.replay, args.speed);
+	elif args.capture != '':
+		from GEMSlowControlCapture import CaptureLog, Capture
+		capture = CaptureLog(args.capture);
+		transport = Capture(capture);
+	if transport is not None:
+		for device in ([HV.GetDevice(name) for name in HV.GetNames()] if args.config != '' else [HV]):
+			device.transport = transport;
+	if not HV.Connect():
+		sys.exit(1);
+
+	output = open(args.output, 'a') if args.output != '' else sys.stdout;
+	if args.quiet:
+		output = None;
+	store = None;
+	if args.store != '':
+		from GEMSlowControlStorage import SlowControlStore
+		store = SlowControlStore(args.store, fields);
+		if args.tolerance is not None:
+			from GEMSlowControlRecorder import DeadbandRecorder
+			store = DeadbandRecorder(store, tuple(args.tolerance) * (len(fields) // 2), 'deadband' if args.deadband else 'door');
+		if args.rollup:
+			from GEMSlowControlRollup import Rollup
+			store = Rollup(args.store, fields, store=store);
+	if args.budget > 0:
+		from GEMSlowControlLogger import ScheduledLogger
+		logger = ScheduledLogger(HV, args.budget, output, store, args.resolution, 1.0 / args.rate, 1.0 / args.adaptive if args.adaptive > 0 else 10.0);
+	else:
+		logger = HVLogger(HV, output, 1.0 / args.rate, store);
+	logger.statsInterval = args.stats;
+	if args.adaptive > 0 and args.budget <= 0:
+		from GEMSlowControlScheduler import HVSchedule
+		logger.schedule = HVSchedule(HV, args.resolution[0], args.resolution[1], 1.0 / args.rate, 1.0 / args.adaptive);
+	if args.replay != '':
+		# The replay keeps the timing, the logger follows it until the end
+		if args.budget <= 0:
+			logger.period = 0.0;
+		transport.finished = logger.Stop;
+		if args.recorded_time:
+			logger.clock = transport.Time;
+	try:
+		logger.Run(args.count);
+	except KeyboardInterrupt:
+		pass;
+	logger.PrintStats(sys.stderr);
+	if output is not None and output is not sys.stdout:
+		output.close();
+	if store is not None:
+		store.Close();
+	if args.capture != '' and args.replay == '':
+		capture.Close();
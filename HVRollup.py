@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to build and read rollups of a binary store                         #
+# 'build' sums up the readings of a store (see GEMSlowControlStorage) into     #
+# min/max/mean/count levels next to it, e.g. after ImportText. 'query' prints  #
+# a time range at about the given number of points, one line per bucket:      #
+# 'time width min max mean count' for each column.                             #
+################################################################################
+
+
+from GEMSlowControlStorage import SlowControlStore
+from GEMSlowControlRollup import Rollup
+import argparse
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Build and read rollups of a binary store.');
+	parser.add_argument('action', choices=['build', 'query'], help='what to do');
+	parser.add_argument('store', help='binary store of the readings');
+	parser.add_argument('-l', '--levels', type=float, nargs='+', default=[1, 10, 60, 600], help='bucket widths in s');
+	parser.add_argument('-b', '--begin', type=float, default=None, help='first time of the query, first record if not given');
+	parser.add_argument('-e', '--end', type=float, default=None, help='last time of the query, last record if not given');
+	parser.add_argument('-n', '--points', type=int, default=1000, help='points wanted by the query');
+	args = parser.parse_args();
+
+	raw = SlowControlStore(args.store);
+	fields = raw.GetFields();
+	rollup = Rollup(args.store, fields, args.levels);
+	if args.action == 'build':
+		print(' Summed up', rollup.Build(raw), 'records into levels of', ' '.join(['%g s' % width for width in rollup.GetWidths()]));
+		rollup.Close();
+		sys.exit(0);
+
+	records = raw.Tail(1);
+	if len(records) == 0:
+		sys.exit(0);
+	begin = args.begin if args.begin is not None else raw.Read()['time'][0];
+	end = args.end if args.end is not None else records['time'][-1] + 1e-6;
+	result = rollup.Query(begin, end, args.points, raw);
+	for i in range(len(result['time'])):
+		line = '%.3f %g' % (result['time'][i], result['width']);
+		for field in fields:
+			line += ' %g %g %g %d' % tuple([column[i] for column in result[field]]);
+		print(line);
+	# Open buckets are kept for the next one
+	rollup.Close();
@@ -29,7 +29,8 @@ if __name__ == '__main__':
 		if menu == '1':
 			pos = input(' Move to: ');
 			pos = int(pos);
-			Motor.MoveTo(pos);
+			move = Motor.StartMove(pos, 0, lambda step, position: print('  at', step, '(', position, 'mm )'));
+			print(' Result:', move.Wait());
 		if menu == '2':
 			print('Bye bye :)');
 			break;
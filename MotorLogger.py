@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to log the actuator position continuously                           #
+# Keeps the port open and writes 'timestamp step position' lines at a fixed    #
+# rate, each stamped with the middle of its query. With --store the records    #
+# go to a binary store (see GEMSlowControlStorage) that AlignEvents.py joins   #
+# to event times. Statistics of the achieved rate go to stderr.                #
+#   With --adaptive the rate goes up to --rate while the actuator moves and    #
+# down to the slower rate while it stands.                                     #
+#                                                                              #
+#   ./MotorLogger.py -m /dev/ttyACM1 -r 10 -a 0.2 -b motor.gsc -q              #
+################################################################################
+
+
+from GEMSlowControlClasses import MotorControl
+from GEMSlowControlLogger import MotorLogger
+import argparse
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Log the actuator position continuously.');
+	parser.add_argument('-m', '--motor', default='/dev/ttyACM1', help='serial port of the motor');
+	parser.add_argument('-r', '--rate', type=float, default=1.0, help='samples per second');
+	parser.add_argument('-o', '--output', default='', help='output file, stdout if not given');
+	parser.add_argument('-b', '--store', default='', help='binary store to append to as well');
+	parser.add_argument('-q', '--quiet', action='store_true', help='no text output');
+	parser.add_argument('-n', '--count', type=int, default=0, help='stop after this many samples');
+	parser.add_argument('-s', '--stats', type=float, default=60, help='seconds between statistics reports, 0 for none');
+	parser.add_argument('-a', '--adaptive', type=float, default=0, metavar='RATE', help='slowest samples per second of adaptive rate, 0 for a fixed rate');
+	args = parser.parse_args();
+
+	Motor = MotorControl(args.motor);
+	if not Motor.Connect()[0]:
+		sys.exit(1);
+
+	output = open(args.output, 'a') if args.output != '' else sys.stdout;
+	if args.quiet:
+		output = None;
+	store = None;
+	if args.store != '':
+		from GEMSlowControlStorage import MotorStore
+		store = MotorStore(args.store);
+	logger = MotorLogger(Motor, output, 1.0 / args.rate, store);
+	logger.statsInterval = args.stats;
+	if args.adaptive > 0:
+		from GEMSlowControlScheduler import MotorSchedule
+		logger.schedule = MotorSchedule(Motor, 1.0 / args.rate, 1.0 / args.adaptive);
+	try:
+		logger.Run(args.count);
+	except KeyboardInterrupt:
+		pass;
+	logger.PrintStats(sys.stderr);
+	if output is not None and output is not sys.stdout:
+		output.close();
+	if store is not None:
+		store.Close();
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to scan positions of the linear actuator                            #
+# Moves through the given positions in the order of least travel and records  #
+# HV readings at each of them into one result file.                            #
+#                                                                              #
+#   ./MotorScan.py --range 140 3610 500 -o scan.txt                            #
+#   ./MotorScan.py --list 1310 1350 1400 --mm -c stack.cfg -o scan.txt         #
+################################################################################
+
+
+from GEMSlowControlClasses import MotorControl, HVControl
+from GEMSlowControlScan import PositionScan, PositionRange
+from GEMSlowControlCalibration import LoadCalibration
+import argparse
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Scan positions of the linear actuator.');
+	parser.add_argument('-m', '--motor', default='/dev/ttyACM1', help='serial port of the motor controller');
+	parser.add_argument('-p', '--port', default='/dev/ttyUSB0', help='serial port of the HV supply');
+	parser.add_argument('-c', '--config', default='', help='configuration of several supplies, instead of --port');
+	parser.add_argument('--no-hv', action='store_true', help='do not read HV');
+	parser.add_argument('--range', nargs=3, type=float, metavar=('FIRST', 'LAST', 'STEP'), help='positions from FIRST to LAST');
+	parser.add_argument('--list', nargs='+', type=float, help='positions');
+	parser.add_argument('--mm', action='store_true', help='positions are in mm instead of steps');
+	parser.add_argument('-k', '--calibration', default='', help='file of measured "step mm" points');
+	parser.add_argument('-d', '--degree', type=int, default=0, help='polynomial degree of the calibration, 0 for piecewise linear');
+	parser.add_argument('-s', '--settle', type=float, default=1.0, help='seconds to wait after arrival');
+	parser.add_argument('-n', '--readings', type=int, default=10, help='HV readings per point');
+	parser.add_argument('-i', '--interval', type=float, default=0.0, help='seconds between HV readings');
+	parser.add_argument('-o', '--output', default='', help='result file, stdout if not given');
+	args = parser.parse_args();
+
+	positions = [];
+	if args.range is not None:
+		positions += PositionRange(*args.range);
+	if args.list is not None:
+		positions += args.list;
+	if len(positions) == 0:
+		parser.error('Give positions with --range or --list');
+	if not args.mm:
+		positions = [int(round(pos)) for pos in positions];
+
+	Motor = MotorControl(args.motor);
+	if args.calibration != '':
+		Motor.calibration = LoadCalibration(args.calibration, args.degree);
+	if not Motor.Connect()[0]:
+		sys.exit(1);
+	HV = None;
+	if not args.no_hv:
+		if args.config != '':
+			from GEMSlowControlManager import HVManager
+			HV = HVManager(args.config);
+		else:
+			HV = HVControl(args.port);
+		if not HV.Connect():
+			sys.exit(1);
+
+	scan = PositionScan(Motor, HV, positions, 'mm' if args.mm else 'step');
+	scan.settleTime = args.settle;
+	scan.readings = args.readings;
+	scan.readInterval = args.interval;
+	print(' Plan:', scan.GetPlan());
+	try:
+		done = scan.Run(args.output if args.output != '' else sys.stdout);
+	except KeyboardInterrupt:
+		Motor.MotorStop();
+		done = False;
+	print(' Done.' if done else ' Not finished.');
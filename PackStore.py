@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to pack a binary store for archiving                                #
+# Writes the records of a store (see GEMSlowControlStorage), usually thinned   #
+# by HVLogger.py --tolerance, with the timestamps as varints of their          #
+# differences. The packed file is read back and checked before it is kept.     #
+# AlignEvents.py reads packed stores like binary ones.                         #
+#                                                                              #
+#   ./PackStore.py hv.gsc hv.gsp                                               #
+################################################################################
+
+
+from GEMSlowControlRecorder import PackStore
+from GEMSlowControlStorage import SlowControlStore
+import argparse
+import os
+import sys
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Pack a binary store for archiving.');
+	parser.add_argument('store', help='binary store');
+	parser.add_argument('output', help='packed file to write');
+	parser.add_argument('-r', '--resolution', type=float, default=1e-6, help='resolution of the timestamps in s');
+	args = parser.parse_args();
+
+	store = SlowControlStore(args.store);
+	try:
+		records, size = PackStore(store, args.output, args.resolution);
+	except ValueError as error:
+		print('', error);
+		os.remove(args.output);
+		sys.exit(1);
+	store.Close();
+	original = os.path.getsize(args.store);
+	print(' Packed', records, 'records from', original, 'to', size, 'bytes (%.1f%%)' % (100.0 * size / max(1, original)));
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   One-shot reading of HV or motor for scripts and cron                       #
+# Imports only what the chosen path needs: the serial driver when reading the  #
+# port, the socket client when asking a running SlowControlServer.py. Prints   #
+# one line of text, JSON or CSV and exits non-zero if the reading failed.      #
+#                                                                              #
+#   ./QuickRead.py hv -p /dev/ttyUSB0                                          #
+#   ./QuickRead.py hv --status -f json -s /tmp/gemslowcontrol.sock             #
+#   ./QuickRead.py motor -s /tmp/gemslowcontrol.sock -f csv --header           #
+################################################################################
+
+
+import argparse
+import sys
+import time
+
+
+# Fields of each reading
+Fields = { 'hv'     : ('voltage', 'current'),
+           'status' : ('setVoltage', 'setCurrent', 'voltage', 'current'),
+           'motor'  : ('step', 'position') };
+
+
+################################################################################
+#   Convert to number                                                          #
+################################################################################
+#   None if it is no number, e.g. the '' of a failed query.
+def Number(value):
+	try:
+		return float(value);
+	except (TypeError, ValueError):
+		return None;
+
+
+################################################################################
+#   Read from the serial port                                                  #
+################################################################################
+#   Returns the values or None.
+def ReadPort(kind, port):
+	from GEMSlowControlClasses import HVControl, MotorControl
+	if kind == 'motor':
+		Motor = MotorControl(port);
+		if not Motor.Connect()[0]:
+			return None;
+		ans = Motor.GetPosition();
+		return (ans[1], ans[2]) if ans[0] else None;
+	HV = HVControl(port);
+	if not HV.Connect():
+		return None;
+	if kind == 'status':
+		return HV.GetStatus();
+	return HV.GetMeasurement();
+
+
+################################################################################
+#   Read from a running server                                                 #
+################################################################################
+def ReadServer(kind, address, name):
+	from GEMSlowControlClient import SlowControlClient
+	client = SlowControlClient(address);
+	cmd = { 'hv' : 'GetMeasurement', 'status' : 'GetStatus', 'motor' : 'GetPosition' }[kind];
+	ans = client.Call(name, cmd);
+	client.Close();
+	if not ans[0]:
+		print(' Failed to read', name, '(', ans[1], ')', file=sys.stderr);
+		return None;
+	if kind == 'motor':
+		return tuple(ans[1][1:]) if ans[1][0] else None;
+	return tuple(ans[1]);
+
+
+################################################################################
+#   Format a reading                                                           #
+################################################################################
+def Format(form, timestamp, name, fields, values, header):
+	if form == 'json':
+		import json
+		record = { 'time' : timestamp, 'dev' : name };
+		record.update(zip(fields, values));
+		return json.dumps(record);
+	if form == 'csv':
+		line = ','.join(['%.3f' % timestamp, name] + ['' if value is None else repr(value) for value in values]);
+		if header:
+			return ','.join(('time', 'dev') + fields) + '\n' + line;
+		return line;
+	return ' '.join(['%.3f' % timestamp] + ['' if value is None else str(value) for value in values]);
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Read HV or motor once.');
+	parser.add_argument('device', choices=('hv', 'motor'), help='what to read');
+	parser.add_argument('-p', '--port', default='', help='serial port (default /dev/ttyUSB0 for hv, /dev/ttyACM1 for motor)');
+	parser.add_argument('-s', '--server', default='', help='ask the server at this address instead of the port');
+	parser.add_argument('-n', '--name', default='', help='device name on the server (default hv or motor)');
+	parser.add_argument('--status', action='store_true', help='hv settings too, not only measurement');
+	parser.add_argument('-f', '--format', choices=('text', 'json', 'csv'), default='text', help='output format');
+	parser.add_argument('--header', action='store_true', help='header line for csv');
+	args = parser.parse_args();
+
+	kind = 'status' if args.device == 'hv' and args.status else args.device;
+	name = args.name if args.name != '' else args.device;
+	timestamp = time.time();
+	if args.server != '':
+		values = ReadServer(kind, args.server, name);
+	else:
+		port = args.port if args.port != '' else { 'hv' : '/dev/ttyUSB0', 'motor' : '/dev/ttyACM1' }[args.device];
+		values = ReadPort(kind, port);
+	if values is None:
+		sys.exit(1);
+	values = tuple([Number(value) for value in values]);
+	if kind == 'motor':
+		values = (int(values[0]), values[1]);
+	print(Format(args.format, timestamp, name, Fields[kind], values, args.header));
+	if None in values:
+		sys.exit(1);
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to show a serial capture                                            #
+# Prints a summary per port of a capture (see GEMSlowControlCapture) with the  #
+# times from a write to the first byte of its answer, or with --dump every     #
+# record as 'time port kind bytes'.                                            #
+################################################################################
+
+
+from GEMSlowControlCapture import ReadCapture, Summarize, Open
+import argparse
+import datetime
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Show a serial capture.');
+	parser.add_argument('capture', help='capture file');
+	parser.add_argument('-d', '--dump', action='store_true', help='print every record');
+	args = parser.parse_args();
+
+	start, records = ReadCapture(args.capture);
+	print(' Captured from', datetime.datetime.fromtimestamp(start), 'for %.3f s' % (records[-1][2] if len(records) > 0 else 0.0));
+	if args.dump:
+		names = {};
+		for kind, channel, elapsed, data in records:
+			if kind == Open:
+				names[channel] = data.decode('utf-8');
+			print('%.6f %s %s %r' % (start + elapsed, names.get(channel, channel), chr(kind), data));
+	for name, (opens, writes, written, reads, read, empty, answers) in sorted(Summarize(args.capture).items()):
+		print(' %s: %d opens, %d writes (%d bytes), %d reads (%d bytes, %d empty)' % (name, opens, writes, written, reads, read, empty));
+		if len(answers) > 0:
+			answers = sorted(answers);
+			print('   answer after %.2f ms median, %.2f ms 99%%, %.2f ms max'
+			      % (answers[len(answers) // 2] * 1e3, answers[min(len(answers) - 1, int(len(answers) * 0.99))] * 1e3, answers[-1] * 1e3));
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+
+################################################################################
+#   Script to run the slow control server                                      #
+# Owns the serial ports of HV supplies and motor so that the menus, loggers    #
+# and DAQ can use them at the same time through GEMSlowControlClient.          #
+#                                                                              #
+#   ./SlowControlServer.py -c stack.cfg -m /dev/ttyACM1 --poll 1               #
+################################################################################
+
+
+from GEMSlowControlServer import SlowControlServer
+from GEMSlowControlManager import LoadConfig
+from GEMSlowControlClient import DefaultAddress
+import argparse
+import sys
+import time
+
+
+################################################################################
+#   Main function                                                              #
+################################################################################
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Serve HV supplies and motor over a socket.');
+	parser.add_argument('-p', '--port', default='', help='serial port of a single HV supply, named hv');
+	parser.add_argument('-c', '--config', default='', help='configuration of several HV supplies');
+	parser.add_argument('-m', '--motor', default='', help='serial port of the motor controller, named motor');
+	parser.add_argument('-a', '--address', action='append', help='Unix socket path or host:port, may be repeated (default %s)' % DefaultAddress);
+	parser.add_argument('--poll', type=float, default=1.0, help='seconds between background readings, 0 for none');
+	parser.add_argument('--stats', action='store_true', help='record command latency and errors, served by the Stats command');
+	args = parser.parse_args();
+
+	server = SlowControlServer();
+	if args.stats:
+		server.EnableStats();
+	if args.port != '':
+		server.AddHV('hv', args.port);
+	if args.config != '':
+		for name, port in LoadConfig(args.config):
+			server.AddHV(name, port);
+	if args.motor != '':
+		server.AddMotor('motor', args.motor);
+	if not server.Connect():
+		print(' Not all devices are connected.');
+		server.Shutdown();
+		sys.exit(1);
+	if args.poll > 0:
+		server.StartPolling(args.poll);
+	for address in (args.address or [DefaultAddress]):
+		server.Listen(address);
+	try:
+		while True:
+			time.sleep(1);
+	except KeyboardInterrupt:
+		pass;
+	server.Shutdown();
+	print(' Bye bye :)');